@@ -1,143 +1,74 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 from datetime import datetime
 import plotly.express as px
 import plotly.graph_objects as go
+import sqlite3
+from sqlite_store import get_connection, transaction, migrate
+import bulk_io
 
 # Configuration de la page gérée dans sun.py
 
-# Initialisation de la base de données
+# Initialisation de la base de données (schéma versionné, voir sqlite_store.MIGRATIONS)
 def init_db():
-    conn = sqlite3.connect('energie_solaire.db')
-    c = conn.cursor()
-    
-    # Table Produits
-    c.execute('''CREATE TABLE IF NOT EXISTS produits
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  nom TEXT NOT NULL,
-                  categorie TEXT,
-                  prix_achat REAL,
-                  prix_vente REAL,
-                  stock_actuel INTEGER,
-                  stock_min INTEGER,
-                  unite TEXT)''')
-    
-    # Table Clients
-    c.execute('''CREATE TABLE IF NOT EXISTS clients
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  nom TEXT NOT NULL,
-                  telephone TEXT,
-                  adresse TEXT,
-                  email TEXT)''')
-    
-    # Table Factures
-    c.execute('''CREATE TABLE IF NOT EXISTS factures
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  numero TEXT UNIQUE,
-                  date TEXT,
-                  client_id INTEGER,
-                  client_nom TEXT,
-                  montant_total REAL,
-                  type TEXT,
-                  statut TEXT)''')
-    
-    # Table Lignes de facture
-    c.execute('''CREATE TABLE IF NOT EXISTS lignes_facture
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  facture_id INTEGER,
-                  produit_nom TEXT,
-                  quantite INTEGER,
-                  prix_unitaire REAL,
-                  montant REAL)''')
-    
-    # Table Mouvements de stock
-    c.execute('''CREATE TABLE IF NOT EXISTS mouvements_stock
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  date TEXT,
-                  produit_id INTEGER,
-                  produit_nom TEXT,
-                  type TEXT,
-                  quantite INTEGER,
-                  reference TEXT)''')
-    
-    conn.commit()
-    conn.close()
+    migrate()
 
 # Fonctions pour les produits
 def ajouter_produit(nom, categorie, prix_achat, prix_vente, stock, stock_min, unite):
-    conn = sqlite3.connect('energie_solaire.db')
-    c = conn.cursor()
-    c.execute('''INSERT INTO produits (nom, categorie, prix_achat, prix_vente, stock_actuel, stock_min, unite)
-                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
-              (nom, categorie, prix_achat, prix_vente, stock, stock_min, unite))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('''INSERT INTO produits (nom, categorie, prix_achat, prix_vente, stock_actuel, stock_min, unite)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                     (nom, categorie, prix_achat, prix_vente, stock, stock_min, unite))
 
 def obtenir_produits():
-    conn = sqlite3.connect('energie_solaire.db')
-    df = pd.read_sql_query("SELECT * FROM produits ORDER BY nom", conn)
-    conn.close()
-    return df
+    return pd.read_sql_query("SELECT * FROM produits ORDER BY nom", get_connection())
 
 def modifier_produit(produit_id, nom, categorie, prix_achat, prix_vente, stock_actuel, stock_min, unite):
-    conn = sqlite3.connect('energie_solaire.db')
-    c = conn.cursor()
-    c.execute('''UPDATE produits SET nom=?, categorie=?, prix_achat=?, prix_vente=?, 
-                 stock_actuel=?, stock_min=?, unite=? WHERE id=?''',
-              (nom, categorie, prix_achat, prix_vente, stock_actuel, stock_min, unite, produit_id))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('''UPDATE produits SET nom=?, categorie=?, prix_achat=?, prix_vente=?, 
+                        stock_actuel=?, stock_min=?, unite=? WHERE id=?''',
+                     (nom, categorie, prix_achat, prix_vente, stock_actuel, stock_min, unite, produit_id))
 
 def obtenir_produit_par_id(produit_id):
-    conn = sqlite3.connect('energie_solaire.db')
-    c = conn.cursor()
-    c.execute("SELECT * FROM produits WHERE id=?", (produit_id,))
-    produit = c.fetchone()
-    conn.close()
-    return produit
+    return get_connection().execute("SELECT * FROM produits WHERE id=?", (produit_id,)).fetchone()
 
 def modifier_stock(produit_id, quantite, type_mouvement, reference=""):
-    conn = sqlite3.connect('energie_solaire.db')
-    c = conn.cursor()
-    
-    # Récupérer le produit
-    c.execute("SELECT nom, stock_actuel FROM produits WHERE id=?", (produit_id,))
-    produit = c.fetchone()
-    
-    if produit:
-        nouveau_stock = produit[1] + quantite if type_mouvement == "Entrée" else produit[1] - quantite
+    with transaction() as conn:
+        c = conn.cursor()
         
-        # Mettre à jour le stock
-        c.execute("UPDATE produits SET stock_actuel=? WHERE id=?", (nouveau_stock, produit_id))
+        # Récupérer le produit
+        c.execute("SELECT nom, stock_actuel FROM produits WHERE id=?", (produit_id,))
+        produit = c.fetchone()
         
-        # Enregistrer le mouvement
-        c.execute('''INSERT INTO mouvements_stock (date, produit_id, produit_nom, type, quantite, reference)
-                     VALUES (?, ?, ?, ?, ?, ?)''',
-                  (datetime.now().strftime("%Y-%m-%d %H:%M"), produit_id, produit[0], 
-                   type_mouvement, quantite, reference))
-        
-        conn.commit()
-    conn.close()
+        if produit:
+            nouveau_stock = produit[1] + quantite if type_mouvement == "Entrée" else produit[1] - quantite
+            
+            # Mettre à jour le stock
+            c.execute("UPDATE produits SET stock_actuel=? WHERE id=?", (nouveau_stock, produit_id))
+            
+            # Enregistrer le mouvement
+            c.execute('''INSERT INTO mouvements_stock (date, produit_id, produit_nom, type, quantite, reference)
+                         VALUES (?, ?, ?, ?, ?, ?)''',
+                      (datetime.now().strftime("%Y-%m-%d %H:%M"), produit_id, produit[0], 
+                       type_mouvement, quantite, reference))
 
 # Fonctions pour les clients
 def ajouter_client(nom, telephone, adresse, email):
-    conn = sqlite3.connect('energie_solaire.db')
-    c = conn.cursor()
-    c.execute('''INSERT INTO clients (nom, telephone, adresse, email)
-                 VALUES (?, ?, ?, ?)''', (nom, telephone, adresse, email))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute('''INSERT INTO clients (nom, telephone, adresse, email)
+                        VALUES (?, ?, ?, ?)''', (nom, telephone, adresse, email))
 
 def obtenir_clients():
-    conn = sqlite3.connect('energie_solaire.db')
-    df = pd.read_sql_query("SELECT * FROM clients ORDER BY nom", conn)
-    conn.close()
-    return df
+    return pd.read_sql_query("SELECT * FROM clients ORDER BY nom", get_connection())
 
 # Fonctions pour les factures
 def creer_facture(client_id, client_nom, lignes, type_doc="Facture"):
-    conn = sqlite3.connect('energie_solaire.db')
+    """Crée la facture, ses lignes, les décréments de stock et les mouvements
+    dans une seule transaction atomique."""
+    with transaction() as conn:
+        return _creer_facture(conn, client_id, client_nom, lignes, type_doc)
+
+def _creer_facture(conn, client_id, client_nom, lignes, type_doc):
     c = conn.cursor()
     
     # Générer numéro de facture
@@ -154,29 +85,92 @@ def creer_facture(client_id, client_nom, lignes, type_doc="Facture"):
     
     facture_id = c.lastrowid
     
-    # Ajouter les lignes
-    for ligne in lignes:
-        c.execute('''INSERT INTO lignes_facture (facture_id, produit_nom, quantite, prix_unitaire, montant)
+    # Ajouter toutes les lignes en une seule instruction préparée
+    c.executemany('''INSERT INTO lignes_facture (facture_id, produit_nom, quantite, prix_unitaire, montant)
                      VALUES (?, ?, ?, ?, ?)''',
-                  (facture_id, ligne['produit'], ligne['quantite'], 
-                   ligne['prix_unitaire'], ligne['montant']))
-        
-        # Mettre à jour le stock si c'est une facture
-        if type_doc == "Facture":
-            c.execute("SELECT id FROM produits WHERE nom=?", (ligne['produit'],))
-            produit = c.fetchone()
-            if produit:
-                modifier_stock(produit[0], ligne['quantite'], "Sortie", numero)
+                  [(facture_id, ligne['produit'], ligne['quantite'],
+                    ligne['prix_unitaire'], ligne['montant']) for ligne in lignes])
+    
+    # Mettre à jour le stock si c'est une facture (ensembliste, à partir des lignes insérées)
+    if type_doc == "Facture":
+        # Un mouvement de sortie par ligne dont le produit existe
+        c.execute('''INSERT INTO mouvements_stock (date, produit_id, produit_nom, type, quantite, reference)
+                     SELECT ?, p.id, p.nom, 'Sortie', l.quantite, ?
+                     FROM lignes_facture l JOIN produits p ON p.nom = l.produit_nom COLLATE NOCASE
+                     WHERE l.facture_id = ?
+                     ORDER BY l.id''',
+                  (date_now.strftime("%Y-%m-%d %H:%M"), numero, facture_id))
+        # Décrément unique par produit (quantités cumulées si le produit figure sur plusieurs lignes)
+        c.execute('''UPDATE produits
+                     SET stock_actuel = stock_actuel - (
+                         SELECT SUM(l.quantite) FROM lignes_facture l
+                         WHERE l.facture_id = ? AND l.produit_nom = produits.nom COLLATE NOCASE)
+                     WHERE nom COLLATE NOCASE IN (SELECT produit_nom FROM lignes_facture WHERE facture_id = ?)''',
+                  (facture_id, facture_id))
     
-    conn.commit()
-    conn.close()
     return numero
 
 def obtenir_factures():
-    conn = sqlite3.connect('energie_solaire.db')
-    df = pd.read_sql_query("SELECT * FROM factures ORDER BY date DESC", conn)
-    conn.close()
-    return df
+    return pd.read_sql_query("SELECT * FROM factures ORDER BY date DESC", get_connection())
+
+# Rapports : lectures des tables de synthèse et vues (sqlite_store, migration 5)
+def obtenir_kpis_mois(mois=None):
+    """Nombre de factures et CA du mois (AAAA-MM), lus dans la table de synthèse."""
+    mois = mois or datetime.now().strftime("%Y-%m")
+    row = get_connection().execute(
+        "SELECT nb_factures, chiffre_affaires FROM v_ca_mensuel WHERE mois=?", (mois,)).fetchone()
+    return (row[0], row[1]) if row else (0, 0.0)
+
+def obtenir_compteurs():
+    conn = get_connection()
+    nb_produits = conn.execute("SELECT COUNT(*) FROM produits").fetchone()[0]
+    nb_clients = conn.execute("SELECT COUNT(*) FROM clients").fetchone()[0]
+    return nb_produits, nb_clients
+
+def obtenir_alertes_stock():
+    return pd.read_sql_query(
+        "SELECT nom, stock_actuel, stock_min FROM produits WHERE stock_actuel <= stock_min ORDER BY nom",
+        get_connection())
+
+def obtenir_ca_mensuel():
+    return pd.read_sql_query("SELECT mois, nb_factures, chiffre_affaires FROM v_ca_mensuel ORDER BY mois",
+                             get_connection())
+
+def obtenir_ca_journalier(jours=7):
+    # Parcours de l'index factures(date) sur la période seulement
+    return pd.read_sql_query(
+        """SELECT date, SUM(montant_total) AS montant_total FROM factures
+           WHERE type = 'Facture' AND date >= date('now', ?) GROUP BY date ORDER BY date""",
+        get_connection(), params=(f"-{int(jours) - 1} days",))
+
+def obtenir_top_clients(n=10):
+    return pd.read_sql_query(
+        "SELECT client_nom, montant_total FROM resume_ventes_client ORDER BY montant_total DESC LIMIT ?",
+        get_connection(), params=(n,))
+
+def obtenir_top_produits(n=10):
+    return pd.read_sql_query(
+        "SELECT produit_nom, quantite, chiffre_affaires, marge FROM v_top_produits ORDER BY chiffre_affaires DESC LIMIT ?",
+        get_connection(), params=(n,))
+
+def obtenir_marge_categories():
+    return pd.read_sql_query(
+        "SELECT categorie, chiffre_affaires, cout, marge, taux_marge FROM v_marge_categorie ORDER BY chiffre_affaires DESC",
+        get_connection())
+
+def obtenir_rotation_stock():
+    return pd.read_sql_query(
+        "SELECT nom, categorie, stock_actuel, sorties_12m, stock_moyen, rotation FROM v_rotation_stock ORDER BY rotation DESC",
+        get_connection())
+
+def obtenir_valeur_stock(n=10):
+    """Valeur totale du stock (au prix d'achat) et les n produits de plus forte valeur."""
+    conn = get_connection()
+    total = conn.execute("SELECT COALESCE(SUM(stock_actuel * prix_achat), 0) FROM produits").fetchone()[0]
+    top = pd.read_sql_query(
+        """SELECT nom, stock_actuel * prix_achat AS valeur_stock FROM produits
+           ORDER BY valeur_stock DESC LIMIT ?""", conn, params=(n,))
+    return total, top
 
 # Interface principale
 def main():
@@ -198,30 +192,27 @@ def main():
         
         col1, col2, col3, col4 = st.columns(4)
         
-        produits_df = obtenir_produits()
-        factures_df = obtenir_factures()
-        clients_df = obtenir_clients()
+        nb_produits, nb_clients = obtenir_compteurs()
+        nb_factures_mois, ca_mois = obtenir_kpis_mois()
         
         with col1:
-            st.metric("Produits en stock", len(produits_df))
+            st.metric("Produits en stock", nb_produits)
         with col2:
-            st.metric("Clients", len(clients_df))
+            st.metric("Clients", nb_clients)
         with col3:
-            factures_mois = factures_df[factures_df['date'].str.startswith(datetime.now().strftime("%Y-%m"))]
-            st.metric("Factures ce mois", len(factures_mois))
+            st.metric("Factures ce mois", nb_factures_mois)
         with col4:
-            ca_mois = factures_mois[factures_mois['type'] == 'Facture']['montant_total'].sum()
             st.metric("CA ce mois", f"{ca_mois:,.0f} FCFA")
         
         st.markdown("---")
         
         # Alertes stock
         st.subheader("⚠️ Alertes Stock")
-        if not produits_df.empty:
-            alertes = produits_df[produits_df['stock_actuel'] <= produits_df['stock_min']]
+        if nb_produits:
+            alertes = obtenir_alertes_stock()
             if not alertes.empty:
                 st.warning(f"**{len(alertes)} produit(s) en rupture ou stock faible**")
-                st.dataframe(alertes[['nom', 'stock_actuel', 'stock_min']], use_container_width=True)
+                st.dataframe(alertes, use_container_width=True)
             else:
                 st.success("Tous les stocks sont à niveau ✓")
         
@@ -230,16 +221,15 @@ def main():
         
         with col1:
             st.subheader("Ventes par Catégorie")
-            if not produits_df.empty:
-                cat_counts = produits_df['categorie'].value_counts()
-                fig = px.pie(values=cat_counts.values, names=cat_counts.index)
+            ventes_cat = obtenir_marge_categories()
+            if not ventes_cat.empty:
+                fig = px.pie(ventes_cat, values='chiffre_affaires', names='categorie')
                 st.plotly_chart(fig, use_container_width=True)
         
         with col2:
             st.subheader("Évolution CA (7 derniers jours)")
-            if not factures_df.empty and len(factures_df) > 0:
-                factures_df['date'] = pd.to_datetime(factures_df['date'])
-                ventes_jour = factures_df.groupby('date')['montant_total'].sum().reset_index()
+            ventes_jour = obtenir_ca_journalier(7)
+            if not ventes_jour.empty:
                 fig = px.line(ventes_jour, x='date', y='montant_total')
                 st.plotly_chart(fig, use_container_width=True)
     
@@ -253,8 +243,30 @@ def main():
             produits_df = obtenir_produits()
             if not produits_df.empty:
                 st.dataframe(produits_df, use_container_width=True)
+                st.download_button("📤 Exporter (CSV)", bulk_io.export_csv([produits_df]),
+                                   file_name="produits.csv", mime="text/csv")
             else:
                 st.info("Aucun produit enregistré. Ajoutez votre premier produit!")
+            
+            with st.expander("📥 Importer une liste de produits (CSV / XLSX)"):
+                fichier = st.file_uploader("Fichier produits ou tarif fournisseur", type=['csv', 'xlsx', 'xls'])
+                if fichier is not None:
+                    colonnes = [""] + bulk_io.read_header(fichier)
+                    mapping = {}
+                    cols = st.columns(2)
+                    for i, champ in enumerate(bulk_io.PRODUCT_FIELDS):
+                        defaut = colonnes.index(champ) if champ in colonnes else 0
+                        with cols[i % 2]:
+                            mapping[champ] = st.selectbox(champ, colonnes, index=defaut, key=f"map_{champ}")
+                    maj = st.checkbox("Mettre à jour les produits existants (même nom)", value=True)
+                    if mapping['nom'] and st.button("Importer", type="primary"):
+                        nb, rapport = bulk_io.import_products_sqlite(fichier, mapping, update_existing=maj)
+                        st.success(f"✅ {nb} produit(s) importé(s) ou mis à jour")
+                        if not rapport.empty:
+                            st.warning(f"⚠️ {len(rapport)} ligne(s) rejetée(s)")
+                            st.dataframe(rapport, use_container_width=True)
+                            st.download_button("Rapport d'erreurs (CSV)", bulk_io.export_csv([rapport]),
+                                               file_name="rapport_import.csv", mime="text/csv")
         
         with tab2:
             with st.form("form_produit"):
@@ -277,9 +289,13 @@ def main():
                 
                 if submitted:
                     if nom:
-                        ajouter_produit(nom, categorie, prix_achat, prix_vente, stock, stock_min, unite)
-                        st.success(f"✅ Produit '{nom}' ajouté avec succès!")
-                        st.rerun()
+                        try:
+                            ajouter_produit(nom, categorie, prix_achat, prix_vente, stock, stock_min, unite)
+                        except sqlite3.IntegrityError:
+                            st.error(f"Un produit nommé '{nom}' existe déjà")
+                        else:
+                            st.success(f"✅ Produit '{nom}' ajouté avec succès!")
+                            st.rerun()
                     else:
                         st.error("Le nom du produit est obligatoire")
         
@@ -364,11 +380,15 @@ def main():
                             
                             if submitted_modif:
                                 if nom_modif:
-                                    modifier_produit(produit_info['id'], nom_modif, categorie_modif, 
-                                                   prix_achat_modif, prix_vente_modif, stock_modif, 
-                                                   stock_min_modif, unite_modif)
-                                    st.success(f"✅ Produit '{nom_modif}' modifié avec succès!")
-                                    st.rerun()
+                                    try:
+                                        modifier_produit(produit_info['id'], nom_modif, categorie_modif, 
+                                                       prix_achat_modif, prix_vente_modif, stock_modif, 
+                                                       stock_min_modif, unite_modif)
+                                    except sqlite3.IntegrityError:
+                                        st.error(f"Un autre produit est déjà nommé '{nom_modif}'")
+                                    else:
+                                        st.success(f"✅ Produit '{nom_modif}' modifié avec succès!")
+                                        st.rerun()
                                 else:
                                     st.error("Le nom du produit est obligatoire")
                     else:
@@ -548,10 +568,8 @@ def main():
                 st.warning("Aucun produit disponible. Ajoutez d'abord des produits.")
         
         with tab2:
-            conn = sqlite3.connect('energie_solaire.db')
             mouvements_df = pd.read_sql_query(
-                "SELECT * FROM mouvements_stock ORDER BY date DESC LIMIT 100", conn)
-            conn.close()
+                "SELECT * FROM mouvements_stock ORDER BY date DESC LIMIT 100", get_connection())
             
             if not mouvements_df.empty:
                 st.dataframe(mouvements_df, use_container_width=True)
@@ -562,33 +580,39 @@ def main():
     elif menu == "📈 Rapports":
         st.header("Rapports et Statistiques")
         
-        factures_df = obtenir_factures()
-        produits_df = obtenir_produits()
+        ca_mensuel = obtenir_ca_mensuel()
         
-        if not factures_df.empty:
+        if not ca_mensuel.empty:
             # CA par mois
             st.subheader("Chiffre d'Affaires par Mois")
-            factures_df['date'] = pd.to_datetime(factures_df['date'])
-            factures_df['mois'] = factures_df['date'].dt.to_period('M').astype(str)
-            ca_mois = factures_df[factures_df['type']=='Facture'].groupby('mois')['montant_total'].sum()
-            
-            fig = px.bar(x=ca_mois.index, y=ca_mois.values, 
-                        labels={'x': 'Mois', 'y': 'CA (FCFA)'})
+            fig = px.bar(ca_mensuel, x='mois', y='chiffre_affaires',
+                        labels={'mois': 'Mois', 'chiffre_affaires': 'CA (FCFA)'})
             st.plotly_chart(fig, use_container_width=True)
             
             # Top clients
             st.subheader("Top 10 Clients")
-            top_clients = factures_df[factures_df['type']=='Facture'].groupby('client_nom')['montant_total'].sum().sort_values(ascending=False).head(10)
-            st.bar_chart(top_clients)
+            st.bar_chart(obtenir_top_clients(10).set_index('client_nom')['montant_total'])
+            
+            # Top produits et marge par catégorie
+            col1, col2 = st.columns(2)
+            with col1:
+                st.subheader("Top 10 Produits")
+                st.dataframe(obtenir_top_produits(10), use_container_width=True)
+            with col2:
+                st.subheader("Marge par Catégorie")
+                st.dataframe(obtenir_marge_categories(), use_container_width=True)
+            
+            # Rotation du stock
+            st.subheader("Rotation du Stock (12 mois glissants)")
+            st.dataframe(obtenir_rotation_stock(), use_container_width=True)
             
             # Valeur du stock
             st.subheader("Valeur du Stock")
-            if not produits_df.empty:
-                produits_df['valeur_stock'] = produits_df['stock_actuel'] * produits_df['prix_achat']
-                valeur_totale = produits_df['valeur_stock'].sum()
+            valeur_totale, top_valeur = obtenir_valeur_stock(10)
+            if not top_valeur.empty:
                 st.metric("Valeur totale du stock", f"{valeur_totale:,.0f} FCFA")
                 
-                fig = px.bar(produits_df.nlargest(10, 'valeur_stock'), 
+                fig = px.bar(top_valeur, 
                            x='nom', y='valeur_stock',
                            title="Top 10 Produits par Valeur")
                 st.plotly_chart(fig, use_container_width=True)
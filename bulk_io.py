@@ -0,0 +1,477 @@
+"""
+Import / export en masse : produits, clients et mouvements de stock
+- Lecture en flux (CSV par blocs, XLSX en lecture seule) et validation vectorisée par bloc
+- Écriture par lots : executemany pour SQLite, batch Firestore (400 écritures par commit) ;
+  les mouvements passent un à un par le journal de stock (record_stock_movement)
+- Rapport d'erreurs ligne par ligne ; export CSV ou XLSX écrit au fil des pages dans un fichier
+"""
+
+import io
+import re
+import numpy as np
+import pandas as pd
+
+# Lignes lues et validées par bloc
+CHUNK_ROWS = 2000
+# Écritures par batch Firestore (limite Firestore : 500)
+FIRESTORE_BATCH = 400
+
+# Champ -> (type, obligatoire, valeur par défaut)
+PRODUCT_FIELDS = {
+    'nom': ('texte', True, None),
+    'categorie': ('texte', False, 'Autres'),
+    'prix_achat': ('nombre', False, 0.0),
+    'prix_vente': ('nombre', False, 0.0),
+    'stock_actuel': ('nombre', False, 0.0),
+    'stock_min': ('nombre', False, 0.0),
+    'unite': ('texte', False, 'pièce'),
+    'description': ('texte', False, ''),
+}
+CLIENT_FIELDS = {
+    'nom': ('texte', True, None),
+    'telephone': ('texte', False, ''),
+    'adresse': ('texte', False, ''),
+    'email': ('email', False, ''),
+}
+
+# quantite : signée pour un ajustement ; la date est celle de l'enregistrement dans le journal
+MOVEMENT_FIELDS = {
+    'produit': ('texte', True, None),
+    'type': ('texte', True, None),
+    'quantite': ('relatif', True, None),
+    'motif': ('texte', False, ''),
+    'reference': ('texte', False, ''),
+}
+MOVEMENT_TYPES = ('Entrée', 'Sortie', 'Ajustement')
+
+ERROR_COLUMNS = ['ligne', 'champ', 'valeur', 'erreur']
+
+_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+# --- Lecture en flux ---
+
+def _is_csv(name):
+    return str(name or '').lower().endswith(('.csv', '.txt'))
+
+
+def read_header(uploaded_file):
+    """Colonnes du fichier (pour le mappage), sans lire tout le contenu."""
+    uploaded_file.seek(0)
+    if _is_csv(getattr(uploaded_file, 'name', '')):
+        columns = list(pd.read_csv(uploaded_file, nrows=0, sep=None, engine='python').columns)
+    elif str(getattr(uploaded_file, 'name', '')).lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(uploaded_file, read_only=True, data_only=True)
+        try:
+            first = next(wb.active.iter_rows(max_row=1, values_only=True), ())
+            columns = [str(c) if c is not None else f"Colonne {i + 1}" for i, c in enumerate(first)]
+        finally:
+            wb.close()
+    else:
+        columns = list(pd.read_excel(uploaded_file, nrows=0).columns)
+    uploaded_file.seek(0)
+    return columns
+
+
+def iter_chunks(uploaded_file, chunksize=CHUNK_ROWS):
+    """Blocs de lignes (DataFrame) d'un fichier CSV / XLSX / XLS.
+    L'index de chaque bloc est le numéro de ligne dans le fichier (en-tête = ligne 1).
+    """
+    uploaded_file.seek(0)
+    name = str(getattr(uploaded_file, 'name', '')).lower()
+    if _is_csv(name):
+        reader = pd.read_csv(uploaded_file, chunksize=chunksize, sep=None, engine='python',
+                             dtype=str, keep_default_na=False)
+        start = 2
+        for chunk in reader:
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+    elif name.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(uploaded_file, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(c) if c is not None else f"Colonne {i + 1}" for i, c in enumerate(header)]
+            buffer, start = [], 2
+            for row in rows:
+                buffer.append(row[:len(columns)])
+                if len(buffer) >= chunksize:
+                    yield pd.DataFrame(buffer, columns=columns, index=pd.RangeIndex(start, start + len(buffer)))
+                    start += len(buffer)
+                    buffer = []
+            if buffer:
+                yield pd.DataFrame(buffer, columns=columns, index=pd.RangeIndex(start, start + len(buffer)))
+        finally:
+            wb.close()
+    else:
+        # .xls : pas de lecture en flux possible, découpage après lecture
+        df = pd.read_excel(uploaded_file)
+        df.index = pd.RangeIndex(2, 2 + len(df))
+        for i in range(0, len(df), chunksize):
+            yield df.iloc[i:i + chunksize]
+
+
+# --- Validation vectorisée ---
+
+def _blank(series):
+    return series.isna() | series.astype('string').str.strip().fillna('').eq('')
+
+
+def validate_chunk(chunk, mapping, fields):
+    """Applique le mappage {champ: colonne du fichier} et valide le bloc d'un coup.
+    Retourne (lignes valides normalisées, erreurs [ligne, champ, valeur, erreur]).
+    """
+    out = pd.DataFrame(index=chunk.index)
+    bad = pd.Series(False, index=chunk.index)
+    errors = []
+
+    def _report(mask, field, raw, message):
+        if mask.any():
+            errors.append(_error_rows(raw[mask], field, message))
+
+    for field, (kind, required, default) in fields.items():
+        column = mapping.get(field)
+        if not column or column not in chunk.columns:
+            if required:
+                raise ValueError(f"Colonne obligatoire non associée: {field}")
+            out[field] = default
+            continue
+        raw = chunk[column]
+        blank = _blank(raw)
+        if required:
+            _report(blank, field, raw, "valeur obligatoire manquante")
+            bad |= blank
+        if kind in ('nombre', 'entier', 'relatif'):
+            # Tolère les séparateurs de milliers et la virgule décimale ("1 250,50")
+            text = raw.astype('string').str.replace(r'\s', '', regex=True).str.replace(',', '.')
+            values = pd.to_numeric(text, errors='coerce')
+            invalid = values.isna() & ~blank
+            _report(invalid, field, raw, "nombre invalide")
+            negative = (values < 0).fillna(False) if kind != 'relatif' else pd.Series(False, index=chunk.index)
+            _report(negative, field, raw, "valeur négative")
+            bad |= invalid | negative
+            values = values.fillna(default)
+            out[field] = np.round(values).astype('int64') if kind == 'entier' else values.astype('float64')
+        else:
+            values = raw.astype('string').str.strip()
+            if kind == 'email':
+                invalid = ~blank & ~values.fillna('').str.match(_EMAIL)
+                _report(invalid, field, raw, "email invalide")
+                bad |= invalid
+            out[field] = values.where(~blank, default)
+    report = pd.concat(errors, ignore_index=True) if errors else pd.DataFrame(columns=ERROR_COLUMNS)
+    return out[~bad], report
+
+
+def _error_rows(values, field, message):
+    """Lignes du rapport d'erreurs pour les valeurs données (index = numéro de ligne du fichier)."""
+    return pd.DataFrame({
+        'ligne': values.index,
+        'champ': field,
+        'valeur': values.astype('string').fillna(''),
+        'erreur': message,
+    })
+
+
+def _dedupe(valid, key):
+    """Garde la dernière occurrence d'une clé dans le bloc ; les précédentes sont signalées.
+    D'un bloc à l'autre, l'occurrence la plus récente met à jour la précédente."""
+    dup = valid.duplicated(key, keep='last')
+    report = pd.DataFrame({
+        'ligne': valid.index[dup],
+        'champ': 'nom',
+        'valeur': valid.loc[dup, 'nom'].astype('string'),
+        'erreur': 'doublon dans le fichier (dernière occurrence retenue)',
+    })
+    return valid[~dup], report
+
+
+def _name_key(series):
+    return series.astype('string').str.strip().str.lower()
+
+
+# --- Écriture SQLite (tables de Stock.py) ---
+
+def import_products_sqlite(uploaded_file, mapping, update_existing=True, progress=None):
+    """Importe des produits dans SQLite (un executemany par bloc, une transaction par bloc).
+    Les doublons de nom (sans distinction de casse, comme l'index unique sur produits.nom)
+    mettent à jour le produit existant.
+    Retourne (nombre importé, rapport d'erreurs).
+    """
+    from sqlite_store import transaction, migrate
+
+    migrate()
+    conflict = ("ON CONFLICT(nom COLLATE NOCASE) DO UPDATE SET categorie=excluded.categorie, prix_achat=excluded.prix_achat, "
+                "prix_vente=excluded.prix_vente, stock_actuel=excluded.stock_actuel, "
+                "stock_min=excluded.stock_min, unite=excluded.unite") if update_existing \
+        else "ON CONFLICT(nom COLLATE NOCASE) DO NOTHING"
+    sql = ("INSERT INTO produits (nom, categorie, prix_achat, prix_vente, stock_actuel, stock_min, unite) "
+           f"VALUES (?, ?, ?, ?, ?, ?, ?) {conflict}")
+    total, reports = 0, []
+    for chunk in iter_chunks(uploaded_file):
+        valid, report = validate_chunk(chunk, mapping, PRODUCT_FIELDS)
+        valid = valid.assign(_cle=_name_key(valid['nom']))
+        valid, dup_report = _dedupe(valid, '_cle')
+        reports += [report, dup_report]
+        rows = valid[['nom', 'categorie', 'prix_achat', 'prix_vente', 'stock_actuel', 'stock_min', 'unite']]
+        with transaction() as conn:
+            conn.executemany(sql, rows.astype(object).itertuples(index=False, name=None))
+        total += len(rows)
+        if progress:
+            progress(int(chunk.index[-1]))
+    return total, _concat_reports(reports)
+
+
+def import_clients_sqlite(uploaded_file, mapping, progress=None):
+    from sqlite_store import transaction, migrate
+
+    migrate()
+    total, reports = 0, []
+    for chunk in iter_chunks(uploaded_file):
+        valid, report = validate_chunk(chunk, mapping, CLIENT_FIELDS)
+        valid = valid.assign(_cle=_name_key(valid['nom']) + '|' + valid['telephone'].astype('string').fillna(''))
+        valid, dup_report = _dedupe(valid, '_cle')
+        reports += [report, dup_report]
+        rows = valid[['nom', 'telephone', 'adresse', 'email']]
+        with transaction() as conn:
+            conn.executemany("INSERT INTO clients (nom, telephone, adresse, email) VALUES (?, ?, ?, ?)",
+                             rows.astype(object).itertuples(index=False, name=None))
+        total += len(rows)
+        if progress:
+            progress(int(chunk.index[-1]))
+    return total, _concat_reports(reports)
+
+
+# --- Écriture Firestore ---
+
+def _commit_batches(db, collection, writes, source):
+    """writes : [(doc_id, données, créer?)] écrits par batch de FIRESTORE_BATCH.
+    Les documents écrits sont relus puis copiés dans la réplique locale (mode hors ligne) :
+    une mise à jour n'envoie qu'une partie des champs (sans stock_actuel), la réplique doit
+    recevoir le document complet et sa version updated_at."""
+    from firebase_admin import firestore
+    import offline_store
+
+    written = {}
+    for i in range(0, len(writes), FIRESTORE_BATCH):
+        part = writes[i:i + FIRESTORE_BATCH]
+        batch = db.batch()
+        for doc_id, data, create in part:
+            ref = db.collection(collection).document(doc_id)
+            stamped = {**data, 'updated_at': firestore.SERVER_TIMESTAMP, 'source': source}
+            if create:
+                batch.set(ref, {**stamped, 'created_at': firestore.SERVER_TIMESTAMP})
+            else:
+                batch.set(ref, stamped, merge=True)
+        batch.commit()
+        refs = [db.collection(collection).document(doc_id) for doc_id, _, _ in part]
+        written.update({snap.id: snap.to_dict() for snap in db.get_all(refs) if snap.exists})
+    offline_store.replicate(collection, written)
+
+
+def _import_firestore(uploaded_file, mapping, fields, collection, existing, key_of, to_doc,
+                      update_existing, source, progress):
+    import offline_store
+    from firebase_config import init_firebase_admin, log_change
+
+    if offline_store.is_offline():
+        raise ConnectionError("Import en masse indisponible hors ligne")
+    db = init_firebase_admin()
+    if db is None:
+        raise ConnectionError("Firestore indisponible")
+    total, created, reports = 0, 0, []
+    for chunk in iter_chunks(uploaded_file):
+        valid, report = validate_chunk(chunk, mapping, fields)
+        valid = valid.assign(_cle=key_of(valid))
+        valid, dup_report = _dedupe(valid, '_cle')
+        reports += [report, dup_report]
+        writes = []
+        for row in valid.to_dict('records'):
+            cle = row.pop('_cle')
+            doc_id = existing.get(cle)
+            if doc_id is not None and not update_existing:
+                continue
+            if doc_id is None:
+                doc_id = db.collection(collection).document().id
+                existing[cle] = doc_id
+                writes.append((doc_id, to_doc(row), True))
+                created += 1
+            else:
+                writes.append((doc_id, to_doc(row), False))
+        _commit_batches(db, collection, writes, source)
+        total += len(writes)
+        if progress:
+            progress(int(chunk.index[-1]))
+    error_report = _concat_reports(reports)
+    try:
+        log_change(
+            event_type=f'{collection}.bulk_import',
+            description=f'Import en masse: {total} document(s), dont {created} création(s), {len(error_report)} erreur(s)',
+            metadata={'collection': collection, 'source': source}
+        )
+    except Exception:
+        pass
+    return total, error_report
+
+
+def import_products_firestore(uploaded_file, mapping, update_existing=True, progress=None,
+                              source='import_fichier'):
+    """Importe des produits dans Firestore par batch ; un nom existant met à jour le produit.
+    Le stock n'est écrit qu'à la création (ensuite, il évolue par mouvements du journal).
+    Retourne (nombre importé, rapport d'erreurs)."""
+    from firebase_config import get_all_products_from_firebase, clear_stock_cache
+
+    existing = {str(p.get('nom', '')).strip().lower(): pid
+                for pid, p in (get_all_products_from_firebase() or {}).items()}
+    known = set(existing.values())
+
+    def _to_doc(row):
+        doc = {k: (v.item() if hasattr(v, 'item') else v) for k, v in row.items()}
+        doc['stock_minimum'] = doc.pop('stock_min')
+        if existing.get(str(doc['nom']).strip().lower()) in known:
+            doc.pop('stock_actuel')
+        return doc
+
+    try:
+        return _import_firestore(uploaded_file, mapping, PRODUCT_FIELDS, 'stock_products', existing,
+                                 lambda df: _name_key(df['nom']), _to_doc, update_existing, source, progress)
+    finally:
+        clear_stock_cache()
+
+
+def import_clients_firestore(uploaded_file, mapping, update_existing=True, progress=None,
+                             source='import_fichier'):
+    from firebase_config import get_all_clients_from_firebase, clear_stock_cache
+
+    existing = {f"{str(c.get('nom', '')).strip().lower()}|{c.get('telephone', '') or ''}": c['id']
+                for c in (get_all_clients_from_firebase() or [])}
+    try:
+        return _import_firestore(
+            uploaded_file, mapping, CLIENT_FIELDS, 'stock_clients', existing,
+            lambda df: _name_key(df['nom']) + '|' + df['telephone'].astype('string').fillna(''),
+            dict, update_existing, source, progress)
+    finally:
+        clear_stock_cache()
+
+
+def _movement_type(series):
+    """Type de mouvement normalisé (MOVEMENT_TYPES), <NA> si non reconnu."""
+    t = series.astype('string').str.strip().str.lower()
+    return pd.Series(np.select([t.str.startswith('entr').fillna(False), t.str.startswith('sort').fillna(False),
+                                t.str.startswith('ajust').fillna(False) | t.str.startswith('invent').fillna(False)],
+                               MOVEMENT_TYPES, default=''), index=series.index).replace('', pd.NA)
+
+
+def import_movements(uploaded_file, mapping, allow_negative=False, progress=None):
+    """Importe des mouvements de stock : chaque ligne est enregistrée par le journal
+    (record_stock_movement), qui met à jour stock_actuel et les instantanés dans sa transaction
+    (ou place le mouvement dans l'outbox hors ligne). Le produit est retrouvé par son nom,
+    sans distinction de casse. Retourne (nombre enregistré, rapport d'erreurs).
+    """
+    from firebase_config import get_all_products_from_firebase, record_stock_movement, clear_stock_cache
+
+    products = {str(p.get('nom', '')).strip().lower(): pid
+                for pid, p in (get_all_products_from_firebase() or {}).items()}
+    total, reports = 0, []
+    try:
+        for chunk in iter_chunks(uploaded_file):
+            valid, report = validate_chunk(chunk, mapping, MOVEMENT_FIELDS)
+            reports.append(report)
+            types = _movement_type(valid['type'])
+            product_ids = _name_key(valid['produit']).map(products)
+            checks = [(types.isna(), 'type', valid['type'], "type inconnu (Entrée, Sortie ou Ajustement)"),
+                      (product_ids.isna(), 'produit', valid['produit'], "produit inconnu"),
+                      (valid['quantite'] == 0, 'quantite', valid['quantite'], "quantité nulle")]
+            bad = pd.Series(False, index=valid.index)
+            for mask, field, values, message in checks:
+                mask = mask.fillna(True) & ~bad
+                if mask.any():
+                    reports.append(_error_rows(values[mask], field, message))
+                bad |= mask
+            for ligne, row in valid[~bad].iterrows():
+                movement = record_stock_movement(product_ids[ligne], types[ligne], float(row['quantite']),
+                                                 motif=row['motif'] or 'Import fichier', reference=row['reference'],
+                                                 allow_negative=allow_negative)
+                if movement is None:
+                    reports.append(_error_rows(pd.Series([row['produit']], index=[ligne]), 'produit',
+                                               "mouvement refusé (stock insuffisant ou écriture impossible)"))
+                else:
+                    total += 1
+            if progress:
+                progress(int(chunk.index[-1]))
+    finally:
+        clear_stock_cache()
+    return total, _concat_reports(reports)
+
+
+def _concat_reports(reports):
+    reports = [r for r in reports if not r.empty]
+    if not reports:
+        return pd.DataFrame(columns=ERROR_COLUMNS)
+    return pd.concat(reports, ignore_index=True).sort_values('ligne', kind='stable').reset_index(drop=True)
+
+
+# --- Export ---
+
+def iter_csv(frames):
+    """Blocs d'octets CSV (UTF-8 avec BOM, lisible par Excel), un par DataFrame produit :
+    l'export n'est jamais assemblé en entier en mémoire."""
+    yield '\ufeff'.encode('utf-8')
+    header = True
+    for df in frames:
+        yield df.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+
+
+def export_csv(frames, path=None):
+    """Écrit le CSV bloc par bloc dans `path` et retourne le chemin ; sans chemin, retourne
+    les octets (petits contenus : rapports d'erreurs)."""
+    if path is None:
+        return b''.join(iter_csv(frames))
+    with open(path, 'wb') as f:
+        for block in iter_csv(frames):
+            f.write(block)
+    return path
+
+
+def export_xlsx(frames, sheet_name='Export', path=None):
+    """Écrit des DataFrames successifs dans une feuille XLSX en mode écriture seule (openpyxl,
+    lignes vidées sur disque au fil de l'eau). Retourne `path`, ou les octets sans chemin."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name[:31])
+    header = True
+    for df in frames:
+        if header:
+            ws.append([str(c) for c in df.columns])
+            header = False
+        for row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+            ws.append([v.isoformat() if hasattr(v, 'isoformat') else v for v in row])
+    if path is not None:
+        wb.save(path)
+        return path
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def iter_movement_pages(page_size=1000, **filters):
+    """Pages successives du journal des mouvements (pagination par curseur (date, id)),
+    lues sans cache : seule la page courante est gardée en mémoire."""
+    from firebase_config import fetch_stock_movements
+
+    cursor = None
+    while True:
+        page = fetch_stock_movements(limit=page_size, start_after=cursor, **filters)
+        if page.empty:
+            return
+        yield page.assign(date=page['date'].dt.tz_localize(None))
+        if len(page) < page_size:
+            return
+        cursor = (page['date'].iloc[-1], page['id'].iloc[-1])
@@ -0,0 +1,128 @@
+"""
+Cache disque adressé par contenu pour les documents générés (PDF, DOCX)
+- un fichier par empreinte : <clé>.<extension>
+- l'heure de modification sert d'horodatage d'accès (LRU)
+- éviction des fichiers les moins récemment utilisés au-delà d'une taille totale ; la taille est
+  tenue à jour en mémoire à chaque écriture, le répertoire n'est parcouru qu'au premier accès et
+  lors d'une éviction (les écritures des autres processus sont alors recomptées)
+Écritures atomiques : plusieurs processus (export groupé) peuvent partager le répertoire.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+CACHE_DIR = os.environ.get("ENERGIE_SOLAIRE_DOC_CACHE", os.path.join(".cache", "documents"))
+MAX_BYTES = int(os.environ.get("ENERGIE_SOLAIRE_DOC_CACHE_MB", "200")) * 1024 * 1024
+
+_lock = threading.Lock()
+# Taille totale estimée par répertoire de cache (octets)
+_sizes = {}
+
+
+def content_key(payload, *parts):
+    """Empreinte SHA-256 d'un contenu sérialisable et de discriminants (format, version de gabarit...)."""
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    h = hashlib.sha256(data.encode("utf-8"))
+    for part in parts:
+        h.update(b"\0" + str(part).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _path(key, ext, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, f"{key}.{ext}")
+
+
+def get(key, ext, cache_dir=None):
+    """Octets en cache pour cette clé, ou None. Un accès rafraîchit la position LRU."""
+    path = _path(key, ext, cache_dir)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)
+        return data
+    except FileNotFoundError:
+        return None
+    except OSError:
+        return None
+
+
+def _scan(cache_dir):
+    """[(mtime, taille, chemin)] des documents du répertoire (fichiers temporaires exclus)."""
+    entries = []
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+    return entries
+
+
+def put(key, ext, data, cache_dir=None, max_bytes=None):
+    """Enregistre des octets sous cette clé ; évince seulement si la taille totale dépasse la limite."""
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    path = _path(key, ext, cache_dir)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        # Cache indisponible (disque plein, lecture seule) : le document reste servi
+        return False
+    with _lock:
+        total = _sizes.get(cache_dir)
+        if total is None:
+            try:
+                total = sum(size for _, size, _ in _scan(cache_dir))
+            except OSError:
+                total = len(data)
+        else:
+            total += len(data) - previous
+        _sizes[cache_dir] = total
+    if total > max_bytes:
+        evict(cache_dir, max_bytes)
+    return True
+
+
+def evict(cache_dir=None, max_bytes=None):
+    """Supprime les documents les moins récemment utilisés jusqu'à repasser sous max_bytes."""
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    with _lock:
+        try:
+            entries = _scan(cache_dir)
+        except OSError:
+            return 0
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # déjà évincé par un autre processus
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        _sizes[cache_dir] = total
+        return removed
+
+
+def get_or_render(key, ext, render, cache_dir=None):
+    """Document en cache, sinon rendu par render() puis mis en cache."""
+    data = get(key, ext, cache_dir)
+    if data is None:
+        data = render()
+        put(key, ext, data, cache_dir)
+    return data
@@ -0,0 +1,159 @@
+"""
+Gabarits de documents compilés une fois par processus (PDF reportlab, DOCX python-docx)
+- styles de paragraphe, styles de tableau, en-tête / pied de page, bloc entreprise et logo
+- le rendu d'un document ne fait plus que remplir les données propres à la facture
+Sans dépendance Streamlit ; reportlab et python-docx ne sont importés qu'à la première compilation.
+"""
+
+import io
+from functools import lru_cache
+
+import logo_assets
+
+ENTREPRISE_NOM = "Energie Solaire Sénégal"
+
+CONTACT_ENTREPRISE = [
+    ("Entreprise", ENTREPRISE_NOM),
+    ("Adresse", "Castor 221 Dakar, Sénégal (En face du terrain de Football)"),
+    ("Email", "energiesolairesenegal@gmail.com"),
+    ("Téléphones", "+221 77 631 42 25 / +221 78 177 39 26"),
+    ("Site web", "energiesolairesenegal.com"),
+]
+
+# Ligne de pied de page commune à tous les documents
+PIED_DE_PAGE = " • ".join(v for k, v in CONTACT_ENTREPRISE if k in ("Adresse", "Téléphones", "Site web"))
+
+
+class PdfInvoiceTemplate:
+    """Gabarit PDF de facture : objets reportlab partagés entre tous les rendus du processus."""
+
+    def __init__(self):
+        from reportlab.lib import colors
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import inch
+        from reportlab.platypus import TableStyle
+
+        self.pagesize = A4
+        self.margins = dict(rightMargin=72, leftMargin=72, topMargin=72, bottomMargin=54)
+
+        styles = getSampleStyleSheet()
+        styles.add(ParagraphStyle(
+            name='CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=18,
+            spaceAfter=30,
+            textColor=colors.darkblue,
+            alignment=1  # Center
+        ))
+        styles.add(ParagraphStyle(
+            name='CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=12,
+            spaceAfter=12,
+            textColor=colors.darkblue
+        ))
+        self.styles = styles
+
+        self.info_col_widths = [1*inch, 2*inch, 1*inch, 1.5*inch]
+        self.info_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ])
+
+        self.lines_col_widths = [3*inch, 0.8*inch, 1.2*inch, 1.2*inch]
+        self.lines_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -4), colors.beige),
+            ('BACKGROUND', (0, -3), (-1, -1), colors.lightgrey),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ])
+
+        self._header_color = colors.darkblue
+        self._footer_color = colors.grey
+
+        # Logo pré-rastérisé, décodé une fois et réutilisé par tous les rendus
+        from reportlab.lib.utils import ImageReader
+        png = logo_assets.logo_png(logo_assets.LOGO_HEADER)
+        self.logo = ImageReader(io.BytesIO(png)) if png else None
+        self.logo_size = logo_assets.logo_dimensions(1.6*inch) if png else None
+
+    def draw_first_page(self, canvas, doc):
+        """Bloc entreprise en en-tête de la première page, puis pied de page."""
+        width, height = self.pagesize
+        canvas.saveState()
+        canvas.setFillColor(self._header_color)
+        canvas.setFont('Helvetica-Bold', 12)
+        canvas.drawString(doc.leftMargin, height - 40, ENTREPRISE_NOM.upper())
+        canvas.setFont('Helvetica', 8)
+        canvas.drawString(doc.leftMargin, height - 52, CONTACT_ENTREPRISE[1][1])
+        canvas.drawString(doc.leftMargin, height - 62, f"{CONTACT_ENTREPRISE[2][1]} • {CONTACT_ENTREPRISE[3][1]}")
+        if self.logo is not None:
+            logo_w, logo_h = self.logo_size
+            canvas.drawImage(self.logo, width - doc.rightMargin - logo_w, height - 18 - logo_h,
+                             logo_w, logo_h, mask='auto')
+        canvas.restoreState()
+        self.draw_later_pages(canvas, doc)
+
+    def draw_later_pages(self, canvas, doc):
+        """Pied de page : coordonnées et numéro de page."""
+        width, _ = self.pagesize
+        canvas.saveState()
+        canvas.setFillColor(self._footer_color)
+        canvas.setFont('Helvetica', 7)
+        canvas.drawCentredString(width / 2, 30, PIED_DE_PAGE)
+        canvas.drawRightString(width - doc.rightMargin, 18, f"Page {doc.page}")
+        canvas.restoreState()
+
+
+@lru_cache(maxsize=None)
+def pdf_invoice_template():
+    """Gabarit PDF de facture, compilé au premier appel dans chaque processus."""
+    return PdfInvoiceTemplate()
+
+
+@lru_cache(maxsize=None)
+def _docx_invoice_base():
+    """Document Word de base sérialisé : polices, en-tête (logo, bloc entreprise) et pied de page."""
+    from docx import Document
+    from docx.shared import Inches, Pt
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    doc = Document()
+    doc.styles['Normal'].font.name = 'Calibri'
+    doc.styles['Normal'].font.size = Pt(10)
+
+    section = doc.sections[0]
+    header = section.header.paragraphs[0]
+    png = logo_assets.logo_png(logo_assets.LOGO_HEADER)
+    if png:
+        header.add_run().add_picture(io.BytesIO(png), width=Inches(1.4))
+        header.add_run("\n")
+    run = header.add_run(ENTREPRISE_NOM.upper())
+    run.bold = True
+    run.font.size = Pt(12)
+    header.add_run(f"\n{CONTACT_ENTREPRISE[1][1]}\n{CONTACT_ENTREPRISE[2][1]} • {CONTACT_ENTREPRISE[3][1]}").font.size = Pt(8)
+
+    footer = section.footer.paragraphs[0]
+    footer.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    footer.add_run(PIED_DE_PAGE).font.size = Pt(7)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def new_docx_invoice():
+    """Nouveau document Word issu du gabarit compilé, prêt à recevoir le corps de la facture."""
+    from docx import Document
+    return Document(io.BytesIO(_docx_invoice_base()))
@@ -2,7 +2,9 @@ import firebase_admin
 from firebase_admin import credentials, firestore, auth
 import pyrebase
 import streamlit as st
+import pandas as pd
 import json
+import offline_store
 
 # Initialisation Firebase Admin SDK
 @st.cache_resource
@@ -41,6 +43,39 @@ def init_pyrebase():
         st.error(f"Erreur d'initialisation Pyrebase: {e}")
         return None
 
+# --- Mode hors ligne (voir offline_store) ---
+def _read_with_replica(collection, fetch, complete=True):
+    """Lit Firestore via fetch() -> {doc_id: données} et alimente la réplique locale.
+    Hors ligne ou en cas de coupure, retourne les documents de la réplique.
+    """
+    if not offline_store.is_offline():
+        try:
+            docs = fetch()
+            if docs is not None:
+                offline_store.mark_online()
+                offline_store.replicate(collection, docs, complete=complete)
+                return docs
+        except Exception as e:
+            if not offline_store.is_connectivity_error(e):
+                raise
+            offline_store.mark_offline(e)
+    return offline_store.read_collection(collection)
+
+def _write_or_queue(online, offline):
+    """Exécute l'écriture Firestore online() ; hors ligne ou en cas de coupure,
+    exécute offline() (réplique locale + outbox, rejouée à la reconnexion).
+    """
+    if not offline_store.is_offline():
+        try:
+            result = online()
+            offline_store.mark_online()
+            return result
+        except Exception as e:
+            if not offline_store.is_connectivity_error(e):
+                raise
+            offline_store.mark_offline(e)
+    return offline()
+
 # Fonctions d'authentification
 def login_user(email, password):
     """Connecte un utilisateur avec email/mot de passe"""
@@ -116,7 +151,7 @@ def is_admin_email(email: str) -> bool:
 
 def save_quote_to_firebase(quote_data):
     """Sauvegarde un devis dans Firestore"""
-    try:
+    def _online():
         db = init_firebase_admin()
         if db:
             doc_ref = db.collection('devis').add(quote_data)
@@ -138,6 +173,8 @@ def save_quote_to_firebase(quote_data):
             except Exception:
                 pass
             return new_id
+    try:
+        return _write_or_queue(_online, lambda: offline_store.create_local('devis', quote_data))
     except Exception as e:
         st.error(f"Erreur sauvegarde devis: {e}")
         return None
@@ -145,11 +182,13 @@ def save_quote_to_firebase(quote_data):
 @st.cache_data(ttl=120)
 def get_all_quotes():
     """Récupère tous les devis depuis Firestore"""
-    try:
+    def fetch():
         db = init_firebase_admin()
         if db:
-            quotes = db.collection('devis').stream()
-            return [{'id': doc.id, **doc.to_dict()} for doc in quotes]
+            return {doc.id: doc.to_dict() for doc in db.collection('devis').stream()}
+    try:
+        quotes = _read_with_replica('devis', fetch)
+        return [{'id': doc_id, **data} for doc_id, data in quotes.items()]
     except Exception as e:
         st.error(f"Erreur récupération devis: {e}")
         return []
@@ -186,12 +225,13 @@ def save_equipment_prices(prices_data):
 @st.cache_data(ttl=3600)
 def get_equipment_prices():
     """Récupère les prix des équipements depuis Firestore"""
-    try:
+    def fetch():
         db = init_firebase_admin()
         if db:
             doc = db.collection('config').document('equipment_prices').get()
-            if doc.exists:
-                return doc.to_dict()
+            return {doc.id: doc.to_dict()} if doc.exists else {}
+    try:
+        return _read_with_replica('config', fetch, complete=False).get('equipment_prices')
     except Exception as e:
         st.error(f"Erreur récupération prix: {e}")
     return None
@@ -402,12 +442,13 @@ def save_labor_percentages(percentages_data):
 @st.cache_data(ttl=3600)
 def get_labor_percentages():
     """Récupère les pourcentages de main d'œuvre depuis Firestore"""
-    try:
+    def fetch():
         db = init_firebase_admin()
         if db:
             doc = db.collection('config').document('labor_percentages').get()
-            if doc.exists:
-                return doc.to_dict()
+            return {doc.id: doc.to_dict()} if doc.exists else {}
+    try:
+        return _read_with_replica('config', fetch, complete=False).get('labor_percentages')
     except Exception as e:
         st.error(f"Erreur récupération pourcentages main d'œuvre: {e}")
     return None
@@ -449,12 +490,13 @@ def save_accessories_rate(rate_data):
 @st.cache_data(ttl=3600)
 def get_accessories_rate():
     """Récupère le taux d'accessoires depuis Firestore"""
-    try:
+    def fetch():
         db = init_firebase_admin()
         if db:
             doc = db.collection('config').document('accessories_rate').get()
-            if doc.exists:
-                return doc.to_dict()
+            return {doc.id: doc.to_dict()} if doc.exists else {}
+    try:
+        return _read_with_replica('config', fetch, complete=False).get('accessories_rate')
     except Exception as e:
         st.error(f"Erreur récupération taux accessoires: {e}")
     return None
@@ -565,6 +607,11 @@ def log_change(event_type: str, item_id: str | None = None, description: str | N
             'user_email': user_email or st.session_state.get('user_email'),
             'timestamp': firestore.SERVER_TIMESTAMP,
         }
+        if offline_store.is_offline():
+            # Hors ligne : horodatage local, évènement rejoué avec l'outbox
+            offline_store.create_local('change_logs', {**doc, 'timestamp': offline_store.now_iso()},
+                                       replicate=False)
+            return True
         db.collection('change_logs').add(doc)
         return True
     except Exception as e:
@@ -609,20 +656,20 @@ def get_change_history(limit: int = 100, event_type: str | None = None, user_ema
 
 def save_product_to_firebase(product_data):
     """Sauvegarde un produit dans Firestore"""
-    try:
+    def _online():
         db = init_firebase_admin()
         if db:
             # Ajouter timestamp de création
             product_data['created_at'] = firestore.SERVER_TIMESTAMP
             product_data['updated_at'] = firestore.SERVER_TIMESTAMP
-            
+        
             doc_ref = db.collection('stock_products').add(product_data)
             new_id = None
             try:
                 new_id = doc_ref[1].id
             except Exception:
                 pass
-            
+        
             # Journaliser la création
             try:
                 log_change(
@@ -636,6 +683,8 @@ def save_product_to_firebase(product_data):
             except Exception:
                 pass
             return new_id
+    try:
+        return _write_or_queue(_online, lambda: offline_store.create_local('stock_products', product_data))
     except Exception as e:
         st.error(f"Erreur sauvegarde produit: {e}")
         return None
@@ -643,33 +692,91 @@ def save_product_to_firebase(product_data):
 @st.cache_data(ttl=300)  # Cache pendant 5 minutes
 def get_all_products_from_firebase():
     """Récupère tous les produits depuis Firestore"""
-    try:
+    def fetch():
         db = init_firebase_admin()
         if db:
-            products = db.collection('stock_products').stream()
-            return {doc.id: doc.to_dict() for doc in products}
+            return {doc.id: doc.to_dict() for doc in db.collection('stock_products').stream()}
+    try:
+        return _read_with_replica('stock_products', fetch)
     except Exception as e:
         st.error(f"Erreur récupération produits: {e}")
         return {}
 
+# Colonnes normalisées et typées du DataFrame produits partagé
+PRODUCT_COLUMNS = {
+    'id': 'string',
+    'nom': 'string',
+    'categorie': 'string',
+    'prix_achat': 'float64',
+    'prix_vente': 'float64',
+    # Quantités décimales possibles (mètres de câble, fractions) : pas de troncature entière
+    'stock_actuel': 'float64',
+    'stock_min': 'float64',
+    'unite': 'string',
+}
+
+# Version des données de stock : incrémentée à chaque clear_stock_cache()
+_stock_data_version = 0
+
+def get_stock_data_version():
+    """Version courante des données de stock (clé des caches dérivés)."""
+    return _stock_data_version
+
+def _first_present(product, *keys, default=None):
+    for key in keys:
+        val = product.get(key)
+        if val is not None:
+            return val
+    return default
+
+@st.cache_resource(ttl=300, max_entries=2)
+def _load_products_frame(version):
+    """Construit le DataFrame produits pour une version de données (objet partagé, non copié)."""
+    products = get_all_products_from_firebase() or {}
+    df = pd.DataFrame({
+        'id': list(products.keys()),
+        'nom': [p.get('nom', '') for p in products.values()],
+        'categorie': [p.get('categorie', '') for p in products.values()],
+        'prix_achat': [p.get('prix_achat', 0) for p in products.values()],
+        'prix_vente': [p.get('prix_vente', 0) for p in products.values()],
+        # Alias historiques repliés dans une seule colonne
+        'stock_actuel': [_first_present(p, 'stock_actuel', 'quantite', default=0) for p in products.values()],
+        'stock_min': [_first_present(p, 'stock_minimum', 'stock_min', default=0) for p in products.values()],
+        'unite': [p.get('unite', 'pièce') for p in products.values()],
+    })
+    for name in ('prix_achat', 'prix_vente', 'stock_actuel', 'stock_min'):
+        df[name] = pd.to_numeric(df[name], errors='coerce').fillna(0)
+    return df.astype(PRODUCT_COLUMNS)
+
+def get_products_frame():
+    """DataFrame produits normalisé et typé (voir PRODUCT_COLUMNS), partagé par tous les
+    onglets stock et l'assistant Matar pour la version de données courante.
+    Lecture seule : utiliser .assign() / .copy() avant toute modification.
+    """
+    try:
+        return _load_products_frame(get_stock_data_version())
+    except Exception as e:
+        st.error(f"Erreur chargement produits: {e}")
+        return pd.DataFrame(columns=list(PRODUCT_COLUMNS)).astype(PRODUCT_COLUMNS)
+
 def update_product_in_firebase(product_id, product_data):
     """Met à jour un produit dans Firestore"""
-    try:
+    def _online():
         db = init_firebase_admin()
         if db:
             doc_ref = db.collection('stock_products').document(product_id)
-            
+        
             # Récupérer l'état avant modification
             try:
                 snap_before = doc_ref.get()
                 before_doc = snap_before.to_dict() if snap_before.exists else None
             except Exception:
                 before_doc = None
-            
+        
             # Ajouter timestamp de mise à jour
             product_data['updated_at'] = firestore.SERVER_TIMESTAMP
             doc_ref.update(product_data)
-            
+        
             # Journaliser la modification
             try:
                 log_change(
@@ -683,27 +790,29 @@ def update_product_in_firebase(product_id, product_data):
             except Exception:
                 pass
             return True
+    try:
+        return _write_or_queue(_online, lambda: offline_store.update_local('stock_products', product_id, product_data))
     except Exception as e:
         st.error(f"Erreur mise à jour produit: {e}")
         return False
 
 def delete_product_from_firebase(product_id):
     """Supprime un produit de Firestore"""
-    try:
+    def _online():
         db = init_firebase_admin()
         if db:
             doc_ref = db.collection('stock_products').document(product_id)
-            
+        
             # Récupérer les données avant suppression pour le log
             try:
                 snap_before = doc_ref.get()
                 before_doc = snap_before.to_dict() if snap_before.exists else None
             except Exception:
                 before_doc = None
-            
+        
             # Supprimer le document
             doc_ref.delete()
-            
+        
             # Journaliser la suppression
             try:
                 log_change(
@@ -717,26 +826,28 @@ def delete_product_from_firebase(product_id):
             except Exception:
                 pass
             return True
+    try:
+        return _write_or_queue(_online, lambda: offline_store.delete_local('stock_products', product_id))
     except Exception as e:
         st.error(f"Erreur suppression produit: {e}")
         return False
 
 def save_client_to_firebase(client_data):
     """Sauvegarde un client dans Firestore"""
-    try:
+    def _online():
         db = init_firebase_admin()
         if db:
             # Ajouter timestamp de création
             client_data['created_at'] = firestore.SERVER_TIMESTAMP
             client_data['updated_at'] = firestore.SERVER_TIMESTAMP
-            
+        
             doc_ref = db.collection('stock_clients').add(client_data)
             new_id = None
             try:
                 new_id = doc_ref[1].id
             except Exception:
                 pass
-            
+        
             # Journaliser la création
             try:
                 log_change(
@@ -750,6 +861,8 @@ def save_client_to_firebase(client_data):
             except Exception:
                 pass
             return new_id
+    try:
+        return _write_or_queue(_online, lambda: offline_store.create_local('stock_clients', client_data))
     except Exception as e:
         st.error(f"Erreur sauvegarde client: {e}")
         return None
@@ -757,44 +870,110 @@ def save_client_to_firebase(client_data):
 @st.cache_data(ttl=300)  # Cache pendant 5 minutes
 def get_all_clients_from_firebase():
     """Récupère tous les clients depuis Firestore"""
-    try:
+    def fetch():
         db = init_firebase_admin()
         if db:
-            clients = db.collection('stock_clients').stream()
-            return [{'id': doc.id, **doc.to_dict()} for doc in clients]
+            return {doc.id: doc.to_dict() for doc in db.collection('stock_clients').stream()}
+    try:
+        clients = _read_with_replica('stock_clients', fetch)
+        return [{'id': doc_id, **data} for doc_id, data in clients.items()]
     except Exception as e:
         st.error(f"Erreur récupération clients: {e}")
         return []
 
-def save_invoice_to_firebase(invoice_data):
-    """Sauvegarde une facture dans Firestore"""
+# Préfixe de numérotation par type de document
+INVOICE_PREFIXES = {'Facture': 'FACT', 'Devis': 'DEV', 'Proforma': 'PRO'}
+
+def _invoice_year(invoice_data):
+    from datetime import datetime
     try:
+        return int(str(invoice_data.get('date'))[:4])
+    except (TypeError, ValueError):
+        return datetime.now().year
+
+def format_invoice_number(doc_type, year, seq):
+    """Numéro de document, ex: FACT-2025-0042 (séquence par type et par année)."""
+    return f"{INVOICE_PREFIXES.get(doc_type, 'DOC')}-{year}-{seq:04d}"
+
+def provisional_invoice_number(doc_type, year, doc_id):
+    """Numéro provisoire d'un document créé hors ligne, remplacé à la synchronisation."""
+    return f"{INVOICE_PREFIXES.get(doc_type, 'DOC')}-{year}-HL-{doc_id[:6].upper()}"
+
+def create_invoice(db, invoice_data, invoice_id=None):
+    """Crée la facture et lui attribue son numéro dans une seule transaction Firestore.
+    Le compteur invoice_counters/{PREFIXE}-{année} n'avance que si la facture est écrite :
+    numéros uniques et sans trou, même avec plusieurs utilisateurs simultanés.
+    invoice_id : identifiant attribué à l'avance (rejeu de l'outbox) ; une facture déjà
+    créée n'est pas renumérotée. Retourne (identifiant, numéro).
+    """
+    doc_type = invoice_data.get('type') or 'Facture'
+    year = _invoice_year(invoice_data)
+    counter_ref = db.collection('invoice_counters').document(f"{INVOICE_PREFIXES.get(doc_type, 'DOC')}-{year}")
+    invoice_ref = db.collection('stock_invoices').document(invoice_id) if invoice_id \
+        else db.collection('stock_invoices').document()
+
+    @firestore.transactional
+    def _create(transaction):
+        if invoice_id:
+            existing = invoice_ref.get(transaction=transaction)
+            if existing.exists:
+                return (existing.to_dict() or {}).get('numero')
+        snap = counter_ref.get(transaction=transaction)
+        seq = int((snap.to_dict() or {}).get('dernier', 0) if snap.exists else 0) + 1
+        numero = format_invoice_number(doc_type, year, seq)
+        transaction.set(counter_ref, {
+            'type': doc_type,
+            'annee': year,
+            'dernier': seq,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        data = {k: v for k, v in invoice_data.items() if k != 'numero_provisoire'}
+        if invoice_data.get('numero_provisoire'):
+            data['numero_hors_ligne'] = invoice_data.get('numero')
+        data.update({
+            'numero': numero,
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        transaction.set(invoice_ref, data)
+        return numero
+
+    return invoice_ref.id, _create(db.transaction())
+
+def save_invoice_to_firebase(invoice_data):
+    """Sauvegarde une facture dans Firestore.
+    Le numéro est réservé à l'enregistrement et écrit dans invoice_data['numero'] ;
+    hors ligne, un numéro provisoire est attribué puis remplacé à la synchronisation.
+    """
+    def _online():
         db = init_firebase_admin()
         if db:
-            # Ajouter timestamp de création
-            invoice_data['created_at'] = firestore.SERVER_TIMESTAMP
-            invoice_data['updated_at'] = firestore.SERVER_TIMESTAMP
-            
-            doc_ref = db.collection('stock_invoices').add(invoice_data)
-            new_id = None
-            try:
-                new_id = doc_ref[1].id
-            except Exception:
-                pass
-            
+            new_id, numero = create_invoice(db, invoice_data)
+            invoice_data['numero'] = numero
+        
             # Journaliser la création
             try:
                 log_change(
                     event_type='stock.invoice.create',
                     item_id=new_id,
-                    description=f'Création de la facture: {invoice_data.get("numero", "Inconnu")}',
+                    description=f'Création de la facture: {numero}',
                     before=None,
-                    after={**invoice_data, 'id': new_id} if isinstance(invoice_data, dict) else invoice_data,
+                    after={**invoice_data, 'id': new_id},
                     metadata={'collection': 'stock_invoices'}
                 )
             except Exception:
                 pass
             return new_id
+
+    def _offline():
+        doc_id = offline_store.new_doc_id()
+        invoice_data['numero'] = provisional_invoice_number(
+            invoice_data.get('type') or 'Facture', _invoice_year(invoice_data), doc_id)
+        invoice_data['numero_provisoire'] = True
+        return offline_store.create_local('stock_invoices', invoice_data, doc_id=doc_id)
+
+    try:
+        return _write_or_queue(_online, _offline)
     except Exception as e:
         st.error(f"Erreur sauvegarde facture: {e}")
         return None
@@ -802,11 +981,16 @@ def save_invoice_to_firebase(invoice_data):
 @st.cache_data(ttl=300)  # Cache pendant 5 minutes
 def get_all_invoices_from_firebase():
     """Récupère toutes les factures depuis Firestore"""
-    try:
+    def fetch():
         db = init_firebase_admin()
         if db:
             invoices = db.collection('stock_invoices').order_by('created_at', direction=firestore.Query.DESCENDING).stream()
-            return [{'id': doc.id, **doc.to_dict()} for doc in invoices]
+            return {doc.id: doc.to_dict() for doc in invoices}
+    try:
+        invoices = [{'id': doc_id, **data} for doc_id, data in _read_with_replica('stock_invoices', fetch).items()]
+        # Plus récentes d'abord (la réplique ne garantit pas l'ordre Firestore)
+        invoices.sort(key=lambda inv: str(inv.get('created_at') or '').replace(' ', 'T'), reverse=True)
+        return invoices
     except Exception as e:
         st.error(f"Erreur récupération factures: {e}")
         return []
@@ -846,31 +1030,385 @@ def save_stock_movement_to_firebase(movement_data):
 @st.cache_data(ttl=300)  # Cache pendant 5 minutes
 def get_stock_movements_from_firebase(limit=100):
     """Récupère les mouvements de stock depuis Firestore"""
-    try:
+    def fetch():
         db = init_firebase_admin()
         if db:
             movements = db.collection('stock_movements').order_by('created_at', direction=firestore.Query.DESCENDING).limit(limit).stream()
-            return [{'id': doc.id, **doc.to_dict()} for doc in movements]
+            return {doc.id: doc.to_dict() for doc in movements}
+    try:
+        if not offline_store.is_offline():
+            try:
+                movements = fetch()
+                if movements is not None:
+                    offline_store.mark_online()
+                    offline_store.replicate('stock_movements', movements)
+                    return [{'id': doc_id, **data} for doc_id, data in movements.items()]
+            except Exception as e:
+                if not offline_store.is_connectivity_error(e):
+                    raise
+                offline_store.mark_offline(e)
+        return [{'id': doc_id, **data} for doc_id, data in offline_store.query_movements(limit=limit)]
     except Exception as e:
         st.error(f"Erreur récupération mouvements: {e}")
         return []
 
+# --- Journal de stock (source de vérité) ---
+# Chaque mouvement reçoit un numéro de séquence par produit ('seq') et un delta signé.
+# Le champ 'stock_actuel' du produit n'est plus qu'une projection mise à jour dans la
+# même transaction. Toutes les SNAPSHOT_EVERY opérations, un instantané est écrit dans
+# 'stock_snapshots' : le niveau à une date = dernier instantané + courte queue de mouvements.
+
+SNAPSHOT_EVERY = 50
+
+def movement_delta(type_mouvement, quantite):
+    """Retourne la variation signée de stock d'un mouvement (Entrée +, Sortie -, Ajustement signé)."""
+    try:
+        qty = float(quantite or 0)
+    except (TypeError, ValueError):
+        return 0
+    t = str(type_mouvement or '').strip().lower()
+    if t.startswith('entr') or t in ('in', 'achat', 'retour'):
+        return abs(qty)
+    if t.startswith('sort') or t in ('out', 'vente'):
+        return -abs(qty)
+    # Ajustement / inventaire : la quantité porte déjà son signe
+    return qty
+
+def _write_snapshot(transaction, db, product_id, seq, stock, date):
+    """Écrit un instantané de niveau de stock dans la transaction courante."""
+    snap_ref = db.collection('stock_snapshots').document(f"{product_id}_{int(seq):08d}")
+    transaction.set(snap_ref, {
+        'produit_id': product_id,
+        'seq': int(seq),
+        'stock': stock,
+        'date': date,
+        'created_at': firestore.SERVER_TIMESTAMP
+    })
+
+def apply_stock_movement(db, product_id, type_mouvement, quantite, motif='', reference='',
+                         utilisateur='', allow_negative=False, movement_id=None):
+    """Écrit mouvement, projection et instantané éventuel dans une transaction Firestore.
+    movement_id : identifiant attribué à l'avance (rejeu de l'outbox) ; si le mouvement
+    existe déjà, il n'est pas réappliqué. Lève une exception en cas d'échec.
+    """
+    from datetime import datetime, timezone
+    product_ref = db.collection('stock_products').document(product_id)
+    movement_ref = db.collection('stock_movements').document(movement_id) if movement_id \
+        else db.collection('stock_movements').document()
+    delta = movement_delta(type_mouvement, quantite)
+
+    @firestore.transactional
+    def _apply(transaction):
+        if movement_id:
+            existing = movement_ref.get(transaction=transaction)
+            if existing.exists:
+                return existing.to_dict()
+        snap = product_ref.get(transaction=transaction)
+        if not snap.exists:
+            raise ValueError(f"Produit introuvable: {product_id}")
+        product = snap.to_dict() or {}
+        stock_avant = product.get('stock_actuel', product.get('quantite', 0)) or 0
+        stock_apres = stock_avant + delta
+        if stock_apres < 0 and not allow_negative:
+            raise ValueError(f"Stock insuffisant pour {product.get('nom', product_id)}: {stock_avant}")
+        now = datetime.now(timezone.utc)
+        last_seq = product.get('ledger_seq')
+        if last_seq is None:
+            # Première écriture dans le journal : instantané d'ouverture du niveau existant
+            last_seq = 0
+            _write_snapshot(transaction, db, product_id, 0, stock_avant, now)
+        seq = int(last_seq) + 1
+        movement = {
+            'produit_id': product_id,
+            'produit_nom': product.get('nom', ''),
+            'type': type_mouvement,
+            'quantite': quantite,
+            'delta': delta,
+            'seq': seq,
+            'stock_avant': stock_avant,
+            'stock_apres': stock_apres,
+            'motif': motif or '',
+            'reference': reference or '',
+            'date': now.isoformat(),
+            'utilisateur': utilisateur or '',
+            'created_at': now
+        }
+        transaction.set(movement_ref, movement)
+        transaction.update(product_ref, {
+            'stock_actuel': stock_apres,
+            'ledger_seq': seq,
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        if seq % SNAPSHOT_EVERY == 0:
+            _write_snapshot(transaction, db, product_id, seq, stock_apres, now)
+        return movement
+
+    movement = {**_apply(db.transaction()), 'id': movement_ref.id}
+    try:
+        log_change(
+            event_type='stock.movement.create',
+            item_id=movement_ref.id,
+            description=f'Mouvement de stock: {type_mouvement} - {movement.get("produit_nom", "Inconnu")}',
+            before=None,
+            after=movement,
+            metadata={'collection': 'stock_movements', 'produit_id': product_id}
+        )
+    except Exception:
+        pass
+    return movement
+
+def record_stock_movement(product_id, type_mouvement, quantite, motif='', reference='',
+                          utilisateur=None, allow_negative=False):
+    """Enregistre un mouvement dans le journal et met à jour la projection 'stock_actuel'.
+    Mouvement, projection et instantané éventuel sont écrits dans une seule transaction Firestore.
+    Hors ligne, le mouvement est appliqué à la réplique locale et rejoué à la reconnexion.
+    Retourne le mouvement enregistré (avec 'id', 'stock_avant', 'stock_apres') ou None.
+    """
+    if not product_id:
+        return None
+    utilisateur = utilisateur or st.session_state.get('user_email', '')
+    def _online():
+        db = init_firebase_admin()
+        if db:
+            return apply_stock_movement(db, product_id, type_mouvement, quantite, motif=motif,
+                                        reference=reference, utilisateur=utilisateur,
+                                        allow_negative=allow_negative)
+
+    def _offline():
+        return offline_store.record_movement_local(
+            product_id, type_mouvement, quantite, movement_delta(type_mouvement, quantite),
+            motif=motif, reference=reference, utilisateur=utilisateur, allow_negative=allow_negative)
+
+    try:
+        return _write_or_queue(_online, _offline)
+    except Exception as e:
+        st.error(f"Erreur enregistrement mouvement: {e}")
+        return None
+
+def _latest_snapshot(db, product_id, at=None):
+    """Dernier instantané d'un produit (antérieur ou égal à 'at' si fourni)."""
+    q = db.collection('stock_snapshots').where('produit_id', '==', product_id)
+    if at is not None:
+        q = q.where('date', '<=', at)
+    docs = list(q.order_by('date', direction=firestore.Query.DESCENDING).limit(1).stream())
+    return docs[0].to_dict() if docs else None
+
+def get_stock_level_at(product_id, at=None):
+    """Niveau de stock d'un produit à la date 'at' (datetime, None = maintenant).
+    Calculé comme dernier instantané <= at plus la queue de mouvements suivante (< SNAPSHOT_EVERY).
+    Retourne None si le produit n'a pas encore d'historique dans le journal.
+    """
+    from datetime import timezone
+    try:
+        db = init_firebase_admin()
+        if not db or not product_id:
+            return None
+        if at is not None and at.tzinfo is None:
+            at = at.replace(tzinfo=timezone.utc)
+        snapshot = _latest_snapshot(db, product_id, at)
+        if snapshot is None:
+            return None
+        level = snapshot.get('stock', 0) or 0
+        tail = (db.collection('stock_movements')
+                .where('produit_id', '==', product_id)
+                .where('seq', '>', int(snapshot.get('seq', 0)))
+                .order_by('seq')
+                .limit(SNAPSHOT_EVERY)
+                .stream())
+        for doc in tail:
+            mv = doc.to_dict() or {}
+            if at is not None and mv.get('created_at') and mv['created_at'] > at:
+                break
+            level += mv.get('delta', movement_delta(mv.get('type'), mv.get('quantite')))
+        return level
+    except Exception as e:
+        st.error(f"Erreur calcul niveau de stock: {e}")
+        return None
+
+def get_stock_levels_at(at=None):
+    """Niveaux de stock de tous les produits à une date donnée: {produit_id: niveau}."""
+    products = get_all_products_from_firebase() or {}
+    return {pid: get_stock_level_at(pid, at) for pid in products}
+
+def reconcile_stock_levels():
+    """Compare la projection 'stock_actuel' de chaque produit au niveau calculé depuis le journal.
+    Retourne la liste des écarts: [{'produit_id', 'nom', 'stock_actuel', 'stock_journal', 'ecart'}].
+    """
+    ecarts = []
+    products = get_all_products_from_firebase() or {}
+    for pid, product in products.items():
+        if product.get('ledger_seq') is None:
+            continue
+        stock_journal = get_stock_level_at(pid)
+        if stock_journal is None:
+            continue
+        stock_actuel = product.get('stock_actuel', product.get('quantite', 0)) or 0
+        if stock_actuel != stock_journal:
+            ecarts.append({
+                'produit_id': pid,
+                'nom': product.get('nom', ''),
+                'stock_actuel': stock_actuel,
+                'stock_journal': stock_journal,
+                'ecart': stock_actuel - stock_journal
+            })
+    return ecarts
+
+def snapshot_stock_levels():
+    """Force un instantané pour chaque produit journalisé (ex: clôture mensuelle d'inventaire)."""
+    from datetime import datetime, timezone
+    try:
+        db = init_firebase_admin()
+        if not db:
+            return 0
+        products = get_all_products_from_firebase() or {}
+        now = datetime.now(timezone.utc)
+        batch = db.batch()
+        count = 0
+        for pid, product in products.items():
+            seq = product.get('ledger_seq')
+            if seq is None:
+                continue
+            level = get_stock_level_at(pid)
+            if level is None:
+                continue
+            batch.set(db.collection('stock_snapshots').document(f"{pid}_{int(seq):08d}"), {
+                'produit_id': pid,
+                'seq': int(seq),
+                'stock': level,
+                'date': now,
+                'created_at': firestore.SERVER_TIMESTAMP
+            })
+            count += 1
+            if count % 400 == 0:
+                batch.commit()
+                batch = db.batch()
+        batch.commit()
+        return count
+    except Exception as e:
+        st.error(f"Erreur instantanés de stock: {e}")
+        return 0
+
+# Colonnes typées du DataFrame de mouvements (ordre d'affichage)
+MOVEMENT_COLUMNS = {
+    'id': 'string',
+    'date': 'datetime64[ns, UTC]',
+    'produit_id': 'string',
+    'produit_nom': 'string',
+    'type': 'string',
+    'quantite': 'float64',
+    'delta': 'float64',
+    'stock_avant': 'float64',
+    'stock_apres': 'float64',
+    'motif': 'string',
+    'reference': 'string',
+    'utilisateur': 'string',
+}
+
+def _movement_type_variants(type_mouvement):
+    """Variantes d'écriture d'un type de mouvement présentes dans la base (ex: 'Sortie'/'sortie')."""
+    t = str(type_mouvement or '').strip()
+    variants = {t, t.lower(), t.capitalize()}
+    if t.lower().startswith('entr'):
+        variants.update({'Entrée', 'entrée', 'Entree', 'entree'})
+    return sorted(v for v in variants if v)
+
+def _movements_to_frame(records):
+    """Convertit des mouvements [(id, données)] en DataFrame colonne par colonne."""
+    cols = {name: [] for name in MOVEMENT_COLUMNS}
+    for doc_id, mv in records:
+        mv = mv or {}
+        cols['id'].append(doc_id)
+        cols['date'].append(mv.get('created_at') or mv.get('date'))
+        for name in ('produit_id', 'produit_nom', 'type', 'motif', 'reference', 'utilisateur'):
+            val = mv.get(name)
+            cols[name].append(None if val is None else str(val))
+        cols['quantite'].append(mv.get('quantite'))
+        cols['delta'].append(mv.get('delta', movement_delta(mv.get('type'), mv.get('quantite'))))
+        cols['stock_avant'].append(mv.get('stock_avant'))
+        cols['stock_apres'].append(mv.get('stock_apres'))
+    df = pd.DataFrame(cols)
+    df['date'] = pd.to_datetime(df['date'], utc=True, errors='coerce', format='mixed')
+    for name in ('quantite', 'delta', 'stock_avant', 'stock_apres'):
+        df[name] = pd.to_numeric(df[name], errors='coerce')
+    return df.astype(MOVEMENT_COLUMNS)
+
+def fetch_stock_movements(start=None, end=None, product_id=None, type_mouvement=None,
+                          limit=500, start_after=None):
+    """Interroge le journal des mouvements avec filtres exécutés côté Firestore.
+    - start / end : bornes de date (datetime) sur 'created_at' (start inclus, end exclu)
+    - product_id : filtre sur 'produit_id' ; type_mouvement : 'Entrée', 'Sortie', ...
+    - start_after : curseur de pagination = (date, id) de la dernière ligne de la page précédente ;
+      l'id départage les mouvements de même horodatage en limite de page
+    Retourne un DataFrame typé (voir MOVEMENT_COLUMNS), trié par date puis id décroissants.
+    Les index composites requis sont déclarés dans firestore.indexes.json.
+    Sans cache et sans interception des erreurs (lectures incrémentales, exports) ;
+    voir query_stock_movements pour l'affichage.
+    """
+    if offline_store.is_offline():
+        return _movements_to_frame(offline_store.query_movements(
+            start, end, product_id, type_mouvement and _movement_type_variants(type_mouvement),
+            limit, start_after))
+    db = init_firebase_admin()
+    if not db:
+        return pd.DataFrame(columns=list(MOVEMENT_COLUMNS)).astype(MOVEMENT_COLUMNS)
+    q = db.collection('stock_movements')
+    if product_id:
+        q = q.where('produit_id', '==', product_id)
+    if type_mouvement:
+        q = q.where('type', 'in', _movement_type_variants(type_mouvement))
+    if start is not None:
+        q = q.where('created_at', '>=', start)
+    if end is not None:
+        q = q.where('created_at', '<', end)
+    q = q.order_by('created_at', direction=firestore.Query.DESCENDING) \
+         .order_by('__name__', direction=firestore.Query.DESCENDING)
+    if start_after is not None:
+        after_date, after_id = start_after
+        q = q.start_after({'created_at': after_date,
+                           '__name__': db.collection('stock_movements').document(after_id)})
+    if limit:
+        q = q.limit(max(1, int(limit)))
+    try:
+        records = [(doc.id, doc.to_dict()) for doc in q.stream()]
+    except Exception as e:
+        if not offline_store.is_connectivity_error(e):
+            raise
+        offline_store.mark_offline(e)
+        records = offline_store.query_movements(
+            start, end, product_id, type_mouvement and _movement_type_variants(type_mouvement),
+            limit, start_after)
+    else:
+        offline_store.mark_online()
+        offline_store.replicate('stock_movements', dict(records))
+    return _movements_to_frame(records)
+
+@st.cache_data(ttl=300)  # Cache par requête pendant 5 minutes
+def query_stock_movements(start=None, end=None, product_id=None, type_mouvement=None,
+                          limit=500, start_after=None):
+    """fetch_stock_movements mis en cache pour l'affichage ; en cas d'erreur, message et DataFrame vide."""
+    try:
+        return fetch_stock_movements(start, end, product_id, type_mouvement, limit, start_after)
+    except Exception as e:
+        st.error(f"Erreur requête mouvements: {e}")
+        return pd.DataFrame(columns=list(MOVEMENT_COLUMNS)).astype(MOVEMENT_COLUMNS)
+
 def clear_stock_cache():
     """Vide le cache des données de stock pour forcer le rechargement"""
+    global _stock_data_version
+    _stock_data_version += 1
     get_all_products_from_firebase.clear()
     get_all_clients_from_firebase.clear()
     get_all_invoices_from_firebase.clear()
     get_stock_movements_from_firebase.clear()
+    query_stock_movements.clear()
 
 def sync_sqlite_to_firebase():
     """Synchronise les données SQLite vers Firebase"""
-    import sqlite3
-    import pandas as pd
-    from datetime import datetime
+    from sqlite_store import get_connection
     
     try:
-        # Connexion à la base SQLite
-        conn = sqlite3.connect('energie_solaire.db')
+        # Connexion SQLite partagée du thread courant
+        conn = get_connection()
         
         # Synchroniser les produits
         produits_df = pd.read_sql_query("SELECT * FROM produits", conn)
@@ -928,7 +1466,6 @@ def sync_sqlite_to_firebase():
             }
             save_stock_movement_to_firebase(movement_data)
         
-        conn.close()
         clear_stock_cache()  # Vider le cache après synchronisation
         return True, "Synchronisation réussie"
         
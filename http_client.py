@@ -0,0 +1,269 @@
+"""
+Client HTTP partagé pour les services externes (PVGIS, boutique en ligne, DeepSeek)
+- une session requests par service, avec connexions persistantes (keep-alive)
+- délais par service (connexion, lecture)
+- budget de latence par exécution de la page : au-delà, les appels échouent immédiatement
+- disjoncteur par service : après des échecs répétés, le service est court-circuité
+  pendant un délai de repos, puis une requête d'essai est autorisée
+- HTTP/2 optionnel pour l'assistant (httpx + h2 installés), sinon HTTP/1.1 keep-alive
+- préchauffage optionnel : connexion TLS ouverte au démarrage, avant la première question
+Les appelants gardent leurs replis (valeurs en cache, grille hors ligne, prix locaux).
+Les URL de base se surchargent par variables d'environnement (tests contre un serveur local).
+"""
+
+import contextvars
+import os
+import threading
+import time
+
+# Service -> URL de base, délai de connexion, délai de lecture (s), soumis au budget de la page
+ENDPOINTS = {
+    "pvgis": {"base_url": os.environ.get("ENERGIE_SOLAIRE_PVGIS_URL", "https://re.jrc.ec.europa.eu/api"),
+              "connect": 3.05, "read": 20, "budget": True},
+    "pvgis_series": {"base_url": os.environ.get("ENERGIE_SOLAIRE_PVGIS_URL", "https://re.jrc.ec.europa.eu/api"),
+                     "connect": 3.05, "read": 120, "budget": False},
+    "boutique": {"base_url": os.environ.get("ENERGIE_SOLAIRE_BOUTIQUE_URL", "https://energiesolairesenegal.com"),
+                 "connect": 3.05, "read": 8, "budget": True},
+    # Réponses de l'assistant lues en continu : délai de lecture long, hors budget de la page
+    "deepseek": {"base_url": os.environ.get("ENERGIE_SOLAIRE_DEEPSEEK_URL", "https://api.deepseek.com"),
+                 "connect": 5, "read": 60, "budget": False, "http2": True},
+}
+
+# Budget de latence cumulé des appels externes d'une exécution de la page
+RERUN_BUDGET_SECONDS = float(os.environ.get("ENERGIE_SOLAIRE_HTTP_BUDGET", "15"))
+# Disjoncteur : échecs consécutifs avant ouverture, durée d'ouverture
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 60
+# En dessous de ce temps restant, un appel n'est plus tenté
+MIN_REMAINING = 0.5
+# Connexions conservées ouvertes par service
+POOL_SIZE = 16
+# Préchauffage des connexions au démarrage (désactivable : ENERGIE_SOLAIRE_HTTP_WARMUP=0)
+WARM_UP = os.environ.get("ENERGIE_SOLAIRE_HTTP_WARMUP", "1") != "0"
+
+
+class ServiceUnavailable(Exception):
+    """Appel non tenté : disjoncteur ouvert ou budget de latence épuisé."""
+
+
+class CircuitOpenError(ServiceUnavailable):
+    pass
+
+
+class BudgetExceededError(ServiceUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """Disjoncteur fermé / ouvert / semi-ouvert, sûr entre threads."""
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "ferme"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "semi-ouvert"
+        return "ouvert"
+
+    def allow(self):
+        """Autorise un appel ; en semi-ouvert, une seule requête d'essai à la fois."""
+        with self._lock:
+            state = self._state()
+            if state == "ferme":
+                return True
+            if state == "semi-ouvert" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def release(self):
+        """Rend la requête d'essai semi-ouverte sans résultat (appel finalement non tenté)."""
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial = False
+
+
+class LatencyBudget:
+    """Échéance commune aux appels externes d'une exécution de la page."""
+
+    def __init__(self, seconds, clock=time.monotonic):
+        self._clock = clock
+        self.deadline = clock() + seconds
+
+    def remaining(self):
+        return self.deadline - self._clock()
+
+
+_budget = contextvars.ContextVar("http_budget", default=None)
+_breakers = {name: CircuitBreaker(name) for name in ENDPOINTS}
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def start_budget(seconds=None):
+    """Ouvre un nouveau budget de latence pour le contexte courant (appelé à chaque exécution de la page).
+    Les threads de travail héritent du budget s'ils sont lancés via contextvars.copy_context().run."""
+    budget = LatencyBudget(RERUN_BUDGET_SECONDS if seconds is None else seconds)
+    _budget.set(budget)
+    return budget
+
+
+def remaining_budget():
+    """Secondes restantes du budget courant, ou None sans budget."""
+    budget = _budget.get()
+    return None if budget is None else budget.remaining()
+
+
+class _Http2Session:
+    """Client httpx HTTP/2 exposé avec l'interface de requests.Session utilisée ici
+    (timeout (connexion, lecture), stream=True). Les réponses offrent status_code, json(),
+    iter_lines(), raise_for_status() et close()."""
+
+    def __init__(self):
+        import httpx
+        self._httpx = httpx
+        self._client = httpx.Client(http2=True, limits=httpx.Limits(max_connections=POOL_SIZE,
+                                                                    max_keepalive_connections=POOL_SIZE))
+
+    def request(self, method, url, timeout=None, stream=False, **kwargs):
+        connect, read = timeout
+        req = self._client.build_request(method, url, timeout=self._httpx.Timeout(read, connect=connect), **kwargs)
+        return self._client.send(req, stream=stream)
+
+
+def _requests_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(endpoint):
+    """Session du service, partagée par le processus (connexions persistantes).
+    HTTP/2 via httpx pour les services qui l'acceptent, si httpx et h2 sont installés."""
+    session = _sessions.get(endpoint)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(endpoint)
+            if session is None:
+                if ENDPOINTS[endpoint].get("http2"):
+                    try:
+                        session = _Http2Session()
+                    except ImportError:
+                        session = None
+                if session is None:
+                    session = _requests_session()
+                _sessions[endpoint] = session
+    return session
+
+
+def url(endpoint, path=""):
+    """URL complète d'un chemin du service (base surchargeable par l'environnement)."""
+    return ENDPOINTS[endpoint]["base_url"].rstrip("/") + "/" + path.lstrip("/") if path else ENDPOINTS[endpoint]["base_url"]
+
+
+def _timeout(endpoint):
+    conf = ENDPOINTS[endpoint]
+    connect, read = conf["connect"], conf["read"]
+    budget = _budget.get() if conf["budget"] else None
+    if budget is not None:
+        remaining = budget.remaining()
+        if remaining < MIN_REMAINING:
+            raise BudgetExceededError(f"{endpoint}: budget de latence épuisé")
+        connect, read = min(connect, remaining), min(read, remaining)
+    return connect, read
+
+
+def request(endpoint, method, target, **kwargs):
+    """Requête HTTP vers un service, avec délais, budget et disjoncteur.
+    - target : URL complète ou chemin relatif à la base du service
+    - lève ServiceUnavailable sans appel réseau si le disjoncteur est ouvert ou le budget épuisé
+    - les erreurs réseau et réponses 5xx comptent comme échecs du service (et sont levées)
+    """
+    breaker = _breakers[endpoint]
+    if not breaker.allow():
+        raise CircuitOpenError(f"{endpoint}: service temporairement court-circuité")
+    try:
+        timeout = _timeout(endpoint)
+    except BudgetExceededError:
+        breaker.release()  # appel non tenté : ni succès ni échec du service
+        raise
+    full_url = target if "://" in target else url(endpoint, target)
+    try:
+        response = get_session(endpoint).request(method, full_url, timeout=timeout, **kwargs)
+    except Exception:
+        breaker.record_failure()
+        raise
+    if response.status_code >= 500:
+        breaker.record_failure()
+        response.raise_for_status()
+    breaker.record_success()
+    return response
+
+
+def get(endpoint, target, **kwargs):
+    return request(endpoint, "GET", target, **kwargs)
+
+
+def post(endpoint, target, **kwargs):
+    return request(endpoint, "POST", target, **kwargs)
+
+
+_warmed = set()
+
+
+def warm_up(endpoint):
+    """Ouvre en tâche de fond la connexion (DNS, TCP, TLS) du service, une fois par processus,
+    pour que le premier vrai appel réutilise une connexion déjà établie. Sans effet en cas d'échec."""
+    with _sessions_lock:
+        if not WARM_UP or endpoint in _warmed:
+            return
+        _warmed.add(endpoint)
+
+    def _run():
+        try:
+            request(endpoint, "HEAD", url(endpoint)).close()
+        except Exception:
+            pass
+
+    threading.Thread(target=_run, name=f"warm-up-{endpoint}", daemon=True).start()
+
+
+def get_status():
+    """État des disjoncteurs par service : {'pvgis': 'ferme', 'boutique': 'ouvert', ...}."""
+    return {name: breaker.state for name, breaker in _breakers.items()}
+
+
+def reset(endpoint=None):
+    """Referme un disjoncteur (ou tous)."""
+    for name in ([endpoint] if endpoint else list(_breakers)):
+        _breakers[name].record_success()
@@ -0,0 +1,156 @@
+"""
+Export groupé des factures en PDF (clôture mensuelle pour le comptable)
+- sélection par période, statut et type
+- rendu réparti sur un pool de processus (reportlab est lié au CPU)
+- écriture au fil de l'eau dans une archive ZIP sur disque : la mémoire reste bornée
+  par le nombre de lots en cours, pas par le nombre de factures
+"""
+
+import csv
+import io
+import os
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from invoice_documents import RENDER_FIELDS, _as_date, render_pdf_batch
+
+# Factures par tâche envoyée à un processus (amortit le coût d'échange entre processus)
+BATCH_SIZE = 8
+# En dessous de ce nombre de factures, le démarrage du pool coûte plus qu'il ne rapporte
+MIN_PARALLEL = 16
+# Lots en vol par processus : borne la mémoire des PDF en attente d'écriture
+IN_FLIGHT_PER_WORKER = 2
+
+RECAP_COLUMNS = ['fichier', 'numero', 'date', 'type', 'statut', 'client',
+                 'sous_total', 'montant_tva', 'montant_remise', 'total_ttc']
+
+# Champs transmis aux processus : le rendu et le récapitulatif (pas de Timestamp Firestore)
+_PAYLOAD_FIELDS = ('id', 'statut') + RENDER_FIELDS
+
+
+def select_invoices(invoices, start=None, end=None, statuts=None, types=None):
+    """Factures dont la date est dans [start, end] (bornes incluses), filtrées par statut et type."""
+    selected = []
+    for inv in invoices:
+        d = _as_date(inv.get('date'))
+        if (start or end) and d is None:
+            continue
+        if start and d < start:
+            continue
+        if end and d > end:
+            continue
+        if statuts and inv.get('statut') not in statuts:
+            continue
+        if types and inv.get('type') not in types:
+            continue
+        selected.append(inv)
+    selected.sort(key=lambda inv: (str(inv.get('date') or ''), str(inv.get('numero') or '')))
+    return selected
+
+
+def _render_payload(invoice):
+    return {k: invoice.get(k) for k in _PAYLOAD_FIELDS}
+
+
+def _batches(items, size):
+    """Lots (position du premier élément, éléments)."""
+    return [(i, items[i:i + size]) for i in range(0, len(items), size)]
+
+
+def _iter_rendered(batches, max_workers, completed):
+    """Génère (position, [(nom, pdf, erreur)]) pour chaque lot, dès qu'il est rendu.
+    Les positions des lots terminés sont ajoutées à `completed`."""
+    if max_workers <= 1 or sum(len(b) for _, b in batches) < MIN_PARALLEL:
+        for offset, batch in batches:
+            results = render_pdf_batch(batch)
+            completed.add(offset)
+            yield offset, results
+        return
+
+    # 'spawn' : pas de fork d'un processus Streamlit multi-threadé
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx) as pool:
+        queue = iter(batches)
+        pending = {}
+        limit = max_workers * IN_FLIGHT_PER_WORKER
+        for offset, batch in queue:
+            pending[pool.submit(render_pdf_batch, batch)] = offset
+            if len(pending) >= limit:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                offset = pending.pop(future)
+                results = future.result()
+                completed.add(offset)
+                yield offset, results
+                nxt = next(queue, None)
+                if nxt is not None:
+                    pending[pool.submit(render_pdf_batch, nxt[1])] = nxt[0]
+
+
+def _unique_name(name, used):
+    if name not in used:
+        used.add(name)
+        return name
+    stem, ext = os.path.splitext(name)
+    i = 2
+    while f"{stem}_{i}{ext}" in used:
+        i += 1
+    used.add(f"{stem}_{i}{ext}")
+    return f"{stem}_{i}{ext}"
+
+
+def export_invoices_zip(invoices, dest, max_workers=None, progress=None):
+    """Écrit les PDF des factures dans l'archive ZIP `dest` (chemin ou fichier binaire).
+    - progress(fait, total) est appelé après chaque lot écrit
+    - un récapitulatif 'recapitulatif.csv' (une ligne par facture exportée) est ajouté à l'archive
+    Retourne (nombre de PDF écrits, [(nom de fichier, erreur)]).
+    """
+    payloads = [_render_payload(inv) for inv in invoices]
+    total = len(payloads)
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 1, 8)
+
+    written, errors, used = 0, [], set()
+    recap = io.StringIO()
+    recap_writer = csv.writer(recap, delimiter=';')
+    recap_writer.writerow(RECAP_COLUMNS)
+
+    # Les PDF sont déjà compressés : stockage sans recompression
+    with zipfile.ZipFile(dest, 'w', compression=zipfile.ZIP_STORED) as archive:
+        def _write(results, offset):
+            nonlocal written
+            for j, (name, pdf, err) in enumerate(results):
+                if pdf is None:
+                    errors.append((name, err))
+                    continue
+                name = _unique_name(name, used)
+                archive.writestr(name, pdf)
+                inv = payloads[offset + j]
+                recap_writer.writerow([name] + [inv.get(c, '') for c in RECAP_COLUMNS[1:]])
+                written += 1
+
+        batches = _batches(payloads, BATCH_SIZE)
+        completed = set()
+        done = 0
+        try:
+            for offset, results in _iter_rendered(batches, max_workers, completed):
+                _write(results, offset)
+                done += len(results)
+                if progress:
+                    progress(done, total)
+        except (BrokenProcessPool, OSError):
+            # Pool indisponible (environnement restreint) : on termine dans ce processus
+            for offset, batch in batches:
+                if offset in completed:
+                    continue
+                _write(render_pdf_batch(batch), offset)
+                done += len(batch)
+                if progress:
+                    progress(done, total)
+
+        archive.writestr('recapitulatif.csv', recap.getvalue().encode('utf-8-sig'))
+    return written, errors
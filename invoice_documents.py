@@ -0,0 +1,206 @@
+"""
+Rendu des factures (PDF / DOCX) à partir du document facture enregistré
+Module sans dépendance Streamlit : utilisable depuis l'éditeur comme depuis des processus de travail
+"""
+
+import hashlib
+import io
+import re
+from datetime import date, datetime
+
+import document_cache
+import document_templates
+import logo_assets
+
+from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
+
+
+def _template_version():
+    # Empreinte des modules de rendu, des gabarits et du logo : toute modification invalide le cache
+    h = hashlib.sha256()
+    for path in (__file__, document_templates.__file__):
+        with open(path, 'rb') as source:
+            h.update(source.read())
+    h.update(str(logo_assets.svg_hash()).encode())
+    return h.hexdigest()[:16]
+
+
+TEMPLATE_VERSION = _template_version()
+
+# Champs de la facture qui déterminent le document rendu (clé de cache)
+RENDER_FIELDS = ('numero', 'client', 'date', 'date_echeance', 'type', 'lignes',
+                 'sous_total', 'taux_tva', 'montant_tva', 'taux_remise', 'montant_remise', 'total_ttc')
+
+
+def _as_date(value):
+    """Date d'une facture : accepte date, datetime ou chaîne ISO ('2025-01-31', '2025-01-31T10:00:00')."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _fmt_date(value):
+    d = _as_date(value)
+    return d.strftime('%d/%m/%Y') if d else ''
+
+
+def _num(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def invoice_filename(invoice, ext):
+    """Nom de fichier d'une facture, ex: 'Facture_FACT-20250131-001.pdf'."""
+    base = f"{invoice.get('type') or 'Facture'}_{invoice.get('numero') or invoice.get('id') or 'sans_numero'}"
+    return f"{re.sub(r'[^A-Za-z0-9._-]+', '_', base)}.{ext}"
+
+
+def render_invoice_pdf(invoice):
+    """PDF d'une facture enregistrée (champs de stock_invoices : numero, client, date, lignes, totaux...)."""
+    tpl = document_templates.pdf_invoice_template()
+    styles = tpl.styles
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=tpl.pagesize, **tpl.margins)
+
+    story = []
+
+    # En-tête
+    story.append(Paragraph(f"{str(invoice.get('type') or 'Facture').upper()}", styles['CustomTitle']))
+    story.append(Spacer(1, 12))
+
+    # Informations de base
+    info_data = [
+        ['Numéro:', str(invoice.get('numero', '')), 'Date:', _fmt_date(invoice.get('date'))],
+        ['Client:', str(invoice.get('client', '')), 'Échéance:', _fmt_date(invoice.get('date_echeance'))],
+    ]
+
+    info_table = Table(info_data, colWidths=tpl.info_col_widths)
+    info_table.setStyle(tpl.info_table_style)
+
+    story.append(info_table)
+    story.append(Spacer(1, 20))
+
+    # Tableau des lignes
+    table_data = [['Description', 'Qté', 'Prix Unit.', 'Total']]
+
+    for line in invoice.get('lignes') or []:
+        table_data.append([
+            str(line.get('description', '')),
+            f"{_num(line.get('quantity')):.0f}",
+            f"{_num(line.get('unit_price')):,.0f}",
+            f"{_num(line.get('total')):,.0f}"
+        ])
+
+    # Lignes de totaux
+    table_data.append(['', '', 'Sous-total:', f"{_num(invoice.get('sous_total')):,.0f} FCFA"])
+
+    if _num(invoice.get('montant_remise')) > 0:
+        table_data.append(['', '', f"Remise ({invoice.get('taux_remise', 0)}%):",
+                           f"-{_num(invoice.get('montant_remise')):,.0f} FCFA"])
+
+    table_data.append(['', '', f"TVA ({invoice.get('taux_tva', 0)}%):", f"{_num(invoice.get('montant_tva')):,.0f} FCFA"])
+    table_data.append(['', '', 'TOTAL TTC:', f"{_num(invoice.get('total_ttc')):,.0f} FCFA"])
+
+    table = Table(table_data, colWidths=tpl.lines_col_widths)
+    table.setStyle(tpl.lines_table_style)
+
+    story.append(table)
+
+    doc.build(story, onFirstPage=tpl.draw_first_page, onLaterPages=tpl.draw_later_pages)
+    return buffer.getvalue()
+
+
+def render_invoice_docx(invoice):
+    """Document Word (DOCX) d'une facture enregistrée."""
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    doc = document_templates.new_docx_invoice()
+
+    # Titre
+    title = doc.add_heading(f"{str(invoice.get('type') or 'Facture').upper()}", level=0)
+    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    # Informations de base
+    info = doc.add_paragraph()
+    info.add_run("Numéro: ").bold = True
+    info.add_run(str(invoice.get('numero', '')))
+    info.add_run("\t\tDate: ").bold = True
+    info.add_run(_fmt_date(invoice.get('date')))
+    info2 = doc.add_paragraph()
+    info2.add_run("Client: ").bold = True
+    info2.add_run(str(invoice.get('client', '')))
+    info2.add_run("\t\tÉchéance: ").bold = True
+    info2.add_run(_fmt_date(invoice.get('date_echeance')))
+
+    doc.add_paragraph("")
+
+    # Tableau des lignes
+    table = doc.add_table(rows=1, cols=4)
+    hdr_cells = table.rows[0].cells
+    hdr_cells[0].text = 'Description'
+    hdr_cells[1].text = 'Qté'
+    hdr_cells[2].text = 'Prix Unit.'
+    hdr_cells[3].text = 'Total'
+
+    for line in invoice.get('lignes') or []:
+        row_cells = table.add_row().cells
+        row_cells[0].text = str(line.get('description', ''))
+        row_cells[1].text = f"{_num(line.get('quantity')):.0f}"
+        row_cells[2].text = f"{_num(line.get('unit_price')):,.0f}"
+        row_cells[3].text = f"{_num(line.get('total')):,.0f}"
+
+    doc.add_paragraph("")
+
+    # Totaux
+    totals = doc.add_paragraph()
+    totals.add_run("Sous-total: ").bold = True
+    totals.add_run(f"{_num(invoice.get('sous_total')):,.0f} FCFA\n")
+    if _num(invoice.get('montant_remise')) > 0:
+        disc = doc.add_paragraph()
+        disc.add_run(f"Remise ({invoice.get('taux_remise', 0)}%): ").bold = True
+        disc.add_run(f"-{_num(invoice.get('montant_remise')):,.0f} FCFA\n")
+    tva = doc.add_paragraph()
+    tva.add_run(f"TVA ({invoice.get('taux_tva', 0)}%): ").bold = True
+    tva.add_run(f"{_num(invoice.get('montant_tva')):,.0f} FCFA\n")
+    total_par = doc.add_paragraph()
+    total_par.add_run("TOTAL TTC: ").bold = True
+    total_par.add_run(f"{_num(invoice.get('total_ttc')):,.0f} FCFA")
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+_RENDERERS = {'pdf': render_invoice_pdf, 'docx': render_invoice_docx}
+
+
+def document_key(invoice, fmt):
+    """Clé de cache : contenu rendu de la facture + format + version des gabarits."""
+    return document_cache.content_key({k: invoice.get(k) for k in RENDER_FIELDS}, fmt, TEMPLATE_VERSION)
+
+
+def invoice_document(invoice, fmt):
+    """Octets du document ('pdf' ou 'docx') d'une facture, servis depuis le cache disque si inchangée."""
+    if fmt not in _RENDERERS:
+        raise ValueError(f"Format de facture inconnu: {fmt}")
+    return document_cache.get_or_render(document_key(invoice, fmt), fmt, lambda: _RENDERERS[fmt](invoice))
+
+
+def render_pdf_batch(invoices):
+    """Rend un lot de factures dans un processus de travail.
+    Retourne [(nom de fichier, octets PDF ou None, erreur ou None)] dans l'ordre du lot."""
+    results = []
+    for invoice in invoices:
+        name = invoice_filename(invoice, 'pdf')
+        try:
+            results.append((name, invoice_document(invoice, 'pdf'), None))
+        except Exception as e:
+            results.append((name, None, str(e)))
+    return results
@@ -4,57 +4,27 @@
 
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.pdfgen import canvas
-import io
-import base64
+import os
+import tempfile
+from datetime import date, datetime, timedelta
 from firebase_config import (
     save_invoice_to_firebase,
     get_all_invoices_from_firebase,
     get_all_clients_from_firebase,
     get_all_products_from_firebase,
-    update_product_in_firebase,
-    save_stock_movement_to_firebase
+    record_stock_movement,
+    clear_stock_cache
 )
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
+from invoice_documents import invoice_document, invoice_filename
+from invoice_batch import select_invoices, export_invoices_zip
 
 class InvoiceEditor:
-    def __init__(self):
-        self.styles = getSampleStyleSheet()
-        self.setup_custom_styles()
-    
-    def setup_custom_styles(self):
-        """Configuration des styles personnalisés"""
-        self.styles.add(ParagraphStyle(
-            name='CustomTitle',
-            parent=self.styles['Heading1'],
-            fontSize=18,
-            spaceAfter=30,
-            textColor=colors.darkblue,
-            alignment=1  # Center
-        ))
-        
-        self.styles.add(ParagraphStyle(
-            name='CustomHeading',
-            parent=self.styles['Heading2'],
-            fontSize=12,
-            spaceAfter=12,
-            textColor=colors.darkblue
-        ))
-    
     def create_invoice_interface(self):
         """Interface principale de création de facture"""
         st.subheader("📄 Éditeur de Factures")
         
         # Onglets pour différentes actions
-        tab1, tab2, tab3 = st.tabs(["Nouvelle Facture", "Factures Existantes", "Modèles"])
+        tab1, tab2, tab3, tab4 = st.tabs(["Nouvelle Facture", "Factures Existantes", "Modèles", "Export mensuel"])
         
         with tab1:
             self.create_new_invoice()
@@ -64,6 +34,9 @@ class InvoiceEditor:
         
         with tab3:
             self.invoice_templates()
+        
+        with tab4:
+            self.export_invoices_batch()
     
     def create_new_invoice(self):
         """Interface de création d'une nouvelle facture"""
@@ -97,8 +70,11 @@ class InvoiceEditor:
                             st.success("Client ajouté avec succès!")
                             st.rerun()
             
-            # Numéro de facture
-            invoice_number = st.text_input("Numéro de facture", value=f"FACT-{datetime.now().strftime('%Y%m%d')}-{len(get_all_invoices_from_firebase()) + 1:03d}")
+            # Numéro de facture : réservé sur le compteur Firestore à l'enregistrement (aucune lecture ici) ;
+            # le formulaire reste un brouillon, le numéro attribué s'affiche dans le message de confirmation
+            invoice_number = "BROUILLON"
+            st.text_input("Numéro de facture", value=invoice_number, disabled=True,
+                          help="Attribué automatiquement à l'enregistrement (ex: FACT-2025-0042)")
             
             # Date de facture
             invoice_date = st.date_input("Date de facture", value=datetime.now())
@@ -131,8 +107,8 @@ class InvoiceEditor:
             with col1:
                 # Sélection produit ou service personnalisé
                 products = get_all_products_from_firebase()
-                # Convertir le dictionnaire en liste pour l'interface
-                products_list = list(products.values()) if products else []
+                # Convertir le dictionnaire en liste pour l'interface (en conservant l'ID Firestore)
+                products_list = [{**p, 'id': pid} for pid, p in products.items()] if products else []
                 product_options = ["Service personnalisé..."] + [p.get('nom', '') for p in products_list]
                 selected_product = st.selectbox("Produit/Service", product_options, key="new_product")
             
@@ -219,14 +195,14 @@ class InvoiceEditor:
             with col1:
                 if st.button("💾 Sauvegarder"):
                     self.save_invoice(
-                        selected_client, invoice_number, invoice_date, due_date,
+                        selected_client, invoice_date, due_date,
                         doc_type, status, payment_terms, st.session_state.invoice_lines,
                         subtotal, tva_rate, tva_amount, discount_rate, discount_amount, total_ttc
                     )
                 # Bouton de validation avec déduction du stock (pour Facture)
                 if doc_type == "Facture" and st.button("✅ Valider et déduire du stock"):
                     self.save_invoice(
-                        selected_client, invoice_number, invoice_date, due_date,
+                        selected_client, invoice_date, due_date,
                         doc_type, "Validé", payment_terms, st.session_state.invoice_lines,
                         subtotal, tva_rate, tva_amount, discount_rate, discount_amount, total_ttc
                     )
@@ -264,15 +240,11 @@ class InvoiceEditor:
                     st.session_state.invoice_lines = []
                     st.rerun()
     
-    def save_invoice(self, client, number, date, due_date, doc_type, status, terms, lines, 
+    def save_invoice(self, client, date, due_date, doc_type, status, terms, lines, 
                     subtotal, tva_rate, tva_amount, discount_rate, discount_amount, total):
         """Sauvegarde la facture dans Firebase"""
         try:
-            # Garder le numéro de facture en session pour le motif des mouvements
-            st.session_state['current_invoice_number'] = number
-            
             invoice_data = {
-                "numero": number,
                 "client": client,
                 "date": date.isoformat(),
                 "date_echeance": due_date.isoformat(),
@@ -293,11 +265,12 @@ class InvoiceEditor:
             }
             
             if save_invoice_to_firebase(invoice_data):
-                st.success(f"{doc_type} sauvegardée avec succès!")
+                # Numéro réservé à l'enregistrement : message de confirmation et référence des mouvements
+                st.success(f"{doc_type} {invoice_data['numero']} sauvegardée avec succès!")
                 
                 # Mettre à jour le stock pour facture validée ou payée
                 if doc_type == "Facture" and status in ["Validé", "Payé"]:
-                    self.update_stock_from_invoice(lines)
+                    self.update_stock_from_invoice(lines, invoice_data['numero'])
                 
                 return True
             else:
@@ -308,119 +281,54 @@ class InvoiceEditor:
             st.error(f"Erreur: {e}")
             return False
     
-    def update_stock_from_invoice(self, lines):
-        """Met à jour le stock après une facture validée/payée"""
+    def update_stock_from_invoice(self, lines, numero=''):
+        """Met à jour le stock après une facture validée/payée (numero : numéro attribué à l'enregistrement)"""
         try:
-            products = get_all_products_from_firebase()
-            
             for line in lines:
                 if line.get('product_id'):
-                    # Récupérer le produit directement par son ID depuis le dictionnaire
-                    product = products.get(line['product_id']) if products else None
-                    if product:
-                        qty = int(line['quantity']) if isinstance(line.get('quantity'), (int, float)) else 0
-                        # Décrémenter le stock
-                        new_stock = max(0, product.get('stock_actuel', 0) - qty)
-                        product['stock_actuel'] = new_stock
-                        
-                        # Mettre à jour dans Firebase
-                        update_product_in_firebase(product['id'], product)
-                        
-                        # Enregistrer le mouvement
-                        movement = {
-                            "produit_id": product['id'],
-                            "produit_nom": product.get('nom', ''),
-                            "type": "sortie",
-                            "quantite": qty,
-                            "motif": f"Vente - Facture {st.session_state.get('current_invoice_number', '')}",
-                            "date": datetime.now().isoformat(),
-                            "utilisateur": st.session_state.get("user_email", "admin")
-                        }
-                        save_stock_movement_to_firebase(movement)
+                    qty = int(line['quantity']) if isinstance(line.get('quantity'), (int, float)) else 0
+                    if qty <= 0:
+                        continue
+                    # Mouvement de sortie journalisé (met aussi à jour stock_actuel)
+                    record_stock_movement(
+                        line['product_id'], "Sortie", qty,
+                        motif=f"Vente - Facture {numero}",
+                        reference=numero,
+                        utilisateur=st.session_state.get("user_email", "admin")
+                    )
             
+            clear_stock_cache()
             st.success("Stock mis à jour automatiquement")
             
         except Exception as e:
             st.error(f"Erreur lors de la mise à jour du stock: {e}")
     
+    def _invoice_document(self, client, number, date, due_date, doc_type, lines,
+                          subtotal, tva_rate, tva_amount, discount_rate, discount_amount, total):
+        """Champs de la facture au format enregistré (entrée des fonctions de rendu)"""
+        return {
+            "numero": number,
+            "client": client,
+            "date": date.isoformat(),
+            "date_echeance": due_date.isoformat(),
+            "type": doc_type,
+            "lignes": lines,
+            "sous_total": subtotal,
+            "taux_tva": tva_rate,
+            "montant_tva": tva_amount,
+            "taux_remise": discount_rate,
+            "montant_remise": discount_amount,
+            "total_ttc": total,
+        }
+    
     def generate_pdf(self, client, number, date, due_date, doc_type, lines, 
                     subtotal, tva_rate, tva_amount, discount_rate, discount_amount, total):
         """Génère un PDF de la facture"""
         try:
-            buffer = io.BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=72, leftMargin=72, 
-                                  topMargin=72, bottomMargin=18)
-            
-            # Contenu du PDF
-            story = []
-            
-            # En-tête
-            story.append(Paragraph(f"{doc_type.upper()}", self.styles['CustomTitle']))
-            story.append(Spacer(1, 12))
-            
-            # Informations de base
-            info_data = [
-                ['Numéro:', number, 'Date:', date.strftime('%d/%m/%Y')],
-                ['Client:', client, 'Échéance:', due_date.strftime('%d/%m/%Y')],
-            ]
-            
-            info_table = Table(info_data, colWidths=[1*inch, 2*inch, 1*inch, 1.5*inch])
-            info_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, -1), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-            ]))
-            
-            story.append(info_table)
-            story.append(Spacer(1, 20))
-            
-            # Tableau des lignes
-            table_data = [['Description', 'Qté', 'Prix Unit.', 'Total']]
-            
-            for line in lines:
-                table_data.append([
-                    line['description'],
-                    f"{line['quantity']:.0f}",
-                    f"{line['unit_price']:,.0f}",
-                    f"{line['total']:,.0f}"
-                ])
-            
-            # Ligne de sous-total
-            table_data.append(['', '', 'Sous-total:', f"{subtotal:,.0f} FCFA"])
-            
-            if discount_amount > 0:
-                table_data.append(['', '', f'Remise ({discount_rate}%):', f"-{discount_amount:,.0f} FCFA"])
-            
-            table_data.append(['', '', f'TVA ({tva_rate}%):', f"{tva_amount:,.0f} FCFA"])
-            table_data.append(['', '', 'TOTAL TTC:', f"{total:,.0f} FCFA"])
-            
-            table = Table(table_data, colWidths=[3*inch, 0.8*inch, 1.2*inch, 1.2*inch])
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -4), colors.beige),
-                ('BACKGROUND', (0, -3), (-1, -1), colors.lightgrey),
-                ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            
-            story.append(table)
-            
-            # Construire le PDF
-            doc.build(story)
-            
-            pdf_data = buffer.getvalue()
-            buffer.close()
-            
-            return pdf_data
-            
+            return invoice_document(self._invoice_document(
+                client, number, date, due_date, doc_type, lines,
+                subtotal, tva_rate, tva_amount, discount_rate, discount_amount, total
+            ), 'pdf')
         except Exception as e:
             st.error(f"Erreur lors de la génération du PDF: {e}")
             return None
@@ -429,65 +337,10 @@ class InvoiceEditor:
                     subtotal, tva_rate, tva_amount, discount_rate, discount_amount, total):
         """Génère un document Word (DOCX) de la facture"""
         try:
-            doc = Document()
-            
-            # Titre
-            title = doc.add_heading(f"{doc_type.upper()}", level=0)
-            title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            
-            # Informations de base
-            info = doc.add_paragraph()
-            info.add_run(f"Numéro: ").bold = True
-            info.add_run(str(number))
-            info.add_run("\t\tDate: ").bold = True
-            info.add_run(date.strftime('%d/%m/%Y'))
-            info2 = doc.add_paragraph()
-            info2.add_run(f"Client: ").bold = True
-            info2.add_run(str(client))
-            info2.add_run("\t\tÉchéance: ").bold = True
-            info2.add_run(due_date.strftime('%d/%m/%Y'))
-            
-            doc.add_paragraph("")
-            
-            # Tableau des lignes
-            table = doc.add_table(rows=1, cols=4)
-            hdr_cells = table.rows[0].cells
-            hdr_cells[0].text = 'Description'
-            hdr_cells[1].text = 'Qté'
-            hdr_cells[2].text = 'Prix Unit.'
-            hdr_cells[3].text = 'Total'
-            
-            for line in lines:
-                row_cells = table.add_row().cells
-                row_cells[0].text = str(line.get('description', ''))
-                row_cells[1].text = f"{line.get('quantity', 0):.0f}"
-                row_cells[2].text = f"{line.get('unit_price', 0):,.0f}"
-                row_cells[3].text = f"{line.get('total', 0):,.0f}"
-            
-            doc.add_paragraph("")
-            
-            # Totaux
-            totals = doc.add_paragraph()
-            totals.add_run(f"Sous-total: ").bold = True
-            totals.add_run(f"{subtotal:,.0f} FCFA\n")
-            if discount_amount > 0:
-                disc = doc.add_paragraph()
-                disc.add_run(f"Remise ({discount_rate}%): ").bold = True
-                disc.add_run(f"-{discount_amount:,.0f} FCFA\n")
-            tva = doc.add_paragraph()
-            tva.add_run(f"TVA ({tva_rate}%): ").bold = True
-            tva.add_run(f"{tva_amount:,.0f} FCFA\n")
-            total_par = doc.add_paragraph()
-            total_par.add_run("TOTAL TTC: ").bold = True
-            total_par.add_run(f"{total:,.0f} FCFA")
-            
-            # Export en mémoire
-            buffer = io.BytesIO()
-            doc.save(buffer)
-            data = buffer.getvalue()
-            buffer.close()
-            return data
-            
+            return invoice_document(self._invoice_document(
+                client, number, date, due_date, doc_type, lines,
+                subtotal, tva_rate, tva_amount, discount_rate, discount_amount, total
+            ), 'docx')
         except Exception as e:
             st.error(f"Erreur lors de la génération DOCX: {e}")
             return None
@@ -538,12 +391,108 @@ class InvoiceEditor:
                         st.write(f"**Total:** {invoice.get('total_ttc', 0):,.0f} FCFA")
                     
                     with col2:
-                        if st.button(f"Régénérer PDF", key=f"pdf_{invoice.get('id', '')}"):
-                            # Régénérer le PDF avec les données sauvegardées
-                            st.info("Fonctionnalité de régénération PDF à implémenter")
+                        self.regenerate_documents(invoice)
         else:
             st.info("Aucune facture trouvée")
     
+    def regenerate_documents(self, invoice):
+        """Régénère le PDF / DOCX d'une facture enregistrée (servi par le cache disque si inchangée)"""
+        invoice_id = invoice.get('id', '')
+        # Formats demandés dans la session : les octets restent dans le cache disque, pas en session
+        demandes = st.session_state.setdefault('invoice_documents', set())
+        
+        col_pdf, col_docx = st.columns(2)
+        with col_pdf:
+            if st.button("Régénérer PDF", key=f"pdf_{invoice_id}"):
+                demandes.add((invoice_id, 'pdf'))
+        with col_docx:
+            if st.button("Régénérer Word", key=f"docx_{invoice_id}"):
+                demandes.add((invoice_id, 'docx'))
+        
+        for fmt, label, mime in (
+            ('pdf', "📥 Télécharger PDF", "application/pdf"),
+            ('docx', "📥 Télécharger DOCX", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+        ):
+            if (invoice_id, fmt) not in demandes:
+                continue
+            try:
+                data = invoice_document(invoice, fmt)
+            except Exception as e:
+                st.error(f"Erreur lors de la génération {fmt.upper()}: {e}")
+                demandes.discard((invoice_id, fmt))
+                continue
+            st.download_button(
+                label=label,
+                data=data,
+                file_name=invoice_filename(invoice, fmt),
+                mime=mime,
+                key=f"download_{fmt}_{invoice_id}"
+            )
+    
+    def export_invoices_batch(self):
+        """Export groupé des factures d'une période en PDF (archive ZIP pour le comptable)"""
+        st.write("### Export mensuel des factures")
+        
+        invoices = get_all_invoices_from_firebase()
+        if not invoices:
+            st.info("Aucune facture trouvée")
+            return
+        
+        today = date.today()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            periode = st.date_input("Période", value=(today.replace(day=1), today), key="batch_periode")
+        with col2:
+            statuts = st.multiselect("Statuts", sorted({inv.get('statut', '') for inv in invoices} - {''}),
+                                     key="batch_statuts")
+        with col3:
+            types = st.multiselect("Types", sorted({inv.get('type', '') for inv in invoices} - {''}),
+                                   key="batch_types")
+        
+        # Pendant la saisie de la plage, date_input ne renvoie qu'une borne
+        bornes = list(periode) if isinstance(periode, (list, tuple)) else [periode]
+        start, end = bornes[0], bornes[-1]
+        selection = select_invoices(invoices, start, end, statuts, types)
+        st.caption(f"{len(selection)} document(s) sélectionné(s)")
+        
+        if selection and st.button("📦 Générer l'archive ZIP", key="batch_export"):
+            barre = st.progress(0.0, text="Génération des PDF...")
+            fd, path = tempfile.mkstemp(prefix="factures_", suffix=".zip")
+            os.close(fd)
+            try:
+                count, errors = export_invoices_zip(
+                    selection, path,
+                    progress=lambda fait, total: barre.progress(fait / total, text=f"{fait}/{total} PDF générés")
+                )
+            except Exception as e:
+                os.remove(path)
+                st.error(f"Erreur lors de l'export: {e}")
+                return
+            
+            # Un seul export conservé par session : l'archive précédente est supprimée
+            previous = st.session_state.get('invoice_batch_export')
+            if previous and os.path.exists(previous['path']):
+                os.remove(previous['path'])
+            st.session_state['invoice_batch_export'] = {
+                'path': path,
+                'file_name': f"factures_{start.strftime('%Y%m%d')}_{end.strftime('%Y%m%d')}.zip",
+                'count': count,
+                'errors': errors,
+            }
+        
+        export = st.session_state.get('invoice_batch_export')
+        if export and os.path.exists(export['path']):
+            st.success(f"{export['count']} PDF dans l'archive")
+            for name, err in export['errors']:
+                st.warning(f"{name} non exporté: {err}")
+            with open(export['path'], 'rb') as f:
+                st.download_button(
+                    label="📥 Télécharger l'archive ZIP",
+                    data=f,
+                    file_name=export['file_name'],
+                    mime="application/zip"
+                )
+    
     def invoice_templates(self):
         """Gestion des modèles de factures"""
         st.write("### Modèles de Factures")
@@ -581,8 +530,12 @@ class InvoiceEditor:
             st.success(f"Modèle '{selected_template}' appliqué!")
             st.rerun()
 
+@st.cache_resource
+def _get_invoice_editor():
+    # L'éditeur est sans état (les gabarits sont compilés par document_templates) : une instance par processus
+    return InvoiceEditor()
+
 # Fonction principale pour intégrer dans l'application
 def show_invoice_editor():
     """Fonction principale pour afficher l'éditeur de factures"""
-    editor = InvoiceEditor()
-    editor.create_invoice_interface()
+    _get_invoice_editor().create_invoice_interface()
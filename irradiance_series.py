@@ -0,0 +1,209 @@
+"""
+Séries horaires d'irradiance et de température (PVGIS seriescalc) pour la simulation horaire
+- ingestion une fois par site : téléchargement PVGIS ou import d'un fichier local (JSON ou CSV PVGIS)
+- stockage compact : archive .npz compressée de tableaux float32 + métadonnées
+- l'année type (moyenne par mois / jour / heure, 8760 valeurs) est calculée à l'ingestion
+  et relue directement, sans analyser de JSON à nouveau
+Ligne de commande :
+  python irradiance_series.py fetch <lat> <lon> [--angle 15 --aspect 0]
+  python irradiance_series.py import <fichier> <lat> <lon> [--angle 15 --aspect 0]
+"""
+
+import csv
+import io
+import json
+import os
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+import http_client
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SERIES_DIR = os.environ.get("ENERGIE_SOLAIRE_IRRADIANCE_DIR", os.path.join(APP_DIR, "data", "irradiance"))
+
+RADDATABASE = "PVGIS-SARAH3"
+START_YEAR, END_YEAR = 2005, 2020
+
+# Colonnes PVGIS -> noms de tableaux stockés
+FIELDS = {"G(i)": "g_poa", "H_sun": "h_sun", "T2m": "t2m", "WS10m": "ws10m"}
+HOURS_PER_YEAR = 8760
+
+
+def site_key(lat, lon, angle=0, aspect=0):
+    """Identifiant de site : coordonnées arrondies à 0,01° et orientation du plan."""
+    return f"{round(float(lat), 2):.2f}_{round(float(lon), 2):.2f}_{int(round(float(angle)))}_{int(round(float(aspect)))}"
+
+
+def _path(key):
+    return os.path.join(SERIES_DIR, f"{key}.npz")
+
+
+def _parse_times(times):
+    """Horodatages PVGIS 'AAAAMMJJ:HHMM' -> (année, mois, jour, heure) en tableaux entiers."""
+    digits = np.asarray(times, dtype="U13").view(np.uint32).reshape(-1, 13).astype(np.int32) - ord("0")
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month = digits[:, 4] * 10 + digits[:, 5]
+    day = digits[:, 6] * 10 + digits[:, 7]
+    hour = digits[:, 9] * 10 + digits[:, 10]
+    return year, month, day, hour
+
+
+def _records_from_json(data):
+    hourly = data.get("outputs", {}).get("hourly", [])
+    times = [h["time"] for h in hourly]
+    columns = {name: np.array([h.get(src, np.nan) for h in hourly], dtype=np.float32)
+               for src, name in FIELDS.items() if hourly and src in hourly[0]}
+    return times, columns, data.get("inputs", {})
+
+
+def _records_from_csv(text):
+    """CSV PVGIS : en-têtes descriptifs, ligne 'time,...', données, puis notes de bas de fichier."""
+    lines = text.splitlines()
+    start = next((i for i, line in enumerate(lines) if line.startswith("time,")), None)
+    if start is None:
+        raise ValueError("Fichier CSV PVGIS sans ligne d'en-tête 'time,'")
+    body = []
+    for line in lines[start:]:
+        if not line.strip():
+            break
+        body.append(line)
+    rows = list(csv.reader(io.StringIO("\n".join(body))))
+    header, rows = rows[0], rows[1:]
+    times = [r[0] for r in rows]
+    columns = {}
+    for src, name in FIELDS.items():
+        if src in header:
+            j = header.index(src)
+            columns[name] = np.array([r[j] for r in rows], dtype=np.float32)
+    return times, columns, {}
+
+
+def typical_year(times, columns):
+    """Année type : moyenne de chaque heure calendaire (mois, jour, heure) sur toutes les années.
+    Le 29 février est ignoré ; retourne des tableaux float32 de 8760 valeurs."""
+    _, month, day, hour = _parse_times(times)
+    keep = ~((month == 2) & (day == 29))
+    # Jour de l'année sur une année non bissextile
+    cumul = np.array([0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334])
+    idx = ((cumul[month[keep] - 1] + day[keep] - 1) * 24 + hour[keep]).astype(np.int64)
+    counts = np.bincount(idx, minlength=HOURS_PER_YEAR)[:HOURS_PER_YEAR]
+    result = {}
+    for name, values in columns.items():
+        v = values[keep].astype(np.float64)
+        sums = np.bincount(idx, weights=np.nan_to_num(v), minlength=HOURS_PER_YEAR)[:HOURS_PER_YEAR]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[name] = np.where(counts > 0, sums / counts, np.nan).astype(np.float32)
+    return result
+
+
+def _store(key, times, columns, meta):
+    years, _, _, _ = _parse_times(times)
+    ty = typical_year(times, columns)
+    meta = {**meta, "key": key, "hours": len(times), "first": times[0], "last": times[-1],
+            "years": [int(years.min()), int(years.max())], "fields": sorted(columns)}
+    os.makedirs(SERIES_DIR, exist_ok=True)
+    arrays = {name: values.astype(np.float32) for name, values in columns.items()}
+    arrays.update({f"ty_{name}": values for name, values in ty.items()})
+    tmp = _path(key) + ".tmp.npz"
+    np.savez_compressed(tmp, meta=np.array(json.dumps(meta, ensure_ascii=False)), **arrays)
+    os.replace(tmp, _path(key))
+    load_site.cache_clear()
+    return meta
+
+
+def ingest_file(path, lat, lon, angle=0, aspect=0):
+    """Importe un fichier PVGIS seriescalc local (JSON ou CSV). Fonctionne sans réseau."""
+    with open(path, encoding="utf-8-sig") as f:
+        text = f.read()
+    if text.lstrip().startswith("{"):
+        times, columns, inputs = _records_from_json(json.loads(text))
+    else:
+        times, columns, inputs = _records_from_csv(text)
+    if not times:
+        raise ValueError(f"Aucune donnée horaire dans {path}")
+    key = site_key(lat, lon, angle, aspect)
+    return _store(key, times, columns, {"lat": float(lat), "lon": float(lon), "angle": angle, "aspect": aspect,
+                                        "source": os.path.basename(path), "inputs": inputs})
+
+
+def fetch_site(lat, lon, angle=0, aspect=0, raddatabase=RADDATABASE, startyear=START_YEAR, endyear=END_YEAR):
+    """Télécharge la série horaire PVGIS d'un site et l'enregistre (une fois par site)."""
+    params = {"lat": float(lat), "lon": float(lon), "angle": float(angle), "aspect": float(aspect),
+              "raddatabase": raddatabase, "startyear": startyear, "endyear": endyear,
+              "components": 0, "outputformat": "json"}
+    resp = http_client.get("pvgis_series", "seriescalc", params=params)
+    resp.raise_for_status()
+    times, columns, inputs = _records_from_json(resp.json())
+    if not times:
+        raise ValueError("Réponse PVGIS seriescalc sans données horaires")
+    key = site_key(lat, lon, angle, aspect)
+    return _store(key, times, columns, {"lat": float(lat), "lon": float(lon), "angle": angle, "aspect": aspect,
+                                        "source": "PVGIS seriescalc", "raddatabase": raddatabase,
+                                        "inputs": inputs})
+
+
+@lru_cache(maxsize=16)
+def load_site(key):
+    """Tableaux stockés d'un site ({nom: float32}) et métadonnées, ou None si non ingéré."""
+    try:
+        with np.load(_path(key)) as archive:
+            meta = json.loads(str(archive["meta"]))
+            arrays = {name: archive[name] for name in archive.files if name != "meta"}
+    except (OSError, ValueError, KeyError):
+        return None
+    for values in arrays.values():
+        values.setflags(write=False)  # tableaux partagés entre appelants via le cache
+    return arrays, meta
+
+
+def get_typical_year(lat, lon, angle=0, aspect=0, fetch=False):
+    """Année type horaire d'un site : {'g_poa': W/m², 't2m': °C, ...} (8760 valeurs float32).
+    fetch=True télécharge la série si le site n'a pas encore été ingéré ; sinon None."""
+    key = site_key(lat, lon, angle, aspect)
+    loaded = load_site(key)
+    if loaded is None and fetch:
+        fetch_site(lat, lon, angle, aspect)
+        loaded = load_site(key)
+    if loaded is None:
+        return None
+    arrays, _ = loaded
+    return {name[3:]: values for name, values in arrays.items() if name.startswith("ty_")}
+
+
+def get_series(lat, lon, angle=0, aspect=0):
+    """Série horaire complète stockée ({nom: float32}) et métadonnées, ou None."""
+    loaded = load_site(site_key(lat, lon, angle, aspect))
+    if loaded is None:
+        return None
+    arrays, meta = loaded
+    return {name: values for name, values in arrays.items() if not name.startswith("ty_")}, meta
+
+
+def list_sites():
+    """Métadonnées des sites déjà ingérés."""
+    if not os.path.isdir(SERIES_DIR):
+        return []
+    sites = []
+    for name in sorted(os.listdir(SERIES_DIR)):
+        if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+            loaded = load_site(name[:-4])
+            if loaded:
+                sites.append(loaded[1])
+    return sites
+
+
+def _option(name, default):
+    return float(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+
+if __name__ == "__main__":
+    commande = sys.argv[1] if len(sys.argv) > 1 else ""
+    if commande == "fetch" and len(sys.argv) >= 4:
+        print(fetch_site(float(sys.argv[2]), float(sys.argv[3]), _option("--angle", 0), _option("--aspect", 0)))
+    elif commande == "import" and len(sys.argv) >= 5:
+        print(ingest_file(sys.argv[2], float(sys.argv[3]), float(sys.argv[4]),
+                          _option("--angle", 0), _option("--aspect", 0)))
+    else:
+        print(__doc__)
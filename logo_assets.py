@@ -0,0 +1,138 @@
+"""
+Logo de l'entreprise pré-rastérisé pour les documents générés (DOCX, PDF)
+python-docx n'accepte pas le SVG : le logo est converti une fois en PNG aux largeurs utilisées,
+stocké à côté de l'application sous une clé dérivée de l'empreinte du SVG, puis servi en mémoire.
+Les PNG du logo actuel sont livrés dans assets/ ; un nouveau SVG est converti par svglib + reportlab
+(moteur rlPyCairo, requirements.txt) ou par cairosvg s'il est installé. Sans convertisseur, les
+documents gardent leur en-tête texte et l'erreur est journalisée.
+Régénération des PNG livrés après modification du SVG : python logo_assets.py --livrer
+"""
+
+import hashlib
+import io
+import logging
+import os
+import struct
+import sys
+import tempfile
+from functools import lru_cache
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+LOGO_SVG = os.path.join(APP_DIR, "logo-solaire.svg")
+ASSET_DIR = os.environ.get("ENERGIE_SOLAIRE_ASSETS", os.path.join(APP_DIR, ".cache", "assets"))
+# PNG pré-générés versionnés avec l'application (même nommage que le cache)
+BUNDLED_DIR = os.path.join(APP_DIR, "assets")
+
+# Largeurs en pixels : en-tête de document (≈ 1,6 po à 300 dpi) et impression pleine largeur
+LOGO_HEADER = 480
+LOGO_PRINT = 1200
+LOGO_WIDTHS = (LOGO_HEADER, LOGO_PRINT)
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def svg_hash(path=LOGO_SVG):
+    """Empreinte du fichier SVG (clé des PNG en cache). None si le fichier est absent."""
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()[:16]
+    except OSError:
+        return None
+
+
+def _png_path(width, path=LOGO_SVG, folder=None):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(folder or ASSET_DIR, f"{stem}-{svg_hash(path)}-{width}.png")
+
+
+def _rasterize(svg_bytes, width):
+    """PNG de `width` pixels de large, ou None si aucun convertisseur n'est installé."""
+    try:
+        import cairosvg
+        return cairosvg.svg2png(bytestring=svg_bytes, output_width=width)
+    except ImportError:
+        pass
+    try:
+        from svglib.svglib import svg2rlg
+        from reportlab.graphics import renderPM
+    except ImportError:
+        return None
+    drawing = svg2rlg(io.BytesIO(svg_bytes))
+    if drawing is None or not drawing.width:
+        return None
+    scale = width / drawing.width
+    drawing.scale(scale, scale)
+    drawing.width, drawing.height = drawing.width * scale, drawing.height * scale
+    return renderPM.drawToString(drawing, fmt="PNG")
+
+
+@lru_cache(maxsize=None)
+def logo_png(width=LOGO_HEADER, path=LOGO_SVG):
+    """Octets PNG du logo à la largeur demandée, convertis une seule fois par version du SVG.
+    Lecture disque au premier appel du processus, puis servis depuis la mémoire. None si indisponible."""
+    if svg_hash(path) is None:
+        return None
+    png_path = _png_path(width, path)
+    for candidate in (_png_path(width, path, BUNDLED_DIR), png_path):
+        try:
+            with open(candidate, "rb") as f:
+                return f.read()
+        except OSError:
+            pass
+    try:
+        with open(path, "rb") as f:
+            png = _rasterize(f.read(), width)
+    except Exception as e:
+        logger.warning("Conversion du logo %s en PNG (%s px) impossible : %s", path, width, e)
+        return None
+    if png is None:
+        logger.warning("Aucun convertisseur SVG installé (svglib + rlPyCairo, ou cairosvg) : logo %s non converti", path)
+        return None
+    try:
+        os.makedirs(ASSET_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=ASSET_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(png)
+        os.replace(tmp, png_path)
+    except OSError:
+        pass  # répertoire en lecture seule : le PNG reste servi depuis la mémoire
+    return png
+
+
+def png_size(png):
+    """(largeur, hauteur) en pixels lues dans l'en-tête IHDR d'un PNG."""
+    return struct.unpack(">II", png[16:24])
+
+
+def logo_dimensions(display_width, width=LOGO_HEADER):
+    """(largeur, hauteur) d'affichage du logo pour une largeur donnée (unités de l'appelant)."""
+    png = logo_png(width)
+    if not png:
+        return None
+    w, h = png_size(png)
+    return display_width, display_width * h / w
+
+
+def build_all(bundle=False):
+    """Génère les PNG de toutes les largeurs utilisées ; retourne les largeurs disponibles.
+    bundle=True écrit (ou remplace) les PNG livrés dans assets/ à partir du SVG courant."""
+    if not bundle:
+        return [w for w in LOGO_WIDTHS if logo_png(w)]
+    with open(LOGO_SVG, "rb") as f:
+        svg_bytes = f.read()
+    os.makedirs(BUNDLED_DIR, exist_ok=True)
+    widths = []
+    for w in LOGO_WIDTHS:
+        png = _rasterize(svg_bytes, w)
+        if png:
+            with open(_png_path(w, folder=BUNDLED_DIR), "wb") as f:
+                f.write(png)
+            widths.append(w)
+    return widths
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    widths = build_all(bundle="--livrer" in sys.argv)
+    print(f"Logo {svg_hash()} : {widths or 'aucun convertisseur SVG installé (svglib + rlPyCairo, ou cairosvg)'}")
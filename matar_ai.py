@@ -8,7 +8,7 @@ import pandas as pd
 from datetime import datetime
 import json
 import re
-from firebase_config import get_all_products_from_firebase, get_stock_movements_from_firebase
+from firebase_config import get_products_frame, get_stock_movements_from_firebase
 
 class MatarAI:
     def __init__(self):
@@ -20,24 +20,9 @@ class MatarAI:
             st.session_state.matar_chat_history = []
     
     def get_stock_data(self):
-        """Récupère les données de stock depuis Firebase"""
+        """Récupère le DataFrame produits partagé (lecture seule) depuis Firebase"""
         try:
-            products = get_all_products_from_firebase()
-            if products:
-                products_list = []
-                for product_id, product in products.items():
-                    products_list.append({
-                        'id': product_id,
-                        'nom': product.get('nom', ''),
-                        'categorie': product.get('categorie', ''),
-                        'prix_achat': product.get('prix_achat', 0),
-                        'prix_vente': product.get('prix_vente', 0),
-                        'stock_actuel': product.get('stock_actuel', product.get('quantite', 0)),
-                        'stock_min': product.get('stock_minimum', product.get('stock_min', 0)),
-                        'unite': product.get('unite', 'pièce')
-                    })
-                return pd.DataFrame(products_list)
-            return pd.DataFrame()
+            return get_products_frame()
         except Exception as e:
             st.error(f"Erreur lors du chargement des données: {e}")
             return pd.DataFrame()
@@ -88,7 +73,7 @@ class MatarAI:
         
         if found_products:
             for product in found_products:
-                response += f"• **{product['nom']}** : {product['stock_actuel']} {product['unite']} en stock\n"
+                response += f"• **{product['nom']}** : {product['stock_actuel']:g} {product['unite']} en stock\n"
                 if product['stock_actuel'] <= product['stock_min']:
                     response += f"  ⚠️ *Stock faible (minimum: {product['stock_min']})*\n"
         else:
@@ -128,7 +113,7 @@ class MatarAI:
             response += "🟡 **Stocks faibles :**\n"
             for _, product in low_stock.iterrows():
                 if product['stock_actuel'] > 0:
-                    response += f"• {product['nom']}: {product['stock_actuel']}/{product['stock_min']} {product['unite']}\n"
+                    response += f"• {product['nom']}: {product['stock_actuel']:g}/{product['stock_min']:g} {product['unite']}\n"
             response += "\n"
         
         if out_of_stock.empty and low_stock.empty:
@@ -147,9 +132,8 @@ class MatarAI:
         response += f"• **Valeur totale du stock (prix de vente)** : {total_value_vente:,.0f} FCFA\n"
         response += f"• **Marge potentielle** : {total_value_vente - total_value_achat:,.0f} FCFA\n\n"
         
-        # Top 5 produits par valeur
-        df['valeur_stock'] = df['stock_actuel'] * df['prix_achat']
-        top_products = df.nlargest(5, 'valeur_stock')
+        # Top 5 produits par valeur (colonne calculée sur une copie : df est partagé)
+        top_products = df.assign(valeur_stock=df['stock_actuel'] * df['prix_achat']).nlargest(5, 'valeur_stock')
         
         response += "**Top 5 produits par valeur en stock :**\n"
         for _, product in top_products.iterrows():
@@ -166,7 +150,7 @@ class MatarAI:
         response = "📈 **Vue d'ensemble du stock :**\n\n"
         response += f"• **Nombre total de produits** : {total_products}\n"
         response += f"• **Nombre de catégories** : {total_categories}\n"
-        response += f"• **Unités totales en stock** : {total_units}\n\n"
+        response += f"• **Unités totales en stock** : {total_units:g}\n\n"
         
         # Statistiques par catégorie
         response += "**Répartition par catégorie :**\n"
@@ -176,7 +160,7 @@ class MatarAI:
         }).round(2)
         
         for category, stats in category_stats.iterrows():
-            response += f"• {category}: {stats['nom']} produits, {stats['stock_actuel']} unités\n"
+            response += f"• {category}: {int(stats['nom'])} produits, {stats['stock_actuel']:g} unités\n"
         
         return response
     
@@ -195,7 +179,7 @@ class MatarAI:
             for product in found_products:
                 response += f"**{product['nom']}**\n"
                 response += f"• Catégorie: {product['categorie']}\n"
-                response += f"• Stock actuel: {product['stock_actuel']} {product['unite']}\n"
+                response += f"• Stock actuel: {product['stock_actuel']:g} {product['unite']}\n"
                 response += f"• Stock minimum: {product['stock_min']} {product['unite']}\n"
                 response += f"• Prix d'achat: {product['prix_achat']:,.0f} FCFA\n"
                 response += f"• Prix de vente: {product['prix_vente']:,.0f} FCFA\n"
@@ -0,0 +1,589 @@
+"""
+Mode hors ligne : réplique SQLite locale de Firestore et file d'envoi (outbox)
+- Lectures : chaque lecture Firestore réussie alimente la réplique ; en cas de coupure,
+  les lectures sont servies depuis la réplique (tables replica_* + documents JSON),
+  distincte des tables locales de Stock.py
+- Écritures : hors ligne, elles sont appliquées à la réplique et placées dans l'outbox ;
+  un fil d'arrière-plan les rejoue vers Firestore au retour de la connexion
+- Conflits : une modification hors ligne n'écrase pas un document modifié entre-temps
+  à distance (updated_at distant plus récent que la version de base) ; elle est mise
+  de côté avec le statut 'conflit' pour arbitrage par un administrateur
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import string
+import threading
+import time
+from datetime import datetime, timezone
+from sqlite_store import get_connection, transaction, migrate
+
+# Délai (s) avant de retenter Firestore après une erreur de connexion
+RETRY_SECONDS = 30
+# Intervalle (s) du fil de synchronisation de l'outbox
+SYNC_INTERVAL = 30
+# Au-delà, une opération en échec (hors coupure réseau) passe en statut 'erreur'
+MAX_TENTATIVES = 5
+
+# Collections répliquées dans des tables dédiées : (table, colonnes dérivées du document)
+_TABLES = {
+    'stock_products': ('replica_produits', ('nom', 'categorie', 'prix_achat', 'prix_vente', 'stock_actuel', 'stock_min', 'unite')),
+    'stock_clients': ('replica_clients', ('nom', 'telephone', 'adresse', 'email')),
+    'stock_invoices': ('replica_factures', ('numero', 'date', 'client_nom', 'montant_total', 'type', 'statut')),
+    'stock_movements': ('replica_mouvements', ('date', 'produit_id', 'produit_nom', 'type', 'quantite', 'reference')),
+}
+# Champs du produit tenus par le journal de stock (jamais source de conflit d'édition)
+_LEDGER_FIELDS = {'stock_actuel', 'ledger_seq', 'updated_at', 'created_at'}
+
+_ID_ALPHABET = string.ascii_letters + string.digits
+
+
+class ConflitSynchronisation(Exception):
+    """Le document distant a été modifié depuis la version de base de l'opération."""
+
+
+# --- État de connexion ---
+
+_etat = {'hors_ligne_jusqua': 0.0, 'derniere_erreur': None}
+_reveil = threading.Event()
+
+
+def _mode_force():
+    return os.environ.get("ENERGIE_SOLAIRE_OFFLINE", "").lower() in ("1", "true", "oui")
+
+
+def is_offline():
+    """Vrai si Firestore est considéré injoignable (coupure récente ou mode forcé)."""
+    return _mode_force() or time.monotonic() < _etat['hors_ligne_jusqua']
+
+
+def mark_offline(error=None):
+    _etat['hors_ligne_jusqua'] = time.monotonic() + RETRY_SECONDS
+    _etat['derniere_erreur'] = str(error) if error else None
+
+
+def mark_online():
+    was_offline = _etat['hors_ligne_jusqua'] > 0
+    _etat['hors_ligne_jusqua'] = 0.0
+    _etat['derniere_erreur'] = None
+    if was_offline:
+        _reveil.set()  # pousser l'outbox sans attendre le prochain cycle
+
+
+def is_connectivity_error(error):
+    """Erreur de réseau / service indisponible (par opposition à une erreur de données)."""
+    if isinstance(error, (ConnectionError, TimeoutError, OSError)):
+        return True
+    try:
+        from google.api_core import exceptions as gexc
+        if isinstance(error, (gexc.ServiceUnavailable, gexc.DeadlineExceeded, gexc.RetryError)):
+            return True
+    except ImportError:
+        pass
+    try:
+        from google.auth.exceptions import TransportError
+        if isinstance(error, TransportError):
+            return True
+    except ImportError:
+        pass
+    return False
+
+
+def get_status():
+    """Résumé pour l'interface : hors ligne, dernière erreur, opérations en attente / en conflit."""
+    migrate()
+    counts = dict(get_connection().execute(
+        "SELECT statut, COUNT(*) FROM outbox GROUP BY statut").fetchall())
+    return {
+        'hors_ligne': is_offline(),
+        'derniere_erreur': _etat['derniere_erreur'],
+        'en_attente': counts.get('en_attente', 0),
+        'conflits': counts.get('conflit', 0),
+        'erreurs': counts.get('erreur', 0),
+    }
+
+
+# --- Réplique ---
+
+def new_doc_id():
+    """Identifiant au format Firestore (20 caractères), attribué localement hors ligne."""
+    return ''.join(secrets.choice(_ID_ALPHABET) for _ in range(20))
+
+
+def now_iso():
+    return _iso(datetime.now(timezone.utc))
+
+
+def _json_default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(data):
+    return json.dumps(data, default=_json_default, ensure_ascii=False)
+
+
+def _iso(value):
+    if value is None:
+        return None
+    if hasattr(value, 'isoformat'):
+        if getattr(value, 'tzinfo', None) is None:
+            value = value.replace(tzinfo=timezone.utc)
+        # Format fixe (microsecondes incluses) : les dates se comparent comme des chaînes
+        return value.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+    if isinstance(value, str):
+        return value
+    return None  # ex: SERVER_TIMESTAMP pas encore résolu
+
+
+def _parse_iso(value):
+    if not value:
+        return None
+    if hasattr(value, 'tzinfo'):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _columns(collection, data):
+    """Valeurs des colonnes Stock.py dérivées d'un document Firestore."""
+    if collection == 'stock_products':
+        stock = data.get('stock_actuel', data.get('quantite', 0))
+        stock_min = data.get('stock_minimum', data.get('stock_min', 0))
+        return (data.get('nom', ''), data.get('categorie'), data.get('prix_achat'), data.get('prix_vente'),
+                stock, stock_min, data.get('unite'))
+    if collection == 'stock_clients':
+        return (data.get('nom', ''), data.get('telephone'), data.get('adresse'), data.get('email'))
+    if collection == 'stock_invoices':
+        client = data.get('client')
+        client_nom = data.get('client_nom') or (client.get('nom') if isinstance(client, dict) else client)
+        return (data.get('numero'), data.get('date'), client_nom,
+                data.get('montant_total', data.get('total_ttc')), data.get('type'), data.get('statut'))
+    # stock_movements : produit_id = identifiant Firestore du produit
+    return (_iso(data.get('created_at')) or data.get('date'), data.get('produit_id'), data.get('produit_nom'),
+            data.get('type'), data.get('quantite'), data.get('reference'))
+
+
+def _version(data, donnees=None):
+    """Version d'un document : sa date de modification, sinon une empreinte de son contenu."""
+    updated_at = _iso(data.get('updated_at')) or _iso(data.get('created_at'))
+    if updated_at:
+        return updated_at
+    return hashlib.sha1((donnees or _dumps(data)).encode('utf-8')).hexdigest()
+
+
+def _upsert(conn, collection, doc_id, data):
+    """Insère ou remplace un document dans la réplique (dans la transaction courante)."""
+    updated_at = _iso(data.get('updated_at')) or _iso(data.get('created_at'))
+    donnees = _dumps(data)
+    version = _version(data, donnees)
+    if collection not in _TABLES:
+        conn.execute('''INSERT INTO documents_replica (collection, doc_id, donnees, updated_at, version)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(collection, doc_id) DO UPDATE SET
+                        donnees=excluded.donnees, updated_at=excluded.updated_at, version=excluded.version''',
+                     (collection, doc_id, donnees, updated_at, version))
+        return
+    table, cols = _TABLES[collection]
+    conn.execute(f"INSERT OR REPLACE INTO {table} (firebase_id, updated_at, version, donnees, {', '.join(cols)}) "
+                 f"VALUES (?, ?, ?, ?, {', '.join('?' * len(cols))})",
+                 [doc_id, updated_at, version, donnees, *_columns(collection, data)])
+
+
+def _versions(conn, collection):
+    """Version répliquée de chaque document : {doc_id: version} (sans relire les documents)."""
+    if collection in _TABLES:
+        rows = conn.execute(f"SELECT firebase_id, version FROM {_TABLES[collection][0]}")
+    else:
+        rows = conn.execute("SELECT doc_id, version FROM documents_replica WHERE collection=?", (collection,))
+    return dict(rows)
+
+
+def _pending_doc_ids(conn):
+    """Documents ayant des écritures locales non encore poussées (à ne pas écraser)."""
+    pending = set()
+    for collection, operation, doc_id, payload in conn.execute(
+            "SELECT collection, operation, doc_id, payload FROM outbox WHERE statut IN ('en_attente', 'conflit')"):
+        pending.add((collection, doc_id))
+        if operation == 'mouvement':
+            pending.add(('stock_products', json.loads(payload).get('product_id')))
+    return pending
+
+
+def replicate(collection, docs, complete=False):
+    """Copie dans la réplique des documents lus dans Firestore ({doc_id: données}).
+    complete=True : docs est la collection entière, les documents disparus sont retirés.
+    Les versions répliquées sont comparées hors transaction : une lecture sans changement
+    ne prend pas le verrou d'écriture, et seuls les documents modifiés sont réécrits.
+    Les documents portant des écritures locales en attente sont laissés tels quels.
+    """
+    try:
+        migrate()
+        known = _versions(get_connection(), collection)
+        changed = {doc_id: data or {} for doc_id, data in docs.items()
+                   if known.get(doc_id) != _version(data or {})}
+        stale = [d for d in known if d not in docs] if complete else []
+        if not changed and not stale:
+            return
+        with transaction() as conn:
+            pending = _pending_doc_ids(conn)
+            for doc_id, data in changed.items():
+                if (collection, doc_id) not in pending:
+                    _upsert(conn, collection, doc_id, data)
+            stale = [d for d in stale if (collection, d) not in pending]
+            if collection in _TABLES:
+                conn.executemany(f"DELETE FROM {_TABLES[collection][0]} WHERE firebase_id=?",
+                                 [(d,) for d in stale])
+            else:
+                conn.executemany("DELETE FROM documents_replica WHERE collection=? AND doc_id=?",
+                                 [(collection, d) for d in stale])
+    except Exception:
+        # La réplique ne doit jamais faire échouer une lecture en ligne
+        pass
+
+
+def read_collection(collection):
+    """Documents répliqués d'une collection : {doc_id: données}."""
+    migrate()
+    conn = get_connection()
+    if collection in _TABLES:
+        rows = conn.execute(f"SELECT firebase_id, donnees FROM {_TABLES[collection][0]}")
+    else:
+        rows = conn.execute("SELECT doc_id, donnees FROM documents_replica WHERE collection=?", (collection,))
+    return {doc_id: json.loads(donnees or '{}') for doc_id, donnees in rows}
+
+
+def read_document(collection, doc_id):
+    """Document répliqué, ou None."""
+    migrate()
+    conn = get_connection()
+    if collection in _TABLES:
+        row = conn.execute(f"SELECT donnees FROM {_TABLES[collection][0]} WHERE firebase_id=?",
+                           (doc_id,)).fetchone()
+    else:
+        row = conn.execute("SELECT donnees FROM documents_replica WHERE collection=? AND doc_id=?",
+                           (collection, doc_id)).fetchone()
+    return json.loads(row[0]) if row and row[0] else None
+
+
+def query_movements(start=None, end=None, product_id=None, types=None, limit=500, start_after=None):
+    """Mouvements répliqués filtrés comme query_stock_movements : [(id, données)] par date décroissante."""
+    migrate()
+    sql = ["SELECT m.firebase_id, m.donnees FROM replica_mouvements m WHERE 1=1"]
+    params = []
+    if product_id:
+        sql.append("AND m.produit_id = ?")
+        params.append(product_id)
+    if types:
+        sql.append(f"AND m.type IN ({', '.join('?' * len(types))})")
+        params.extend(types)
+    for op, value in (('>=', start), ('<', end)):
+        if value is not None:
+            sql.append(f"AND m.date {op} ?")
+            params.append(_iso(value))
+    if start_after is not None:
+        # Curseur (date, id) : même ordre que la requête Firestore (created_at puis id décroissants)
+        after_date, after_id = start_after
+        sql.append("AND (m.date < ? OR (m.date = ? AND m.firebase_id < ?))")
+        params.extend([_iso(after_date), _iso(after_date), after_id])
+    sql.append("ORDER BY m.date DESC, m.firebase_id DESC")
+    if limit:
+        sql.append("LIMIT ?")
+        params.append(max(1, int(limit)))
+    rows = get_connection().execute(' '.join(sql), params)
+    return [(doc_id, json.loads(donnees or '{}')) for doc_id, donnees in rows]
+
+
+# --- Écritures locales ---
+
+def _enqueue(conn, collection, operation, doc_id, payload, base_updated_at=None):
+    if operation == 'update':
+        # Regrouper avec une modification en attente du même document (même version de base)
+        row = conn.execute('''SELECT id, payload FROM outbox WHERE statut='en_attente' AND operation IN ('create', 'update')
+                              AND collection=? AND doc_id=? ORDER BY id DESC LIMIT 1''',
+                           (collection, doc_id)).fetchone()
+        if row is not None:
+            merged = json.loads(row[1])
+            merged['data'].update(payload['data'])
+            for k, v in payload.get('base', {}).items():
+                merged.setdefault('base', {}).setdefault(k, v)
+            conn.execute("UPDATE outbox SET payload=? WHERE id=?", (_dumps(merged), row[0]))
+            return row[0]
+    cur = conn.execute('''INSERT INTO outbox (collection, operation, doc_id, payload, base_updated_at, created_at)
+                          VALUES (?, ?, ?, ?, ?, ?)''',
+                       (collection, operation, doc_id, _dumps(payload), base_updated_at, now_iso()))
+    return cur.lastrowid
+
+
+def create_local(collection, data, replicate=True, doc_id=None):
+    """Crée un document hors ligne (réplique + outbox). Retourne l'identifiant attribué.
+    replicate=False : document seulement mis en file (ex: journal d'audit).
+    doc_id : identifiant déjà tiré par l'appelant (new_doc_id)."""
+    doc_id = doc_id or new_doc_id()
+    data = {**data, 'created_at': now_iso()}
+    data.pop('updated_at', None)
+    migrate()
+    with transaction() as conn:
+        if replicate:
+            _upsert(conn, collection, doc_id, data)
+        _enqueue(conn, collection, 'create', doc_id, {'data': data})
+    return doc_id
+
+
+def update_local(collection, doc_id, changes):
+    """Modifie un document hors ligne. La version répliquée sert de base de détection de conflit."""
+    changes = {k: v for k, v in changes.items() if k not in ('updated_at', 'created_at')}
+    migrate()
+    with transaction() as conn:
+        current = read_document(collection, doc_id)
+        if current is None:
+            raise ValueError(f"Document introuvable hors ligne: {collection}/{doc_id}")
+        base = {k: current.get(k) for k in changes}
+        _upsert(conn, collection, doc_id, {**current, **changes})
+        _enqueue(conn, collection, 'update', doc_id, {'data': changes, 'base': base},
+                 base_updated_at=_iso(current.get('updated_at')))
+    return True
+
+
+def delete_local(collection, doc_id):
+    migrate()
+    with transaction() as conn:
+        current = read_document(collection, doc_id)
+        if collection in _TABLES:
+            conn.execute(f"DELETE FROM {_TABLES[collection][0]} WHERE firebase_id=?", (doc_id,))
+        else:
+            conn.execute("DELETE FROM documents_replica WHERE collection=? AND doc_id=?", (collection, doc_id))
+        base_updated_at = _iso((current or {}).get('updated_at'))
+        _enqueue(conn, collection, 'delete', doc_id, {}, base_updated_at=base_updated_at)
+    return True
+
+
+def record_movement_local(product_id, type_mouvement, quantite, delta, motif='', reference='',
+                          utilisateur='', allow_negative=False):
+    """Mouvement de stock hors ligne : projection locale mise à jour, rejoué plus tard
+    dans le journal Firestore (record_stock_movement) avec le même identifiant."""
+    movement_id = new_doc_id()
+    migrate()
+    with transaction() as conn:
+        product = read_document('stock_products', product_id)
+        if product is None:
+            raise ValueError(f"Produit introuvable: {product_id}")
+        stock_avant = product.get('stock_actuel', product.get('quantite', 0)) or 0
+        stock_apres = stock_avant + delta
+        if stock_apres < 0 and not allow_negative:
+            raise ValueError(f"Stock insuffisant pour {product.get('nom', product_id)}: {stock_avant}")
+        now = now_iso()
+        movement = {
+            'produit_id': product_id,
+            'produit_nom': product.get('nom', ''),
+            'type': type_mouvement,
+            'quantite': quantite,
+            'delta': delta,
+            'stock_avant': stock_avant,
+            'stock_apres': stock_apres,
+            'motif': motif or '',
+            'reference': reference or '',
+            'date': now,
+            'utilisateur': utilisateur or '',
+            'created_at': now,
+            'hors_ligne': True
+        }
+        # updated_at inchangé : il reste la version distante connue du produit
+        _upsert(conn, 'stock_products', product_id, {**product, 'stock_actuel': stock_apres})
+        _upsert(conn, 'stock_movements', movement_id, movement)
+        _enqueue(conn, 'stock_movements', 'mouvement', movement_id, {
+            'product_id': product_id,
+            'type_mouvement': type_mouvement,
+            'quantite': quantite,
+            'motif': motif or '',
+            'reference': reference or '',
+            'utilisateur': utilisateur or '',
+        })
+    return {**movement, 'id': movement_id}
+
+
+# --- Synchronisation ---
+
+def _is_conflict(remote, payload, base_updated_at):
+    """Conflit si le document distant a changé depuis la base ET qu'un champ modifié
+    localement a aussi changé à distance (les champs du journal de stock sont ignorés)."""
+    remote_updated = _parse_iso(remote.get('updated_at'))
+    base_updated = _parse_iso(base_updated_at)
+    if remote_updated is None or base_updated is None or remote_updated <= base_updated:
+        return False
+    base = payload.get('base', {})
+    return any(remote.get(k) != base.get(k) for k in payload.get('data', {}) if k not in _LEDGER_FIELDS)
+
+
+def _push(db, entry, force=False):
+    """Rejoue une opération de l'outbox vers Firestore (idempotent : identifiants attribués localement)."""
+    from firebase_admin import firestore
+    import firebase_config
+
+    collection, operation, doc_id = entry['collection'], entry['operation'], entry['doc_id']
+    payload = entry['payload']
+    ref = db.collection(collection).document(doc_id)
+    if operation == 'create' and collection == 'stock_invoices' and payload['data'].get('numero_provisoire'):
+        # Numéro définitif réservé sur le compteur distant au moment du rejeu
+        firebase_config.create_invoice(db, payload['data'], invoice_id=doc_id)
+        return
+    if operation == 'create':
+        data = dict(payload['data'])
+        if 'timestamp' in data:
+            data['timestamp'] = _parse_iso(data['timestamp'])  # horodatage local d'origine
+        data['created_at'] = firestore.SERVER_TIMESTAMP
+        data['updated_at'] = firestore.SERVER_TIMESTAMP
+        ref.set(data)
+        return
+    if operation == 'mouvement':
+        # Le journal recalcule stock_avant / stock_apres sur le niveau distant ; une vente
+        # réalisée hors ligne est toujours enregistrée, même si le stock devient négatif
+        firebase_config.apply_stock_movement(
+            db, payload['product_id'], payload['type_mouvement'], payload['quantite'],
+            motif=payload.get('motif', ''), reference=payload.get('reference', ''),
+            utilisateur=payload.get('utilisateur', ''), allow_negative=True, movement_id=doc_id)
+        return
+
+    @firestore.transactional
+    def _apply(tx):
+        snap = ref.get(transaction=tx)
+        if not snap.exists:
+            if operation == 'delete':
+                return
+            raise ConflitSynchronisation("document supprimé à distance")
+        remote = snap.to_dict() or {}
+        if not force:
+            if operation == 'delete':
+                remote_updated = _parse_iso(remote.get('updated_at'))
+                base_updated = _parse_iso(entry['base_updated_at'])
+                if remote_updated and base_updated and remote_updated > base_updated:
+                    raise ConflitSynchronisation("document modifié à distance avant la suppression")
+            elif _is_conflict(remote, payload, entry['base_updated_at']):
+                raise ConflitSynchronisation("document modifié à distance depuis la dernière synchronisation")
+        if operation == 'delete':
+            tx.delete(ref)
+        else:
+            tx.update(ref, {**payload['data'], 'updated_at': firestore.SERVER_TIMESTAMP})
+
+    _apply(db.transaction())
+
+
+def _load_entries(statuts=('en_attente',), entry_id=None):
+    migrate()
+    conn = get_connection()
+    if entry_id is not None:
+        rows = conn.execute("SELECT * FROM outbox WHERE id=?", (entry_id,))
+    else:
+        rows = conn.execute(f"SELECT * FROM outbox WHERE statut IN ({', '.join('?' * len(statuts))}) ORDER BY id",
+                            statuts)
+    names = [d[0] for d in rows.description]
+    entries = []
+    for row in rows.fetchall():
+        entry = dict(zip(names, row))
+        entry['payload'] = json.loads(entry['payload'] or '{}')
+        entries.append(entry)
+    return entries
+
+
+def _set_statut(entry_id, statut, erreur=None, tentative=False):
+    with transaction() as conn:
+        conn.execute("UPDATE outbox SET statut=?, erreur=?, tentatives=tentatives+? WHERE id=?",
+                     (statut, erreur, 1 if tentative else 0, entry_id))
+
+
+_sync_lock = threading.Lock()
+
+
+def sync_outbox(db=None):
+    """Pousse les opérations en attente vers Firestore, dans l'ordre.
+    S'arrête à la première erreur de connexion (l'ordre des opérations est préservé).
+    Retourne (poussées, conflits, erreurs).
+    """
+    import firebase_config
+
+    if not _sync_lock.acquire(blocking=False):
+        return 0, 0, 0  # synchronisation déjà en cours
+    pushed = conflicts = errors = 0
+    try:
+        entries = _load_entries()
+        if not entries:
+            return 0, 0, 0
+        db = db or firebase_config.init_firebase_admin()
+        if db is None:
+            return 0, 0, 0
+        for entry in entries:
+            try:
+                _push(db, entry)
+            except ConflitSynchronisation as e:
+                _set_statut(entry['id'], 'conflit', str(e))
+                conflicts += 1
+            except Exception as e:
+                if is_connectivity_error(e):
+                    mark_offline(e)
+                    break
+                statut = 'erreur' if entry['tentatives'] + 1 >= MAX_TENTATIVES else 'en_attente'
+                _set_statut(entry['id'], statut, str(e), tentative=True)
+                errors += 1
+            else:
+                with transaction() as conn:
+                    conn.execute("DELETE FROM outbox WHERE id=?", (entry['id'],))
+                pushed += 1
+                mark_online()
+        if pushed:
+            firebase_config.clear_stock_cache()
+        return pushed, conflicts, errors
+    finally:
+        _sync_lock.release()
+
+
+def get_conflicts():
+    """Opérations en conflit ou en erreur, pour arbitrage dans l'interface d'administration."""
+    return _load_entries(statuts=('conflit', 'erreur'))
+
+
+def resolve_conflict(entry_id, keep='local'):
+    """keep='local' : la modification locale écrase le document distant ;
+    keep='distant' : la modification locale est abandonnée (la réplique sera rafraîchie)."""
+    import firebase_config
+
+    entries = _load_entries(entry_id=entry_id)
+    if not entries:
+        return False
+    entry = entries[0]
+    if keep == 'local':
+        _push(firebase_config.init_firebase_admin(), entry, force=True)
+    with transaction() as conn:
+        conn.execute("DELETE FROM outbox WHERE id=?", (entry_id,))
+    firebase_config.clear_stock_cache()
+    return True
+
+
+def _sync_loop():
+    while True:
+        _reveil.wait(SYNC_INTERVAL)
+        _reveil.clear()
+        try:
+            if not _mode_force():
+                sync_outbox()
+        except Exception:
+            pass
+
+
+_sync_thread = None
+_sync_thread_lock = threading.Lock()
+
+
+def start_background_sync():
+    """Démarre (une fois par processus) le fil qui vide l'outbox quand la connexion revient."""
+    global _sync_thread
+    with _sync_thread_lock:
+        if _sync_thread is None or not _sync_thread.is_alive():
+            _sync_thread = threading.Thread(target=_sync_loop, name="outbox-sync", daemon=True)
+            _sync_thread.start()
+    return _sync_thread
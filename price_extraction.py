@@ -0,0 +1,172 @@
+"""
+Extraction du prix d'une page produit de la boutique (WooCommerce)
+Par ordre de fiabilité :
+1. données structurées JSON-LD (Product -> offers.price / lowPrice)
+2. balisage WooCommerce du prix principal (<p class="price">, prix promo <ins> prioritaire)
+3. méta OpenGraph product:price:amount
+4. repli : recherche plein texte des montants « ... FCFA » (ancienne méthode, plus grand montant plausible)
+Les expressions régulières sont compilées une fois à l'import.
+Banc d'essai : python price_extraction.py bench [dossier_fixtures]
+"""
+
+import html
+import json
+import os
+import re
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(APP_DIR, "fixtures", "prix")
+
+PRIX_MIN, PRIX_MAX = 1000, 20000000
+
+_PRODUCT_URL = re.compile(r'href="(https?://[^"]*solairesenegal\.com/(?:produit|product)/[^"]+)"', re.IGNORECASE)
+_JSON_LD = re.compile(r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+                      re.IGNORECASE | re.DOTALL)
+_MAIN_PRICE = re.compile(r'<p[^>]*class="(?:[^"]*\s)?price(?:\s[^"]*)?"[^>]*>(.*?)</p>', re.IGNORECASE | re.DOTALL)
+_AMOUNT = re.compile(r'class="woocommerce-Price-amount amount"[^>]*>(.*?)<span[^>]*woocommerce-Price-currencySymbol',
+                     re.IGNORECASE | re.DOTALL)
+_OG_PRICE = re.compile(r'<meta[^>]+property=["\']product:price:amount["\'][^>]+content=["\']([^"\']+)["\']',
+                       re.IGNORECASE)
+_FULL_TEXT = re.compile(r'([0-9]{3,9}(?:[\s.,][0-9]{3})*)\s*(?:FCFA|F\s*CFA|CFA)', re.IGNORECASE)
+_TAGS = re.compile(r'<[^>]+>')
+_SPACES = re.compile(r'\s')
+_DECIMALS = re.compile(r'[.,]\d{1,2}$')
+_NON_DIGITS = re.compile(r'[^0-9]')
+
+
+def parse_amount(fragment):
+    """Montant entier en FCFA d'un fragment HTML de prix ('210&nbsp;759', '1.345.883', '49 174,00')."""
+    text = html.unescape(_TAGS.sub("", fragment)).strip()
+    text = _DECIMALS.sub("", _SPACES.sub("", text))
+    digits = _NON_DIGITS.sub("", text)
+    return int(digits) if digits else None
+
+
+def find_product_url(page):
+    """Premier lien de fiche produit de la boutique dans une page (résultats de recherche, liste)."""
+    m = _PRODUCT_URL.search(page)
+    return m.group(1) if m else None
+
+
+def current_amount(fragment):
+    """Prix courant d'un bloc de prix WooCommerce : prix promo (<ins>) si présent, sinon premier montant."""
+    ins = fragment.find("<ins")
+    amounts = _AMOUNT.findall(fragment[ins:] if ins >= 0 else fragment)
+    return parse_amount(amounts[0]) if amounts else None
+
+
+def _number(value):
+    """Prix JSON-LD ('49174', '49174.00', 49174) -> entier."""
+    try:
+        return int(round(float(str(value).replace(" ", "").replace(",", "."))))
+    except (TypeError, ValueError):
+        return None
+
+
+def _ld_products(data):
+    if isinstance(data, list):
+        for item in data:
+            yield from _ld_products(item)
+    elif isinstance(data, dict):
+        if "@graph" in data:
+            yield from _ld_products(data["@graph"])
+        types = data.get("@type")
+        if types == "Product" or (isinstance(types, list) and "Product" in types):
+            yield data
+
+
+def _from_json_ld(page):
+    for block in _JSON_LD.findall(page):
+        try:
+            data = json.loads(block.strip())
+        except ValueError:
+            continue
+        for product in _ld_products(data):
+            offers = product.get("offers")
+            for offer in (offers if isinstance(offers, list) else [offers]):
+                if not isinstance(offer, dict):
+                    continue
+                spec = offer.get("priceSpecification")
+                spec = spec[0] if isinstance(spec, list) and spec else spec
+                for value in (offer.get("price"), offer.get("lowPrice"),
+                              spec.get("price") if isinstance(spec, dict) else None):
+                    prix = _number(value)
+                    if prix:
+                        return prix
+    return None
+
+
+def _from_woocommerce(page):
+    m = _MAIN_PRICE.search(page)
+    return current_amount(m.group(1)) if m else None
+
+
+def _from_meta(page):
+    m = _OG_PRICE.search(page)
+    return _number(m.group(1)) if m else None
+
+
+def extract_full_text(page):
+    """Ancienne méthode : plus grand montant « ... FCFA » plausible de toute la page."""
+    vals = []
+    for candidate in _FULL_TEXT.findall(page):
+        digits = _NON_DIGITS.sub("", candidate)
+        if digits:
+            vals.append(int(digits))
+    plausible = [v for v in vals if PRIX_MIN <= v <= PRIX_MAX]
+    return max(plausible) if plausible else (max(vals) if vals else None)
+
+
+_METHODS = (("json-ld", _from_json_ld), ("woocommerce", _from_woocommerce), ("meta", _from_meta),
+            ("texte", extract_full_text))
+
+
+def extract_price(page):
+    """(prix en FCFA, méthode) du produit principal de la page ; (None, None) si aucun prix."""
+    for name, method in _METHODS:
+        prix = method(page)
+        if prix:
+            return prix, name
+    return None, None
+
+
+# --- Banc d'essai sur pages enregistrées ---
+
+def load_fixtures(folder=FIXTURES_DIR):
+    """[(fichier, html, prix attendu)] d'après attendus.json du dossier."""
+    with open(os.path.join(folder, "attendus.json"), encoding="utf-8") as f:
+        attendus = json.load(f)
+    fixtures = []
+    for name, prix in sorted(attendus.items()):
+        with open(os.path.join(folder, name), encoding="utf-8") as f:
+            fixtures.append((name, f.read(), prix))
+    return fixtures
+
+
+def benchmark(folder=FIXTURES_DIR, repeat=200):
+    """Exactitude et temps moyen d'analyse par page : extraction structurée vs ancienne méthode."""
+    fixtures = load_fixtures(folder)
+    resultats = {}
+    for label, fn in (("structurée", lambda p: extract_price(p)[0]), ("plein texte", extract_full_text)):
+        justes = sum(1 for _, page, attendu in fixtures if fn(page) == attendu)
+        debut = time.perf_counter()
+        for _ in range(repeat):
+            for _, page, _ in fixtures:
+                fn(page)
+        duree = (time.perf_counter() - debut) / (repeat * len(fixtures))
+        resultats[label] = {"justes": justes, "total": len(fixtures), "ms_par_page": round(duree * 1000, 4)}
+    details = [(name, attendu, *extract_price(page), extract_full_text(page)) for name, page, attendu in fixtures]
+    return resultats, details
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        resultats, details = benchmark(sys.argv[2] if len(sys.argv) > 2 else FIXTURES_DIR)
+        for name, attendu, prix, methode, ancien in details:
+            print(f"{name:<32} attendu {attendu:>9}  structurée {prix!s:>9} ({methode})  plein texte {ancien!s:>9}")
+        for label, r in resultats.items():
+            print(f"{label:<12} {r['justes']}/{r['total']} justes, {r['ms_par_page']} ms/page")
+    else:
+        print("Usage : python price_extraction.py bench [dossier_fixtures]")
@@ -0,0 +1,321 @@
+"""
+Index local des prix de la boutique en ligne (energiesolairesenegal.com)
+- indexation du catalogue complet : pages de liste produits WooCommerce, nom -> prix -> URL
+- stockage SQLite (table prix_boutique), horodaté, avec le prix précédent de chaque produit
+- rapprochement des produits avec les articles de PRIX_EQUIPEMENTS (puissance, capacité, tension...)
+- écarts de prix à valider par un administrateur avant mise à jour des prix de l'application
+- lecture O(1) pour les devis, sans appel réseau
+Ligne de commande (aperçu du catalogue, sans enregistrement) : python price_index.py crawl
+"""
+
+import html
+import re
+import sys
+import threading
+import time
+import unicodedata
+from datetime import datetime, timezone
+
+import http_client
+from price_extraction import current_amount
+from sqlite_store import get_connection, transaction, migrate
+
+# Pages de liste du catalogue (WooCommerce, indépendant du slug de la page boutique)
+CATALOG_PATH = "?post_type=product&paged={page}"
+MAX_PAGES = 100
+PAGE_DELAY = 0.5
+# Réindexation quotidienne ; l'index reste lu en mémoire quelques minutes entre deux relectures
+CRAWL_INTERVAL = 24 * 3600
+INDEX_TTL = 300
+# Score minimal de rapprochement produit / article
+MATCH_THRESHOLD = 0.6
+
+CATEGORY_WORDS = {
+    "panneaux": ("panneau", "panneaux", "module"),
+    "batteries": ("batterie", "batteries"),
+    "onduleurs": ("onduleur", "onduleurs", "convertisseur"),
+    "regulateurs": ("regulateur", "regulateurs", "controleur"),
+}
+
+_PRODUCT_START = re.compile(r'<(?:li|div)\b[^>]*class="[^"]*\btype-product\b[^"]*"', re.IGNORECASE)
+_PRODUCT_URL = re.compile(r'href="(https?://[^"]+/(?:produit|product)/[^"]+)"', re.IGNORECASE)
+_PRODUCT_TITLE = re.compile(r'class="[^"]*woocommerce-loop-product__title[^"]*"[^>]*>(.*?)</', re.IGNORECASE | re.DOTALL)
+_PRODUCT_HEADING = re.compile(r'<h[23][^>]*>(.*?)</h[23]>', re.IGNORECASE | re.DOTALL)
+_PRICE_BLOCK = re.compile(r'class="price"', re.IGNORECASE)
+_TAGS = re.compile(r'<[^>]+>')
+_UNIT_SPACE = re.compile(r'(\d)\s+(kwh|kva|kw|wc|ah|va|w|v|a)\b')
+_TOKENS = re.compile(r'[a-z0-9][a-z0-9./]*')
+
+_index_cache = None
+_index_lock = threading.Lock()
+# Signature du catalogue contre lequel la table a été rapprochée en dernier (None = inconnue)
+_matched_signature = None
+
+
+# --- Analyse des pages de liste ---
+
+def _listing_price(block):
+    """Prix courant d'une vignette produit (prix promo prioritaire)."""
+    m = _PRICE_BLOCK.search(block)
+    return current_amount(block[m.end():]) if m else None
+
+
+def parse_listing(page_html):
+    """Produits d'une page de liste : [{'nom', 'prix', 'url'}] (produits sans prix ignorés)."""
+    starts = [m.start() for m in _PRODUCT_START.finditer(page_html)]
+    produits = []
+    for i, start in enumerate(starts):
+        block = page_html[start:starts[i + 1] if i + 1 < len(starts) else len(page_html)]
+        url = _PRODUCT_URL.search(block)
+        title = _PRODUCT_TITLE.search(block) or _PRODUCT_HEADING.search(block)
+        prix = _listing_price(block)
+        if url and title and prix:
+            nom = " ".join(html.unescape(_TAGS.sub("", title.group(1))).split())
+            produits.append({"nom": nom, "prix": prix, "url": url.group(1)})
+    return produits
+
+
+def crawl_catalog(max_pages=MAX_PAGES, delay=PAGE_DELAY):
+    """Parcourt les pages de liste de la boutique ; retourne les produits dédoublonnés par URL.
+    Arrêt sur page vide, page déjà vue (redirection hors plage) ou réponse non 200."""
+    produits = {}
+    for page in range(1, max_pages + 1):
+        resp = http_client.get("boutique", CATALOG_PATH.format(page=page))
+        if resp.status_code != 200:
+            break
+        trouves = parse_listing(resp.text)
+        nouveaux = [p for p in trouves if p["url"] not in produits]
+        if not nouveaux:
+            break
+        for p in nouveaux:
+            produits[p["url"]] = p
+        time.sleep(delay)
+    return list(produits.values())
+
+
+# --- Rapprochement avec les articles de l'application ---
+
+def _tokens(text):
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    text = _UNIT_SPACE.sub(r"\1\2", re.sub(r'(\d),(\d)', r"\1.\2", text))
+    return set(_TOKENS.findall(text))
+
+
+def match_score(nom_produit, nom_article, categorie):
+    """Score de 0 à 1.5 : toutes les caractéristiques chiffrées de l'article (375w, 100ah, 12v...)
+    et au moins un de ses autres mots doivent figurer dans le nom du produit ; part des mots
+    retrouvés, bonus de catégorie.
+    0 si le produit relève explicitement d'une autre catégorie."""
+    produit = _tokens(nom_produit)
+    for autre, mots in CATEGORY_WORDS.items():
+        if autre != categorie and produit.intersection(mots):
+            return 0.0
+    article = _tokens(nom_article)
+    chiffres = {t for t in article if any(c.isdigit() for c in t)}
+    if not chiffres or not chiffres <= produit:
+        return 0.0
+    mots = article - chiffres
+    if mots and not mots & produit:
+        return 0.0  # même calibre mais autre gamme (Plomb / Lithium, PWM / MPPT...)
+    score = (len(chiffres) + len(mots & produit)) / len(article)
+    if produit.intersection(CATEGORY_WORDS.get(categorie, ())):
+        score += 0.5
+    return score
+
+
+def match_catalogue(produits, catalogue, threshold=MATCH_THRESHOLD):
+    """Associe à chaque article du catalogue ({categorie: {nom: specs}}) le produit le mieux noté.
+    Retourne {url: (categorie, nom_article, score)} ; un produit n'est associé qu'à un article."""
+    candidats = []
+    for categorie, articles in catalogue.items():
+        for nom_article in (articles or {}):
+            for p in produits:
+                score = match_score(p["nom"], nom_article, categorie)
+                if score >= threshold:
+                    candidats.append((score, p["url"], categorie, nom_article))
+    candidats.sort(key=lambda c: -c[0])
+    associations, pris = {}, set()
+    for score, url, categorie, nom_article in candidats:
+        if url in associations or (categorie, nom_article) in pris:
+            continue
+        associations[url] = (categorie, nom_article, round(score, 3))
+        pris.add((categorie, nom_article))
+    return associations
+
+
+# --- Index SQLite ---
+
+def catalogue_signature(catalogue):
+    """Signature des articles du catalogue : seuls leurs noms et catégories comptent pour le rapprochement."""
+    return tuple(sorted((categorie, nom) for categorie, articles in (catalogue or {}).items()
+                        for nom in (articles or {})))
+
+
+def store(produits, catalogue):
+    """Enregistre les produits indexés ; conserve le prix précédent quand il change."""
+    migrate()
+    associations = match_catalogue(produits, catalogue)
+    maintenant = datetime.now(timezone.utc).isoformat()
+    with transaction() as conn:
+        for p in produits:
+            categorie, article, score = associations.get(p["url"], (None, None, None))
+            conn.execute("""INSERT INTO prix_boutique (url, nom, prix, categorie, equipement, score,
+                                                       crawled_at, prix_precedent, modifie_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?)
+                            ON CONFLICT(url) DO UPDATE SET
+                                prix_precedent = CASE WHEN prix_boutique.prix != excluded.prix
+                                                      THEN prix_boutique.prix ELSE prix_boutique.prix_precedent END,
+                                modifie_at = CASE WHEN prix_boutique.prix != excluded.prix
+                                                  THEN excluded.modifie_at ELSE prix_boutique.modifie_at END,
+                                nom = excluded.nom, prix = excluded.prix, categorie = excluded.categorie,
+                                equipement = excluded.equipement, score = excluded.score,
+                                crawled_at = excluded.crawled_at""",
+                         (p["url"], p["nom"], p["prix"], categorie, article, score, maintenant, maintenant))
+    _set_matched(catalogue)
+    invalidate()
+    return len(produits), len(associations)
+
+
+def _set_matched(catalogue):
+    global _matched_signature
+    with _index_lock:
+        _matched_signature = catalogue_signature(catalogue)
+
+
+def rematch(catalogue, force=False):
+    """Refait le rapprochement des produits déjà indexés quand les articles du catalogue ont changé
+    (ajout, suppression ou renommage). Retourne le nombre d'associations, ou None si rien n'a changé."""
+    if not force and catalogue_signature(catalogue) == _matched_signature:
+        return None
+    migrate()
+    rows = get_connection().execute("SELECT url, nom, prix FROM prix_boutique").fetchall()
+    produits = [{"url": r[0], "nom": r[1], "prix": r[2]} for r in rows]
+    associations = match_catalogue(produits, catalogue)
+    with transaction() as conn:
+        conn.execute("UPDATE prix_boutique SET categorie = NULL, equipement = NULL, score = NULL")
+        conn.executemany("UPDATE prix_boutique SET categorie = ?, equipement = ?, score = ? WHERE url = ?",
+                         [(c, a, s, url) for url, (c, a, s) in associations.items()])
+    _set_matched(catalogue)
+    invalidate()
+    return len(associations)
+
+
+def run_crawl(catalogue, max_pages=MAX_PAGES):
+    """Indexation complète : (produits indexés, produits rapprochés d'un article)."""
+    return store(crawl_catalog(max_pages), catalogue)
+
+
+def last_crawl():
+    """Date (ISO) de la dernière indexation, ou None."""
+    migrate()
+    row = get_connection().execute("SELECT MAX(crawled_at) FROM prix_boutique").fetchone()
+    return row[0] if row else None
+
+
+def invalidate():
+    global _index_cache
+    with _index_lock:
+        _index_cache = None
+
+
+def _index():
+    global _index_cache
+    cache = _index_cache
+    if cache is None or time.monotonic() - cache[0] > INDEX_TTL:
+        migrate()
+        rows = get_connection().execute(
+            "SELECT equipement, prix, url FROM prix_boutique WHERE equipement IS NOT NULL").fetchall()
+        cache = (time.monotonic(), {r[0]: (r[1], r[2]) for r in rows})
+        with _index_lock:
+            _index_cache = cache
+    return cache[1]
+
+
+def lookup(nom_article):
+    """(prix, url) indexés d'un article de l'application, ou (None, None). Aucun appel réseau."""
+    try:
+        return _index().get(nom_article, (None, None))
+    except Exception:
+        return None, None
+
+
+def price_changes(prix_actuels):
+    """Écarts entre les prix indexés et les prix de l'application, à valider par un administrateur.
+    Les écarts déjà rejetés au même prix ne sont plus proposés."""
+    migrate()
+    rows = get_connection().execute(
+        """SELECT url, nom, prix, categorie, equipement, score, crawled_at, decision, prix_decision
+           FROM prix_boutique WHERE equipement IS NOT NULL ORDER BY categorie, equipement""").fetchall()
+    ecarts = []
+    for url, nom, prix, categorie, article, score, crawled_at, decision, prix_decision in rows:
+        actuel = ((prix_actuels or {}).get(categorie) or {}).get(article, {}).get("prix")
+        if actuel is None or int(actuel) == int(prix):
+            continue
+        if decision == "rejete" and prix_decision == prix:
+            continue
+        ecarts.append({"categorie": categorie, "article": article, "prix_actuel": int(actuel),
+                       "prix_boutique": int(prix), "ecart": int(prix) - int(actuel),
+                       "produit": nom, "url": url, "score": score, "indexe_le": crawled_at})
+    return ecarts
+
+
+def record_decision(urls, decision):
+    """Mémorise la décision ('approuve' / 'rejete') prise sur les écarts des produits donnés."""
+    migrate()
+    with transaction() as conn:
+        conn.executemany("UPDATE prix_boutique SET decision = ?, prix_decision = prix WHERE url = ?",
+                         [(decision, url) for url in urls])
+
+
+def apply_changes(prix_actuels, ecarts):
+    """Copie des prix de l'application avec les prix boutique des écarts approuvés."""
+    nouveaux = {cat: {nom: dict(specs) for nom, specs in (articles or {}).items()}
+                for cat, articles in (prix_actuels or {}).items()}
+    for e in ecarts:
+        if e["article"] in nouveaux.get(e["categorie"], {}):
+            nouveaux[e["categorie"]][e["article"]]["prix"] = e["prix_boutique"]
+    return nouveaux
+
+
+# --- Indexation en tâche de fond ---
+
+_crawl_thread = None
+_crawl_thread_lock = threading.Lock()
+
+
+def _crawl_loop(catalogue_fn):
+    while True:
+        try:
+            catalogue = catalogue_fn()
+            dernier = last_crawl()
+            age = (datetime.now(timezone.utc) - datetime.fromisoformat(dernier)).total_seconds() if dernier else None
+            if age is None or age >= CRAWL_INTERVAL:
+                run_crawl(catalogue)
+            else:
+                rematch(catalogue)
+        except Exception:
+            pass  # boutique indisponible : nouvel essai au prochain passage
+        time.sleep(CRAWL_INTERVAL / 24)
+
+
+def start_background_crawl(catalogue_fn):
+    """Démarre (une fois par processus) l'indexation quotidienne du catalogue de la boutique.
+    catalogue_fn() est rappelée à chaque passage et retourne le catalogue courant des articles
+    ({categorie: {nom: specs}}), de sorte que le rapprochement suive les prix enregistrés."""
+    global _crawl_thread
+    with _crawl_thread_lock:
+        if _crawl_thread is None or not _crawl_thread.is_alive():
+            _crawl_thread = threading.Thread(target=_crawl_loop, args=(catalogue_fn,),
+                                             name="price-index-crawl", daemon=True)
+            _crawl_thread.start()
+    return _crawl_thread
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "crawl":
+        produits = crawl_catalog()
+        print(f"{len(produits)} produit(s) trouvé(s) sur la boutique")
+        for p in produits:
+            print(f"{p['prix']:>12} FCFA  {p['nom']}  ({p['url']})")
+    else:
+        print("Usage : python price_index.py crawl")
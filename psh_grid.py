@@ -0,0 +1,216 @@
+"""
+Grille hors ligne des PSH mensuelles (E_d PVGIS, kWh/kWp/jour) sur le Sénégal
+- grille régulière au pas de 0,1° couvrant le pays, un jeu de 12 valeurs mensuelles par nœud
+- préréglages d'orientation : angle optimal PVGIS + inclinaisons x azimuts usuels
+- stockage float16 (.npy) ouvert en mémoire partagée (mmap) : pas de chargement complet
+- interpolation bilinéaire en latitude / longitude, préréglage d'orientation le plus proche
+Construction (une fois, avec accès réseau) : python psh_grid.py build [--step 0.1]
+La construction est reprenable : les nœuds déjà obtenus ne sont pas redemandés.
+Contrôle avant livraison des fichiers data/psh_senegal.npy et .json : python psh_grid.py status
+"""
+
+import json
+import os
+import sys
+import time
+from functools import lru_cache
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+GRID_PATH = os.environ.get("ENERGIE_SOLAIRE_PSH_GRID", os.path.join(APP_DIR, "data", "psh_senegal.npy"))
+
+# Emprise du Sénégal (avec marge) et pas de la grille en degrés
+LAT_MIN, LAT_MAX = 12.3, 16.7
+LON_MIN, LON_MAX = -17.6, -11.3
+STEP = 0.1
+
+# Préréglages d'orientation (0 = Sud, -90 = Est, 90 = Ouest, comme PVGIS)
+TILTS = (0, 10, 20, 30, 45, 60)
+ASPECTS = (-90, -45, 0, 45, 90)
+RADDATABASE = "PVGIS-SARAH3"
+PVCALC_URL = "https://re.jrc.ec.europa.eu/api/PVcalc"
+
+
+def presets():
+    """Liste des préréglages : index 0 = angle optimal, puis (inclinaison, azimut)."""
+    return [None] + [(t, a) for t in TILTS for a in ASPECTS]
+
+
+def preset_index(optimalangles=True, angle=None, aspect=None):
+    """Préréglage le plus proche de l'orientation demandée."""
+    if optimalangles or angle is None:
+        return 0
+    aspect = 0 if aspect is None else aspect
+    tilt = min(TILTS, key=lambda t: abs(t - float(angle)))
+    azimut = min(ASPECTS, key=lambda a: abs(a - float(aspect)))
+    return 1 + TILTS.index(tilt) * len(ASPECTS) + ASPECTS.index(azimut)
+
+
+def _meta_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+@lru_cache(maxsize=4)
+def load_grid(path=GRID_PATH):
+    """(tableau mmap [préréglage, lat, lon, mois], métadonnées) ou None si la grille est absente."""
+    try:
+        with open(_meta_path(path), encoding="utf-8") as f:
+            meta = json.load(f)
+        grid = np.load(path, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    return grid, meta
+
+
+def monthly_psh(lat, lon, optimalangles=True, angle=None, aspect=None, path=GRID_PATH):
+    """PSH mensuelles interpolées depuis la grille, au format de get_pvgis_monthly_psh :
+    {"psh_by_month": {1: val, ..., 12: val}, "meta": {...}}.
+    None si la grille est absente, si le point est hors emprise ou si les nœuds voisins manquent."""
+    loaded = load_grid(path)
+    if loaded is None:
+        return None
+    grid, meta = loaded
+    step = meta["step"]
+    fi = (float(lat) - meta["lat_min"]) / step
+    fj = (float(lon) - meta["lon_min"]) / step
+    n_lat, n_lon = grid.shape[1], grid.shape[2]
+    eps = 1e-6  # arrondis flottants sur les bords de l'emprise
+    if not (-eps <= fi <= n_lat - 1 + eps and -eps <= fj <= n_lon - 1 + eps):
+        return None
+    fi, fj = min(max(fi, 0.0), n_lat - 1), min(max(fj, 0.0), n_lon - 1)
+    i0, j0 = min(int(fi), n_lat - 2), min(int(fj), n_lon - 2)
+    di, dj = fi - i0, fj - j0
+
+    k = preset_index(optimalangles, angle, aspect)
+    cell = np.asarray(grid[k, i0:i0 + 2, j0:j0 + 2, :], dtype=np.float64)  # 2 x 2 x 12
+    weights = np.array([[(1 - di) * (1 - dj), (1 - di) * dj],
+                        [di * (1 - dj), di * dj]])[:, :, None]
+    # Nœuds non encore construits (NaN) : renormalisation sur les voisins disponibles
+    present = ~np.isnan(cell)
+    w = np.where(present, weights, 0.0)
+    total = w.sum(axis=(0, 1))
+    if np.any(total <= 0):
+        return None
+    values = (np.where(present, cell, 0.0) * w).sum(axis=(0, 1)) / total
+
+    preset = presets()[k]
+    return {
+        "psh_by_month": {m + 1: round(float(v), 3) for m, v in enumerate(values)},
+        "meta": {
+            "source": "grille",
+            "angle": None if preset is None else preset[0],
+            "aspect": None if preset is None else preset[1],
+            "optimalangles": preset is None,
+            "raddatabase": meta.get("raddatabase"),
+            "location": {"latitude": float(lat), "longitude": float(lon)},
+            "built_at": meta.get("built_at"),
+        },
+    }
+
+
+# --- Construction de la grille (outil de maintenance, nécessite le réseau) ---
+
+def _axes(step):
+    lats = np.round(np.arange(LAT_MIN, LAT_MAX + step / 2, step), 4)
+    lons = np.round(np.arange(LON_MIN, LON_MAX + step / 2, step), 4)
+    return lats, lons
+
+
+def _fetch_pvcalc(session, lat, lon, preset, raddatabase):
+    params = {"lat": float(lat), "lon": float(lon), "peakpower": 1, "loss": 14,
+              "outputformat": "json", "raddatabase": raddatabase, "pvtechchoice": "crystSi"}
+    if preset is None:
+        params["optimalangles"] = 1
+    else:
+        params.update({"optimalangles": 0, "angle": preset[0], "aspect": preset[1]})
+    resp = session.get(PVCALC_URL, params=params, timeout=30)
+    resp.raise_for_status()
+    monthly = resp.json().get("outputs", {}).get("monthly", [])
+    values = np.full(12, np.nan)
+    for m in monthly:
+        if m.get("E_d") is not None:
+            values[int(m["month"]) - 1] = float(m["E_d"])
+    return values
+
+
+def build_grid(path=GRID_PATH, step=STEP, raddatabase=RADDATABASE, workers=8, progress=None):
+    """Construit (ou complète) la grille en interrogeant PVGIS pour chaque nœud et préréglage.
+    Les valeurs sont écrites au fil de l'eau dans le fichier mmap ; une interruption ne perd
+    que les requêtes en cours. Retourne le nombre de nœuds encore manquants."""
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    lats, lons = _axes(step)
+    shape = (len(presets()), len(lats), len(lons), 12)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.exists(path):
+        grid = np.load(path, mmap_mode="r+")
+        if grid.shape != shape:
+            raise ValueError(f"Grille existante de forme {grid.shape}, attendu {shape}")
+    else:
+        grid = np.lib.format.open_memmap(path, mode="w+", dtype=np.float16, shape=shape)
+        grid[:] = np.nan
+    meta = {"lat_min": float(lats[0]), "lon_min": float(lons[0]), "step": step,
+            "tilts": list(TILTS), "aspects": list(ASPECTS), "raddatabase": raddatabase,
+            "built_at": time.strftime("%Y-%m-%d")}
+    with open(_meta_path(path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    todo = [(k, i, j) for k in range(shape[0]) for i in range(shape[1]) for j in range(shape[2])
+            if np.isnan(grid[k, i, j, 0])]
+    all_presets = presets()
+    session = requests.Session()
+
+    def _task(item):
+        k, i, j = item
+        try:
+            return item, _fetch_pvcalc(session, lats[i], lons[j], all_presets[k], raddatabase)
+        except Exception:
+            return item, None  # nœud laissé à NaN, repris au prochain passage
+
+    missing = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for n, ((k, i, j), values) in enumerate(pool.map(_task, todo), 1):
+            if values is None:
+                missing += 1
+            else:
+                grid[k, i, j, :] = values
+            if n % 500 == 0:
+                grid.flush()
+            if progress:
+                progress(n, len(todo))
+    grid.flush()
+    load_grid.cache_clear()
+    return missing
+
+
+def coverage(path=GRID_PATH):
+    """Nœuds renseignés de la grille : {'noeuds', 'manquants', 'par_preset': [manquants par préréglage]}.
+    None si la grille est absente."""
+    loaded = load_grid(path)
+    if loaded is None:
+        return None
+    grid, _ = loaded
+    missing = np.isnan(grid[..., 0]).sum(axis=(1, 2))
+    return {"noeuds": int(np.prod(grid.shape[:3])), "manquants": int(missing.sum()),
+            "par_preset": [int(m) for m in missing]}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        pas = float(sys.argv[sys.argv.index("--step") + 1]) if "--step" in sys.argv else STEP
+        restants = build_grid(step=pas, progress=lambda n, t: print(f"\r{n}/{t}", end="", flush=True))
+        print(f"\nGrille écrite dans {GRID_PATH} ({restants} nœud(s) manquant(s), relancer pour compléter)")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "status":
+        etat = coverage()
+        if etat is None:
+            print(f"Grille absente : {GRID_PATH} (construire avec : python psh_grid.py build)")
+            sys.exit(1)
+        print(f"{GRID_PATH} : {etat['noeuds'] - etat['manquants']}/{etat['noeuds']} nœud(s) renseigné(s)")
+        for preset, manquants in zip(presets(), etat["par_preset"]):
+            if manquants:
+                print(f"  {'angle optimal' if preset is None else f'{preset[0]}° / {preset[1]}°'} : {manquants} manquant(s)")
+        sys.exit(1 if etat["manquants"] else 0)
+    else:
+        print("Usage : python psh_grid.py build [--step 0.1] | status")
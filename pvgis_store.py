@@ -0,0 +1,170 @@
+"""
+Cache persistant des réponses PVGIS (PSH mensuelles PVcalc)
+- stockage SQLite local (table pvgis_cache) : survit aux redémarrages, partagé entre processus,
+  indépendant des st.cache_data.clear() de l'administration
+- clé : latitude / longitude arrondies (0,01° ≈ 1 km), inclinaison, azimut, base de rayonnement
+- requêtes identiques simultanées regroupées sur un seul appel HTTP
+- stale-while-revalidate : une réponse ancienne est servie immédiatement et rafraîchie en tâche de fond
+"""
+
+import json
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+import http_client
+from sqlite_store import get_connection, transaction, migrate
+
+RADDATABASE = "PVGIS-SARAH3"
+# Données climatologiques : une réponse reste fraîche 90 jours, puis est servie en rafraîchissant
+FRESH_SECONDS = 90 * 86400
+# Attente maximale d'un appel regroupé (les délais HTTP sont portés par http_client)
+FETCH_TIMEOUT = 30
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def cache_key(lat, lon, optimalangles=True, angle=None, aspect=None, raddatabase=RADDATABASE):
+    """(clé, colonnes) d'une requête PVcalc : coordonnées arrondies, orientation, base."""
+    lat_r, lon_r = round(float(lat), 2), round(float(lon), 2)
+    if optimalangles:
+        angle_k = aspect_k = "opt"
+    else:
+        angle_k = "def" if angle is None else str(int(round(float(angle))))
+        aspect_k = "def" if aspect is None else str(int(round(float(aspect))))
+    cle = f"{raddatabase}|{lat_r:.2f}|{lon_r:.2f}|{angle_k}|{aspect_k}"
+    return cle, {"lat": lat_r, "lon": lon_r, "angle": angle_k, "aspect": aspect_k, "raddatabase": raddatabase}
+
+
+def fetch_monthly_psh(lat, lon, optimalangles=True, angle=None, aspect=None, raddatabase=RADDATABASE):
+    """Appel PVGIS PVcalc. Retourne {"psh_by_month": {...}, "meta": {...}} ; lève en cas d'échec
+    (y compris http_client.ServiceUnavailable si PVGIS est court-circuité ou le budget épuisé)."""
+    params = {
+        "lat": float(lat),
+        "lon": float(lon),
+        "peakpower": 1,
+        "loss": 14,
+        "outputformat": "json",
+        "raddatabase": raddatabase,
+        "pvtechchoice": "crystSi"
+    }
+    if optimalangles:
+        params["optimalangles"] = 1
+    else:
+        params["optimalangles"] = 0
+        if angle is not None:
+            params["angle"] = float(angle)
+        if aspect is not None:
+            params["aspect"] = float(aspect)
+    resp = http_client.get("pvgis", "PVcalc", params=params)
+    resp.raise_for_status()
+    data = resp.json()
+    monthly = data.get("outputs", {}).get("monthly", [])
+    psh_by_month = {int(m.get("month")): float(m.get("E_d")) for m in monthly if m.get("E_d") is not None}
+    if not psh_by_month:
+        raise ValueError("Réponse PVGIS sans valeurs mensuelles")
+    meta = {
+        "angle": data.get("inputs", {}).get("angle"),
+        "aspect": data.get("inputs", {}).get("aspect"),
+        "raddatabase": data.get("inputs", {}).get("raddatabase"),
+        "location": data.get("inputs", {}).get("location")
+    }
+    return {"psh_by_month": psh_by_month, "meta": meta}
+
+
+def _read(cle):
+    migrate()
+    row = get_connection().execute(
+        "SELECT reponse, fetched_at FROM pvgis_cache WHERE cle = ?", (cle,)).fetchone()
+    if row is None:
+        return None
+    result = json.loads(row[0])
+    # JSON : les clés de mois reviennent en chaînes
+    result["psh_by_month"] = {int(m): v for m, v in result.get("psh_by_month", {}).items()}
+    return result, datetime.fromisoformat(row[1])
+
+
+def _write(cle, cols, result):
+    migrate()
+    with transaction() as conn:
+        conn.execute("""INSERT INTO pvgis_cache (cle, lat, lon, angle, aspect, raddatabase, reponse, fetched_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(cle) DO UPDATE SET reponse = excluded.reponse,
+                                                       fetched_at = excluded.fetched_at""",
+                     (cle, cols["lat"], cols["lon"], cols["angle"], cols["aspect"], cols["raddatabase"],
+                      json.dumps(result, ensure_ascii=False), datetime.now(timezone.utc).isoformat()))
+
+
+def _coalesced(cle, fn):
+    """Exécute fn() une seule fois pour toutes les demandes simultanées de la même clé."""
+    with _inflight_lock:
+        future = _inflight.get(cle)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[cle] = future
+    if leader:
+        try:
+            future.set_result(fn())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with _inflight_lock:
+                _inflight.pop(cle, None)
+    return future.result(timeout=FETCH_TIMEOUT * 2)
+
+
+def _fetch_and_store(cle, cols, args):
+    result = fetch_monthly_psh(*args)
+    _write(cle, cols, result)
+    return result
+
+
+def _revalidate(cle, cols, args):
+    """Rafraîchissement en tâche de fond, ignoré si un appel est déjà en cours pour cette clé."""
+    with _inflight_lock:
+        if cle in _inflight:
+            return
+
+    def _run():
+        try:
+            _coalesced(cle, lambda: _fetch_and_store(cle, cols, args))
+        except Exception:
+            pass  # la réponse ancienne reste servie
+
+    threading.Thread(target=_run, daemon=True, name="pvgis-revalidate").start()
+
+
+def _with_cache_meta(result, fetched_at, etat):
+    return {**result, "meta": {**result.get("meta", {}), "cache": etat, "fetched_at": fetched_at.isoformat()}}
+
+
+def get_monthly_psh(lat, lon, optimalangles=True, angle=None, aspect=None, raddatabase=RADDATABASE,
+                    refresh=False):
+    """PSH mensuelles PVGIS servies depuis le cache persistant.
+    - réponse fraîche : aucune requête réseau
+    - réponse ancienne : servie telle quelle, rafraîchie en tâche de fond
+    - absente (ou refresh=True) : un seul appel PVGIS partagé par les demandes simultanées
+    En cas d'échec réseau, la dernière réponse connue est servie si elle existe, sinon
+    {"psh_by_month": {}, "meta": {"error": ...}}.
+    """
+    args = (lat, lon, optimalangles, angle, aspect, raddatabase)
+    cle, cols = cache_key(*args)
+    cached = None
+    try:
+        cached = _read(cle)
+    except Exception:
+        pass  # base locale indisponible : on passe au réseau
+    if cached and not refresh:
+        result, fetched_at = cached
+        if (datetime.now(timezone.utc) - fetched_at).total_seconds() <= FRESH_SECONDS:
+            return _with_cache_meta(result, fetched_at, "frais")
+        _revalidate(cle, cols, args)
+        return _with_cache_meta(result, fetched_at, "ancien")
+    try:
+        return _coalesced(cle, lambda: _fetch_and_store(cle, cols, args))
+    except Exception as e:
+        if cached:
+            return _with_cache_meta(cached[0], cached[1], "ancien")
+        return {"psh_by_month": {}, "meta": {"error": str(e)}}
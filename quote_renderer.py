@@ -0,0 +1,330 @@
+"""
+Rendu des devis estimatifs : un modèle de devis unique -> TXT, DOCX, XLSX ou PDF
+Les documents ne sont construits qu'à la demande et mis en cache par empreinte du contenu
+"""
+
+import hashlib
+import io
+import json
+import streamlit as st
+
+import logo_assets
+from document_templates import CONTACT_ENTREPRISE
+
+TITRE_DEVIS = "DEVIS ESTIMATIF - INSTALLATION SOLAIRE SÉNÉGAL"
+
+NOTES_DEVIS = [
+    "Prix indicatifs",
+    "Installation standard incluse",
+    "Garantie selon fabricant (panneaux: 25 ans, batteries: variable)",
+    "Maintenance recommandée tous les 6 mois",
+]
+
+# Format -> (libellé du bouton, type MIME, extension)
+FORMATS = {
+    "docx": ("📥 Devis Word (.docx)", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "docx"),
+    "xlsx": ("📊 Devis Excel (.xlsx)", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "pdf": ("📄 Devis PDF", "application/pdf", "pdf"),
+    "txt": ("📝 Devis texte (.txt)", "text/plain", "txt"),
+}
+
+
+def build_quote_model(devis, nom_demandeur, region, systeme, finances):
+    """Modèle de devis sérialisable, source unique de tous les formats.
+    - devis : résultat de calculer_devis (details, total, puissance_totale)
+    - systeme : [(libellé, valeur)] du résumé du système, déjà formatés
+    - finances : [(libellé, valeur)] de l'analyse financière, déjà formatés
+    """
+    return {
+        "client": {"nom": nom_demandeur or "Non renseigné", "region": region or "Non spécifiée"},
+        "systeme": [[str(k), str(v)] for k, v in systeme],
+        "equipements": [
+            {"item": d["item"], "quantite": d["quantite"],
+             "prix_unitaire": d["prix_unitaire"], "sous_total": d["sous_total"]}
+            for d in devis["details"]
+        ],
+        "total": devis["total"],
+        "finances": [[str(k), str(v)] for k, v in finances],
+        "notes": list(NOTES_DEVIS),
+        "contact": [list(c) for c in CONTACT_ENTREPRISE],
+    }
+
+
+def quote_hash(model):
+    """Empreinte du contenu du devis (clé de cache des documents générés)."""
+    payload = json.dumps(model, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _fcfa(value):
+    return f"{value:,}"
+
+
+def render_txt(model):
+    sep, fort = "─" * 64, "═" * 64
+    lines = [
+        "╔════════════════════════════════════════════════════════════════╗",
+        "║        DEVIS ESTIMATIF - INSTALLATION SOLAIRE SÉNÉGAL         ║",
+        "╚════════════════════════════════════════════════════════════════╝",
+        "",
+        "👤 INFORMATIONS CLIENT", sep,
+    ]
+    lines += [f"{k:<24}: {v}" for k, v in (("Nom du demandeur", model['client']['nom']),
+                                            ("Région d'installation", model['client']['region']))]
+    lines += ["", "📊 RÉSUMÉ DU SYSTÈME", sep]
+    lines += [f"{k:<24}: {v}" for k, v in model["systeme"]]
+    lines += ["", "📦 DÉTAILS DES ÉQUIPEMENTS", sep]
+    for item in model["equipements"]:
+        lines += [
+            "",
+            item["item"],
+            f"  Quantité        : {item['quantite']}",
+            f"  Prix unitaire   : {_fcfa(item['prix_unitaire'])} FCFA",
+            f"  Sous-total      : {_fcfa(item['sous_total'])} FCFA",
+        ]
+    lines += ["", fort, f"💰 TOTAL ESTIMATIF : {_fcfa(model['total'])} FCFA", fort, "", "",
+              "💡 ANALYSE FINANCIÈRE", sep]
+    lines += [f"{k:<31}: {v}" for k, v in model["finances"]]
+    lines += ["", "📝 NOTES IMPORTANTES", sep]
+    lines += [f"- {note}" for note in model["notes"]]
+    lines += ["", fort, "Document généré automatiquement",
+              "Pour plus d'informations : energiesolairesenegal.com", fort, ""]
+    return "\n".join(lines).encode("utf-8")
+
+
+def render_docx(model):
+    from docx import Document
+    from docx.shared import Inches, Pt
+
+    doc = Document()
+
+    def _table(rows):
+        table = doc.add_table(rows=len(rows), cols=2)
+        table.style = 'Table Grid'
+        for i, (k, v) in enumerate(rows):
+            table.cell(i, 0).text = k
+            table.cell(i, 1).text = v
+
+    logo = logo_assets.logo_png(logo_assets.LOGO_PRINT)
+    if logo:
+        doc.add_picture(io.BytesIO(logo), width=Inches(2.5))
+        doc.paragraphs[-1].alignment = 1
+
+    header_paragraph = doc.add_paragraph()
+    header_paragraph.alignment = 1  # Centré
+    run = header_paragraph.add_run("☀️ ENERGIE SOLAIRE SÉNÉGAL\n")
+    run.font.size = Pt(16)
+    run.bold = True
+
+    title = doc.add_heading(TITRE_DEVIS, 0)
+    title.alignment = 1
+
+    doc.add_heading('👤 INFORMATIONS CLIENT', level=1)
+    _table([("Nom du demandeur", model["client"]["nom"]), ("Région d'installation", model["client"]["region"])])
+
+    doc.add_heading('📊 RÉSUMÉ DU SYSTÈME', level=1)
+    _table(model["systeme"])
+
+    doc.add_heading('📦 DÉTAILS DES ÉQUIPEMENTS', level=1)
+    equip_table = doc.add_table(rows=len(model["equipements"]) + 1, cols=4)
+    equip_table.style = 'Table Grid'
+    for cell, text in zip(equip_table.rows[0].cells,
+                          ('Équipement', 'Quantité', 'Prix unitaire (FCFA)', 'Sous-total (FCFA)')):
+        cell.text = text
+    for i, item in enumerate(model["equipements"]):
+        row_cells = equip_table.rows[i + 1].cells
+        row_cells[0].text = item['item']
+        row_cells[1].text = str(item['quantite'])
+        row_cells[2].text = _fcfa(item['prix_unitaire'])
+        row_cells[3].text = _fcfa(item['sous_total'])
+
+    doc.add_heading('💰 TOTAL ESTIMATIF', level=1)
+    _table([("TOTAL", f"{_fcfa(model['total'])} FCFA")])
+
+    doc.add_heading('💡 ANALYSE FINANCIÈRE', level=1)
+    _table(model["finances"])
+
+    doc.add_heading('📝 NOTES IMPORTANTES', level=1)
+    for note in model["notes"]:
+        doc.add_paragraph(f"• {note}")
+
+    doc.add_heading('📞 INFORMATIONS DE CONTACT', level=1)
+    _table(model["contact"])
+
+    doc.add_paragraph()
+    doc.add_paragraph("Document généré automatiquement").alignment = 1
+    doc.add_paragraph("Votre partenaire de confiance pour l'énergie solaire au Sénégal").alignment = 1
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def render_xlsx(model):
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Devis Solaire"
+
+    header_font = Font(bold=True, color="FFFFFF", size=12)
+    header_fill = PatternFill(start_color="4CAF50", end_color="4CAF50", fill_type="solid")
+    section_font = Font(bold=True, size=12)
+    border = Border(left=Side(style='thin'), right=Side(style='thin'),
+                    top=Side(style='thin'), bottom=Side(style='thin'))
+    center_alignment = Alignment(horizontal='center', vertical='center')
+
+    ws.merge_cells('A1:E1')
+    ws['A1'] = TITRE_DEVIS
+    ws['A1'].font = Font(bold=True, size=14, color="2E7D32")
+    ws['A1'].alignment = center_alignment
+
+    row = 3
+    sections = [
+        ("INFORMATIONS CLIENT", [("Nom du demandeur", model["client"]["nom"]),
+                                 ("Région d'installation", model["client"]["region"])]),
+        ("RÉSUMÉ DU SYSTÈME", model["systeme"]),
+    ]
+    for titre, lignes in sections:
+        ws[f'A{row}'] = titre
+        ws[f'A{row}'].font = section_font
+        row += 1
+        for k, v in lignes:
+            ws[f'A{row}'] = f"{k}: {v}"
+            row += 1
+        row += 1
+
+    ws[f'A{row}'] = "DÉTAILS DES ÉQUIPEMENTS"
+    ws[f'A{row}'].font = section_font
+    row += 1
+    for col, header in enumerate(["Équipement", "Quantité", "Prix unitaire (FCFA)", "Sous-total (FCFA)"], 1):
+        cell = ws.cell(row=row, column=col, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.border = border
+        cell.alignment = center_alignment
+    row += 1
+    for item in model["equipements"]:
+        ws.cell(row=row, column=1, value=item["item"]).border = border
+        ws.cell(row=row, column=2, value=item["quantite"]).border = border
+        ws.cell(row=row, column=3, value=item["prix_unitaire"]).border = border
+        ws.cell(row=row, column=4, value=item["sous_total"]).border = border
+        ws.cell(row=row, column=3).number_format = '#,##0'
+        ws.cell(row=row, column=4).number_format = '#,##0'
+        row += 1
+
+    ws.cell(row=row, column=1, value="TOTAL").font = Font(bold=True)
+    for col in (1, 2, 3):
+        ws.cell(row=row, column=col).border = border
+    total_cell = ws.cell(row=row, column=4, value=model["total"])
+    total_cell.number_format = '#,##0'
+    total_cell.font = Font(bold=True)
+    total_cell.border = border
+    total_cell.fill = PatternFill(start_color="E8F5E8", end_color="E8F5E8", fill_type="solid")
+
+    ws.column_dimensions['A'].width = 40
+    ws.column_dimensions['B'].width = 12
+    ws.column_dimensions['C'].width = 20
+    ws.column_dimensions['D'].width = 20
+
+    row += 3
+    for titre, lignes in (("ANALYSE FINANCIÈRE", [f"{k}: {v}" for k, v in model["finances"]]),
+                          ("NOTES IMPORTANTES", [f"• {n}" for n in model["notes"]])):
+        ws[f'A{row}'] = titre
+        ws[f'A{row}'].font = section_font
+        row += 1
+        for ligne in lignes:
+            ws[f'A{row}'] = ligne
+            row += 1
+        row += 1
+
+    row += 1
+    ws[f'A{row}'] = "CONTACT - ENERGIE SOLAIRE SÉNÉGAL"
+    ws[f'A{row}'].font = Font(bold=True, size=12, color="4CAF50")
+    for k, v in model["contact"][1:]:
+        row += 1
+        ws[f'A{row}'] = f"{k}: {v}"
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def render_pdf(model):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+
+    styles = getSampleStyleSheet()
+    grille = TableStyle([
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ])
+    entete = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4CAF50')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#E8F5E8')),
+    ])
+
+    def _pairs(rows):
+        table = Table([[k, v] for k, v in rows], colWidths=[6 * cm, 11 * cm])
+        table.setStyle(grille)
+        return table
+
+    story = []
+    logo = logo_assets.logo_png(logo_assets.LOGO_PRINT)
+    if logo:
+        logo_w, logo_h = logo_assets.logo_dimensions(6 * cm, logo_assets.LOGO_PRINT)
+        story.append(Image(io.BytesIO(logo), width=logo_w, height=logo_h))
+    story += [
+        Paragraph("ENERGIE SOLAIRE SÉNÉGAL", styles['Title']),
+        Paragraph(TITRE_DEVIS, styles['Heading2']),
+        Spacer(1, 0.4 * cm),
+        Paragraph("Informations client", styles['Heading3']),
+        _pairs([("Nom du demandeur", model["client"]["nom"]), ("Région d'installation", model["client"]["region"])]),
+        Paragraph("Résumé du système", styles['Heading3']),
+        _pairs(model["systeme"]),
+        Paragraph("Détails des équipements", styles['Heading3']),
+    ]
+    rows = [["Équipement", "Quantité", "Prix unitaire (FCFA)", "Sous-total (FCFA)"]]
+    rows += [[Paragraph(str(i["item"]), styles['BodyText']), str(i["quantite"]),
+              _fcfa(i["prix_unitaire"]), _fcfa(i["sous_total"])] for i in model["equipements"]]
+    rows.append(["TOTAL ESTIMATIF", "", "", f"{_fcfa(model['total'])} FCFA"])
+    equipements = Table(rows, colWidths=[8 * cm, 2 * cm, 3.5 * cm, 3.5 * cm], repeatRows=1)
+    equipements.setStyle(grille)
+    equipements.setStyle(entete)
+    story += [equipements,
+              Paragraph("Analyse financière", styles['Heading3']), _pairs(model["finances"]),
+              Paragraph("Notes importantes", styles['Heading3'])]
+    story += [Paragraph(f"• {n}", styles['BodyText']) for n in model["notes"]]
+    story += [Paragraph("Informations de contact", styles['Heading3']), _pairs(model["contact"]),
+              Spacer(1, 0.5 * cm), Paragraph("Document généré automatiquement", styles['Italic'])]
+
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4, title=TITRE_DEVIS,
+                      leftMargin=2 * cm, rightMargin=2 * cm, topMargin=1.5 * cm, bottomMargin=1.5 * cm).build(story)
+    return buffer.getvalue()
+
+
+_RENDERERS = {"txt": render_txt, "docx": render_docx, "xlsx": render_xlsx, "pdf": render_pdf}
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _render_cached(content_hash, fmt, _model):
+    # _model n'est pas haché par Streamlit : la clé est l'empreinte du contenu
+    return _RENDERERS[fmt](_model)
+
+
+def render_quote(model, fmt, content_hash=None):
+    """Octets du devis au format demandé ('txt', 'docx', 'xlsx', 'pdf'),
+    générés une seule fois par contenu de devis et par format."""
+    if fmt not in _RENDERERS:
+        raise ValueError(f"Format de devis inconnu: {fmt}")
+    return _render_cached(content_hash or quote_hash(model), fmt, model)
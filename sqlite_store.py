@@ -0,0 +1,436 @@
+"""
+Couche d'accès SQLite partagée (energie_solaire.db)
+Une connexion par thread, journal WAL, synchronous=NORMAL et délai d'attente sur verrou
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+DB_PATH = os.environ.get("ENERGIE_SOLAIRE_DB", "energie_solaire.db")
+
+# Délai d'attente (ms) quand une autre session tient le verrou d'écriture
+BUSY_TIMEOUT_MS = 30000
+# Nombre de requêtes préparées gardées en cache par connexion
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+
+
+def _open_connection(path):
+    conn = sqlite3.connect(
+        path,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=CACHED_STATEMENTS,
+        isolation_level=None,  # transactions gérées explicitement par transaction()
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def get_connection(path=None):
+    """Retourne la connexion du thread courant (créée à la première utilisation).
+    Les lectures peuvent s'exécuter pendant qu'une autre session écrit (mode WAL).
+    """
+    path = path or DB_PATH
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _open_connection(path)
+    return conn
+
+
+@contextmanager
+def transaction(path=None):
+    """Transaction d'écriture (BEGIN IMMEDIATE ... COMMIT / ROLLBACK).
+    Réentrante : un appel imbriqué réutilise la transaction englobante du même thread.
+    """
+    conn = get_connection(path)
+    depths = getattr(_local, "depths", None)
+    if depths is None:
+        depths = _local.depths = {}
+    key = path or DB_PATH
+    depth = depths.get(key, 0)
+    if depth == 0:
+        conn.execute("BEGIN IMMEDIATE")
+    depths[key] = depth + 1
+    try:
+        yield conn
+    except BaseException:
+        depths[key] = depth
+        if depth == 0:
+            conn.execute("ROLLBACK")
+        raise
+    else:
+        depths[key] = depth
+        if depth == 0:
+            conn.execute("COMMIT")
+
+
+def close_connection(path=None):
+    """Ferme la connexion du thread courant (tests, fin de traitement par lot)."""
+    conns = getattr(_local, "conns", None) or {}
+    conn = conns.pop(path or DB_PATH, None)
+    if conn is not None:
+        conn.close()
+
+
+# --- Migrations de schéma ---
+# Chaque migration est appliquée une seule fois, dans sa propre transaction, et
+# enregistrée dans la table schema_version. Ajouter les évolutions en fin de liste.
+
+def _migration_schema_initial(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS produits
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     nom TEXT NOT NULL,
+                     categorie TEXT,
+                     prix_achat REAL,
+                     prix_vente REAL,
+                     stock_actuel INTEGER,
+                     stock_min INTEGER,
+                     unite TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS clients
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     nom TEXT NOT NULL,
+                     telephone TEXT,
+                     adresse TEXT,
+                     email TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS factures
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     numero TEXT UNIQUE,
+                     date TEXT,
+                     client_id INTEGER,
+                     client_nom TEXT,
+                     montant_total REAL,
+                     type TEXT,
+                     statut TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS lignes_facture
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     facture_id INTEGER,
+                     produit_nom TEXT,
+                     quantite INTEGER,
+                     prix_unitaire REAL,
+                     montant REAL)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS mouvements_stock
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     date TEXT,
+                     produit_id INTEGER,
+                     produit_nom TEXT,
+                     type TEXT,
+                     quantite INTEGER,
+                     reference TEXT)''')
+
+
+def _migration_index_recherche(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mouvements_produit_date ON mouvements_stock(produit_id, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_factures_date ON factures(date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_lignes_facture_facture ON lignes_facture(facture_id)")
+
+
+def _migration_nom_produit_unique(conn):
+    # Renommer les doublons existants (« Nom (#id) ») avant de poser la contrainte d'unicité
+    conn.execute('''UPDATE produits SET nom = nom || ' (#' || id || ')'
+                    WHERE id NOT IN (SELECT MIN(id) FROM produits GROUP BY nom)''')
+    # L'index unique sert aussi de recherche par nom (creer_facture, import)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_produits_nom ON produits(nom)")
+
+
+def _migration_replica_firestore(conn):
+    # Réplique locale de Firestore (mode hors ligne, voir offline_store), dans des tables
+    # dédiées : les documents distants ne se mêlent pas aux données locales de Stock.py
+    # (listes, synthèses de reporting, unicité des noms). Chaque ligne garde le document
+    # complet en JSON, sa date de modification distante (updated_at) et sa version répliquée
+    # (updated_at, ou empreinte du contenu à défaut) pour ne réécrire que ce qui a changé.
+    conn.execute('''CREATE TABLE IF NOT EXISTS replica_produits
+                    (firebase_id TEXT PRIMARY KEY, updated_at TEXT, version TEXT, donnees TEXT,
+                     nom TEXT, categorie TEXT, prix_achat REAL, prix_vente REAL,
+                     stock_actuel REAL, stock_min REAL, unite TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS replica_clients
+                    (firebase_id TEXT PRIMARY KEY, updated_at TEXT, version TEXT, donnees TEXT,
+                     nom TEXT, telephone TEXT, adresse TEXT, email TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS replica_factures
+                    (firebase_id TEXT PRIMARY KEY, updated_at TEXT, version TEXT, donnees TEXT,
+                     numero TEXT, date TEXT, client_nom TEXT, montant_total REAL, type TEXT, statut TEXT)''')
+    # produit_id : identifiant Firestore du produit
+    conn.execute('''CREATE TABLE IF NOT EXISTS replica_mouvements
+                    (firebase_id TEXT PRIMARY KEY, updated_at TEXT, version TEXT, donnees TEXT,
+                     date TEXT, produit_id TEXT, produit_nom TEXT, type TEXT, quantite REAL, reference TEXT)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_replica_mouvements_date ON replica_mouvements(date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_replica_mouvements_produit ON replica_mouvements(produit_id, date)")
+    # Autres collections (devis, config) : un document JSON par ligne
+    conn.execute('''CREATE TABLE IF NOT EXISTS documents_replica
+                    (collection TEXT NOT NULL,
+                     doc_id TEXT NOT NULL,
+                     donnees TEXT,
+                     updated_at TEXT,
+                     version TEXT,
+                     PRIMARY KEY (collection, doc_id))''')
+    # Écritures faites hors ligne, rejouées vers Firestore dans l'ordre d'insertion
+    conn.execute('''CREATE TABLE IF NOT EXISTS outbox
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     collection TEXT NOT NULL,
+                     operation TEXT NOT NULL,
+                     doc_id TEXT,
+                     payload TEXT,
+                     base_updated_at TEXT,
+                     statut TEXT NOT NULL DEFAULT 'en_attente',
+                     tentatives INTEGER NOT NULL DEFAULT 0,
+                     erreur TEXT,
+                     created_at TEXT)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_statut ON outbox(statut, id)")
+
+
+def _mois(expr):
+    return f"COALESCE(substr({expr}, 1, 7), 'inconnu')"
+
+
+# Sorties / entrées d'un mouvement selon son type ('Entrée', 'entree', 'Sortie', ...)
+_ENTREE = "CASE WHEN lower({t}.type) LIKE 'entr%' THEN {t}.quantite ELSE 0 END"
+_SORTIE = "CASE WHEN lower({t}.type) LIKE 'sort%' THEN {t}.quantite ELSE 0 END"
+
+
+def rebuild_reporting(conn):
+    """Recalcule entièrement les tables de synthèse depuis les tables de détail
+    (reprise de l'historique, contrôle de cohérence)."""
+    for table in ("resume_ventes_mois", "resume_ventes_client", "resume_ventes_produit", "resume_mouvements_mois"):
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute(f"""INSERT INTO resume_ventes_mois (mois, type, nb_documents, montant_total)
+                     SELECT {_mois('date')}, COALESCE(type, ''), COUNT(*), COALESCE(SUM(montant_total), 0)
+                     FROM factures GROUP BY 1, 2""")
+    conn.execute("""INSERT INTO resume_ventes_client (client_nom, nb_factures, montant_total)
+                    SELECT COALESCE(client_nom, ''), COUNT(*), COALESCE(SUM(montant_total), 0)
+                    FROM factures WHERE type = 'Facture' GROUP BY 1""")
+    conn.execute("""UPDATE lignes_facture SET cout_unitaire =
+                    (SELECT prix_achat FROM produits WHERE produits.nom = lignes_facture.produit_nom COLLATE NOCASE)
+                    WHERE cout_unitaire IS NULL""")
+    conn.execute(f"""INSERT INTO resume_ventes_produit (mois, produit_nom, quantite, chiffre_affaires, cout)
+                     SELECT {_mois('f.date')}, l.produit_nom, SUM(l.quantite), SUM(l.montant),
+                            SUM(l.quantite * COALESCE(l.cout_unitaire, 0))
+                     FROM lignes_facture l JOIN factures f ON f.id = l.facture_id
+                     WHERE f.type = 'Facture' GROUP BY 1, 2""")
+    conn.execute(f"""INSERT INTO resume_mouvements_mois (mois, produit_id, entrees, sorties)
+                     SELECT {_mois('m.date')}, m.produit_id, SUM({_ENTREE.format(t='m')}), SUM({_SORTIE.format(t='m')})
+                     FROM mouvements_stock m WHERE m.produit_id IS NOT NULL GROUP BY 1, 2""")
+
+
+def _creer_resume_lignes(conn):
+    # Lignes de facture : quantités, CA et coût (prix d'achat figé à la vente) par produit et par mois
+    ventes_produit = f"""INSERT INTO resume_ventes_produit (mois, produit_nom, quantite, chiffre_affaires, cout)
+                         SELECT {_mois('f.date')}, {{r}}.produit_nom, {{s}}{{r}}.quantite, {{s}}{{r}}.montant,
+                                {{s}}{{r}}.quantite * COALESCE({{cout}}, 0)
+                         FROM factures f WHERE f.id = {{r}}.facture_id AND f.type = 'Facture'
+                         ON CONFLICT(mois, produit_nom) DO UPDATE SET
+                         quantite = quantite + excluded.quantite,
+                         chiffre_affaires = chiffre_affaires + excluded.chiffre_affaires,
+                         cout = cout + excluded.cout;"""
+    cout_courant = "(SELECT prix_achat FROM produits WHERE produits.nom = NEW.produit_nom COLLATE NOCASE)"
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_lignes_resume_ins AFTER INSERT ON lignes_facture BEGIN
+                     UPDATE lignes_facture SET cout_unitaire = COALESCE(NEW.cout_unitaire, {cout_courant})
+                     WHERE id = NEW.id;
+                     {ventes_produit.format(r='NEW', s='', cout=f'COALESCE(NEW.cout_unitaire, {cout_courant})')}
+                     END""")
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_lignes_resume_del AFTER DELETE ON lignes_facture BEGIN
+                     {ventes_produit.format(r='OLD', s='-', cout='OLD.cout_unitaire')}
+                     END""")
+
+
+def _creer_vue_marge(conn):
+    # Produit rapproché par nom sans distinction de casse (index idx_produits_nom)
+    conn.execute("""CREATE VIEW IF NOT EXISTS v_marge_categorie AS
+                    SELECT COALESCE(p.categorie, 'Autres') AS categorie,
+                           SUM(r.chiffre_affaires) AS chiffre_affaires, SUM(r.cout) AS cout,
+                           SUM(r.chiffre_affaires - r.cout) AS marge,
+                           CASE WHEN SUM(r.chiffre_affaires) > 0
+                                THEN 100.0 * SUM(r.chiffre_affaires - r.cout) / SUM(r.chiffre_affaires) END AS taux_marge
+                    FROM resume_ventes_produit r LEFT JOIN produits p ON p.nom = r.produit_nom COLLATE NOCASE
+                    GROUP BY 1""")
+
+
+def _migration_reporting(conn):
+    # Tables de synthèse tenues à jour par déclencheurs, donc dans la transaction
+    # d'écriture de la facture ou du mouvement
+    conn.execute("ALTER TABLE lignes_facture ADD COLUMN cout_unitaire REAL")
+    conn.execute('''CREATE TABLE IF NOT EXISTS resume_ventes_mois
+                    (mois TEXT NOT NULL,
+                     type TEXT NOT NULL,
+                     nb_documents INTEGER NOT NULL DEFAULT 0,
+                     montant_total REAL NOT NULL DEFAULT 0,
+                     PRIMARY KEY (mois, type))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS resume_ventes_client
+                    (client_nom TEXT PRIMARY KEY,
+                     nb_factures INTEGER NOT NULL DEFAULT 0,
+                     montant_total REAL NOT NULL DEFAULT 0)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS resume_ventes_produit
+                    (mois TEXT NOT NULL,
+                     produit_nom TEXT NOT NULL,
+                     quantite INTEGER NOT NULL DEFAULT 0,
+                     chiffre_affaires REAL NOT NULL DEFAULT 0,
+                     cout REAL NOT NULL DEFAULT 0,
+                     PRIMARY KEY (mois, produit_nom))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS resume_mouvements_mois
+                    (mois TEXT NOT NULL,
+                     produit_id INTEGER NOT NULL,
+                     entrees INTEGER NOT NULL DEFAULT 0,
+                     sorties INTEGER NOT NULL DEFAULT 0,
+                     PRIMARY KEY (mois, produit_id))''')
+
+    # Factures : CA mensuel par type de document et CA par client
+    ventes_mois = f"""INSERT INTO resume_ventes_mois (mois, type, nb_documents, montant_total)
+                      VALUES ({_mois('{r}.date')}, COALESCE({{r}}.type, ''), {{s}}1, {{s}}COALESCE({{r}}.montant_total, 0))
+                      ON CONFLICT(mois, type) DO UPDATE SET
+                      nb_documents = nb_documents + excluded.nb_documents,
+                      montant_total = montant_total + excluded.montant_total;"""
+    ventes_client = """INSERT INTO resume_ventes_client (client_nom, nb_factures, montant_total)
+                       SELECT COALESCE({r}.client_nom, ''), {s}1, {s}COALESCE({r}.montant_total, 0)
+                       WHERE {r}.type = 'Facture'
+                       ON CONFLICT(client_nom) DO UPDATE SET
+                       nb_factures = nb_factures + excluded.nb_factures,
+                       montant_total = montant_total + excluded.montant_total;"""
+    ajout = ventes_mois.format(r='NEW', s='') + ventes_client.format(r='NEW', s='')
+    retrait = ventes_mois.format(r='OLD', s='-') + ventes_client.format(r='OLD', s='-')
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_factures_resume_ins AFTER INSERT ON factures BEGIN {ajout} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_factures_resume_del AFTER DELETE ON factures BEGIN {retrait} END")
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_factures_resume_upd "
+                 "AFTER UPDATE OF date, type, client_nom, montant_total ON factures "
+                 f"BEGIN {retrait} {ajout} END")
+
+    _creer_resume_lignes(conn)
+
+    # Mouvements : entrées / sorties par produit et par mois (rotation du stock)
+    mouvements = f"""INSERT INTO resume_mouvements_mois (mois, produit_id, entrees, sorties)
+                     SELECT {_mois('{r}.date')}, {{r}}.produit_id, {{s}}({_ENTREE.format(t='{r}')}),
+                            {{s}}({_SORTIE.format(t='{r}')})
+                     WHERE {{r}}.produit_id IS NOT NULL
+                     ON CONFLICT(mois, produit_id) DO UPDATE SET
+                     entrees = entrees + excluded.entrees,
+                     sorties = sorties + excluded.sorties;"""
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_mouvements_resume_ins AFTER INSERT ON mouvements_stock "
+                 f"BEGIN {mouvements.format(r='NEW', s='')} END")
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_mouvements_resume_del AFTER DELETE ON mouvements_stock "
+                 f"BEGIN {mouvements.format(r='OLD', s='-')} END")
+    conn.execute("CREATE TRIGGER IF NOT EXISTS trg_mouvements_resume_upd "
+                 "AFTER UPDATE OF date, produit_id, type, quantite ON mouvements_stock "
+                 f"BEGIN {mouvements.format(r='OLD', s='-')} {mouvements.format(r='NEW', s='')} END")
+
+    # Vues de lecture des tableaux de bord (quelques lignes pré-agrégées)
+    conn.execute("""CREATE VIEW IF NOT EXISTS v_ca_mensuel AS
+                    SELECT mois, nb_documents AS nb_factures, montant_total AS chiffre_affaires
+                    FROM resume_ventes_mois WHERE type = 'Facture'""")
+    conn.execute("""CREATE VIEW IF NOT EXISTS v_top_produits AS
+                    SELECT produit_nom, SUM(quantite) AS quantite, SUM(chiffre_affaires) AS chiffre_affaires,
+                           SUM(chiffre_affaires - cout) AS marge
+                    FROM resume_ventes_produit GROUP BY produit_nom""")
+    _creer_vue_marge(conn)
+    # Rotation sur 12 mois glissants : sorties / stock moyen (début et fin de période)
+    conn.execute("""CREATE VIEW IF NOT EXISTS v_rotation_stock AS
+                    SELECT p.id AS produit_id, p.nom, p.categorie, p.stock_actuel,
+                           COALESCE(m.entrees, 0) AS entrees_12m, COALESCE(m.sorties, 0) AS sorties_12m,
+                           (2 * p.stock_actuel - COALESCE(m.entrees, 0) + COALESCE(m.sorties, 0)) / 2.0 AS stock_moyen,
+                           CASE WHEN (2 * p.stock_actuel - COALESCE(m.entrees, 0) + COALESCE(m.sorties, 0)) > 0
+                                THEN COALESCE(m.sorties, 0) * 2.0
+                                     / (2 * p.stock_actuel - COALESCE(m.entrees, 0) + COALESCE(m.sorties, 0)) END AS rotation
+                    FROM produits p LEFT JOIN (
+                        SELECT produit_id, SUM(entrees) AS entrees, SUM(sorties) AS sorties
+                        FROM resume_mouvements_mois
+                        WHERE mois >= strftime('%Y-%m', 'now', 'start of month', '-11 months')
+                        GROUP BY produit_id) m ON m.produit_id = p.id""")
+    rebuild_reporting(conn)
+
+
+def _migration_pvgis_cache(conn):
+    # Réponses PVGIS persistantes (voir pvgis_store) : partagées entre processus et redémarrages
+    conn.execute('''CREATE TABLE IF NOT EXISTS pvgis_cache
+                    (cle TEXT PRIMARY KEY,
+                     lat REAL,
+                     lon REAL,
+                     angle TEXT,
+                     aspect TEXT,
+                     raddatabase TEXT,
+                     reponse TEXT NOT NULL,
+                     fetched_at TEXT NOT NULL)''')
+
+
+def _migration_prix_boutique(conn):
+    # Index des prix de la boutique en ligne (voir price_index) : lu par les devis sans réseau
+    conn.execute('''CREATE TABLE IF NOT EXISTS prix_boutique
+                    (url TEXT PRIMARY KEY,
+                     nom TEXT NOT NULL,
+                     prix INTEGER NOT NULL,
+                     categorie TEXT,
+                     equipement TEXT,
+                     score REAL,
+                     crawled_at TEXT NOT NULL,
+                     prix_precedent INTEGER,
+                     modifie_at TEXT,
+                     decision TEXT,
+                     prix_decision INTEGER)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_prix_boutique_equipement ON prix_boutique(equipement)")
+
+
+def _migration_nom_produit_sans_casse(conn):
+    # Unicité du nom de produit sans tenir compte de la casse, comme le dédoublonnage des imports
+    conn.execute('''UPDATE produits SET nom = nom || ' (#' || id || ')'
+                    WHERE id NOT IN (SELECT MIN(id) FROM produits GROUP BY nom COLLATE NOCASE)''')
+    conn.execute("DROP INDEX IF EXISTS idx_produits_nom")
+    conn.execute("CREATE UNIQUE INDEX idx_produits_nom ON produits(nom COLLATE NOCASE)")
+    # Recherches par nom (coût d'achat, marge) : comparaisons NOCASE servies par le nouvel index
+    conn.execute("DROP TRIGGER IF EXISTS trg_lignes_resume_ins")
+    conn.execute("DROP VIEW IF EXISTS v_marge_categorie")
+    _creer_resume_lignes(conn)
+    _creer_vue_marge(conn)
+
+
+MIGRATIONS = [
+    (1, "Schéma initial", _migration_schema_initial),
+    (2, "Index mouvements (produit, date), factures(date), lignes_facture(facture_id)", _migration_index_recherche),
+    (3, "Nom de produit unique", _migration_nom_produit_unique),
+    (4, "Réplique Firestore et file d'envoi (outbox)", _migration_replica_firestore),
+    (5, "Tables de synthèse et vues de reporting", _migration_reporting),
+    (6, "Cache persistant des réponses PVGIS", _migration_pvgis_cache),
+    (7, "Index des prix de la boutique en ligne", _migration_prix_boutique),
+    (8, "Nom de produit unique sans distinction de casse", _migration_nom_produit_sans_casse),
+]
+
+_migrated_paths = set()
+_migrate_lock = threading.Lock()
+
+
+def get_schema_version(path=None):
+    conn = get_connection(path)
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                    (version INTEGER PRIMARY KEY,
+                     description TEXT,
+                     applied_at TEXT)''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(path=None):
+    """Applique les migrations en attente (une seule fois par base et par processus).
+    Retourne la version de schéma atteinte.
+    """
+    key = path or DB_PATH
+    if key in _migrated_paths:
+        return MIGRATIONS[-1][0]
+    with _migrate_lock:
+        current = get_schema_version(path)
+        for version, description, apply in MIGRATIONS:
+            if version <= current:
+                continue
+            with transaction(path) as conn:
+                # Relecture sous verrou d'écriture : un autre processus a pu migrer entre-temps
+                if conn.execute("SELECT 1 FROM schema_version WHERE version=?", (version,)).fetchone():
+                    continue
+                apply(conn)
+                conn.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                             (version, description, datetime.now().isoformat(timespec="seconds")))
+            current = version
+        _migrated_paths.add(key)
+    return current
@@ -0,0 +1,95 @@
+"""
+Prévision de la demande et points de commande pour tous les produits à la fois
+Lissage exponentiel vectorisé sur la demande journalière issue du journal des mouvements
+"""
+
+import threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+from firebase_config import get_products_frame
+from stock_series import get_daily_demand
+
+# Paramètres par défaut (surchargeables via st.secrets["stock_forecast"])
+FORECAST_DEFAUTS = {
+    "historique_jours": 180,       # fenêtre de demande analysée
+    "alpha": 0.1,                  # coefficient de lissage exponentiel
+    "delai_jours": 14,             # délai moyen de réapprovisionnement fournisseur
+    "delai_ecart_type_jours": 5,   # variabilité du délai fournisseur
+    "periode_revue_jours": 30,     # couverture visée par une commande
+    "z_service": 1.65,             # niveau de service ~95%
+}
+
+
+def get_forecast_params():
+    params = dict(FORECAST_DEFAUTS)
+    try:
+        for k, v in dict(st.secrets["stock_forecast"]).items():
+            if k in params:
+                params[k] = float(v)
+    except Exception:
+        pass
+    return params
+
+
+def compute_reorder_points(demand, stock, params):
+    """Calcule demande lissée, stock de sécurité, point de commande et quantité suggérée.
+    demand: DataFrame jours x produit_id ; stock: Series produit_id -> stock actuel.
+    Tous les produits sont traités en une seule passe vectorisée.
+    """
+    demand = demand.reindex(columns=stock.index, fill_value=0.0)
+    taux = demand.ewm(alpha=params["alpha"], adjust=False).mean().iloc[-1]
+    ecart_type = demand.std(ddof=0)
+    delai = params["delai_jours"]
+    delai_sigma = params["delai_ecart_type_jours"]
+    # Stock de sécurité combinant variabilité de la demande et du délai fournisseur
+    stock_securite = params["z_service"] * np.sqrt(delai * ecart_type ** 2 + (taux * delai_sigma) ** 2)
+    point_commande = taux * delai + stock_securite
+    niveau_cible = taux * (delai + params["periode_revue_jours"]) + stock_securite
+    quantite_suggeree = np.ceil((niveau_cible - stock).clip(lower=0))
+    jours_couverture = (stock / taux.where(taux > 0)).replace([np.inf, -np.inf], np.nan)
+    return pd.DataFrame({
+        "demande_jour": taux,
+        "ecart_type_jour": ecart_type,
+        "stock_actuel": stock,
+        "stock_securite": np.ceil(stock_securite),
+        "point_commande": np.ceil(point_commande),
+        "quantite_suggeree": quantite_suggeree.where(stock <= np.ceil(point_commande), 0.0),
+        "jours_couverture": jours_couverture,
+        "a_commander": (stock <= np.ceil(point_commande)) & (taux > 0),
+    })
+
+
+_cache_lock = threading.Lock()
+
+
+@st.cache_resource
+def _forecast_cache():
+    return {"key": None, "result": None}
+
+
+def get_reorder_forecast():
+    """Prévisions et points de commande pour tous les produits, indexées par produit_id
+    et enrichies du nom et de la catégorie. Recalculées seulement lorsque de nouveaux
+    mouvements ont été intégrés au journal ou que la version des données change.
+    """
+    params = get_forecast_params()
+    demand, ledger_key = get_daily_demand(days=int(params["historique_jours"]))
+    products = get_products_frame()
+    key = (ledger_key, tuple(sorted(params.items())), len(products))
+    cache = _forecast_cache()
+    with _cache_lock:
+        if cache["key"] != key:
+            stock = products.set_index("id")["stock_actuel"].astype("float64")
+            result = compute_reorder_points(demand, stock, params)
+            info = products.set_index("id")[["nom", "categorie", "stock_min"]]
+            cache["result"] = info.join(result)
+            cache["key"] = key
+        return cache["result"]
+
+
+def get_products_to_reorder():
+    """Produits dont le stock est au niveau ou sous le point de commande prévisionnel,
+    triés par nombre de jours de couverture restants (les plus urgents d'abord)."""
+    forecast = get_reorder_forecast()
+    return forecast[forecast["a_commander"]].sort_values("jours_couverture")
@@ -0,0 +1,153 @@
+"""
+Séries journalières de niveau de stock calculées depuis le journal des mouvements
+Par produit et par catégorie, étendues incrémentalement à l'arrivée de nouveaux mouvements
+"""
+
+import threading
+import streamlit as st
+import pandas as pd
+from firebase_config import fetch_stock_movements, get_products_frame, get_stock_data_version
+
+# Fenêtre relue derrière le dernier mouvement intégré : un mouvement validé en retard
+# (horodatage client antérieur, réplique hors ligne rejouée) y est encore rattrapé
+OVERLAP = pd.Timedelta(hours=24)
+# Lecture du journal par pages (historique initial et fenêtre incrémentale)
+PAGE_SIZE = 1000
+
+
+class _LedgerState:
+    """Matrice des variations journalières (jours x produits) gardée en mémoire par processus"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.daily = pd.DataFrame(dtype='float64')
+        self.daily_out = pd.DataFrame(dtype='float64')
+        self.last_seen = None
+        self.seen_ids = {}
+        # Reprise de l'historique : curseur (date, id) de la prochaine page plus ancienne
+        self.backfill_cursor = None
+        self.backfill_done = False
+        self.revision = 0
+        self.levels_key = None
+        self.levels = None
+
+
+@st.cache_resource
+def _ledger_state():
+    return _LedgerState()
+
+
+def _today():
+    return pd.Timestamp.now(tz='UTC').tz_localize(None).normalize()
+
+
+def _integrate(state, df):
+    """Ajoute à la matrice les mouvements d'une page qui n'y figurent pas encore."""
+    df = df.dropna(subset=['date', 'produit_id'])
+    if state.seen_ids:
+        df = df[~df['id'].isin(state.seen_ids)]
+    df = df.drop_duplicates(subset='id')
+    if df.empty:
+        return False
+    df = df.assign(jour=df['date'].dt.tz_localize(None).dt.normalize(),
+                   sortie=(-df['delta']).clip(lower=0))
+    new = df.pivot_table(index='jour', columns='produit_id', values='delta',
+                         aggfunc='sum', fill_value=0.0)
+    new_out = df.pivot_table(index='jour', columns='produit_id', values='sortie',
+                             aggfunc='sum', fill_value=0.0)
+    state.daily = state.daily.add(new, fill_value=0.0).fillna(0.0)
+    state.daily_out = state.daily_out.add(new_out, fill_value=0.0).fillna(0.0)
+    state.last_seen = max(df['date'].max(), state.last_seen) if state.last_seen is not None else df['date'].max()
+    # Ne garder que les ids encore couverts par la fenêtre de recouvrement
+    state.seen_ids.update(zip(df['id'], df['date']))
+    horizon = state.last_seen - OVERLAP
+    state.seen_ids = {k: d for k, d in state.seen_ids.items() if d >= horizon}
+    state.revision += 1
+    return True
+
+
+def _next_cursor(page):
+    return None if len(page) < PAGE_SIZE else (page['date'].iloc[-1], page['id'].iloc[-1])
+
+
+def _refresh(state):
+    """Intègre les mouvements pas encore vus, sans cache de requête (lecture réellement incrémentale).
+    - fenêtre récente : la requête repart de last_seen - OVERLAP et les mouvements déjà vus sont
+      écartés par id, ce qui rattrape les validations tardives et les horodatages égaux à last_seen
+    - historique : reprise page par page (du plus récent au plus ancien) ; après une erreur,
+      la reprise continue au prochain appel depuis la dernière page intégrée
+    """
+    changed = False
+    try:
+        if state.last_seen is not None and state.backfill_done:
+            start, cursor = state.last_seen - OVERLAP, None
+            while True:
+                page = fetch_stock_movements(start=start, limit=PAGE_SIZE, start_after=cursor)
+                changed |= _integrate(state, page)
+                cursor = _next_cursor(page)
+                if cursor is None:
+                    break
+        while not state.backfill_done:
+            page = fetch_stock_movements(limit=PAGE_SIZE, start_after=state.backfill_cursor)
+            changed |= _integrate(state, page)
+            state.backfill_cursor = _next_cursor(page)
+            state.backfill_done = state.backfill_cursor is None
+    except Exception as e:
+        st.error(f"Erreur lecture des mouvements de stock: {e}")
+    return changed
+
+
+def _compute_levels(daily, products):
+    """Niveau en fin de journée = stock actuel - somme des variations des jours suivants"""
+    today = _today()
+    start = min(daily.index.min(), today) if not daily.empty else today
+    index = pd.date_range(start, today, freq='D')
+    columns = pd.Index(products['id']).union(daily.columns)
+    d = daily.reindex(index=index, columns=columns, fill_value=0.0)
+    stock_now = products.set_index('id')['stock_actuel'].reindex(columns).fillna(0).astype('float64')
+    # Somme (vectorisée) des variations strictement postérieures à chaque jour
+    after = d.iloc[::-1].cumsum().iloc[::-1] - d
+    return after.mul(-1).add(stock_now, axis=1)
+
+
+def get_daily_stock_levels(days=None, by='produit'):
+    """Série journalière des niveaux de stock.
+    - by='produit' : une colonne par produit_id ; by='categorie' : une colonne par catégorie
+    - days : ne retourner que les N derniers jours (None = tout l'historique)
+    Le résultat est mis en cache par version de données et dernier mouvement intégré.
+    """
+    state = _ledger_state()
+    products = get_products_frame()
+    with state.lock:
+        _refresh(state)
+        key = (get_stock_data_version(), state.revision, len(products))
+        if state.levels_key != key:
+            state.levels = _compute_levels(state.daily, products)
+            state.levels_key = key
+        levels = state.levels
+    if days:
+        levels = levels.iloc[-int(days):]
+    if by == 'categorie':
+        categories = products.set_index('id')['categorie'].reindex(levels.columns).fillna('Autres')
+        levels = levels.T.groupby(categories.values).sum().T
+    return levels
+
+
+def get_daily_demand(days=180):
+    """Demande journalière (sorties de stock) par produit sur les N derniers jours.
+    Retourne (demande, clé) : un DataFrame jours x produit_id complété par des zéros,
+    et une clé qui change dès qu'un nouveau mouvement est intégré (pour les caches dérivés).
+    """
+    state = _ledger_state()
+    with state.lock:
+        _refresh(state)
+        daily_out = state.daily_out
+        key = (get_stock_data_version(), state.revision)
+    today = _today()
+    index = pd.date_range(today - pd.Timedelta(days=int(days) - 1), today, freq='D')
+    return daily_out.reindex(index=index, fill_value=0.0), key
+
+
+def get_total_stock_series(days=30):
+    """Unités totales en stock par jour (tous produits confondus)"""
+    levels = get_daily_stock_levels(days=days)
+    return levels.sum(axis=1)
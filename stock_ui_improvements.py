@@ -8,7 +8,7 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import timedelta
 import numpy as np
 
 def create_modern_metric_card(title, value, delta=None, delta_color="normal", icon="📊"):
@@ -107,22 +107,26 @@ def create_stock_alert_card(product_name, current_stock, min_stock, category="")
     
     st.markdown(card_html, unsafe_allow_html=True)
 
-def create_advanced_stock_chart(df_products):
-    """Crée un graphique avancé de l'état du stock"""
+def stock_status(df_products, labels=('Rupture', 'Stock faible', 'Stock OK')):
+    """Statut de stock vectorisé (rupture / faible / OK) pour un DataFrame produits normalisé"""
+    stock = df_products['stock_actuel']
+    stock_min = df_products['stock_min'] if 'stock_min' in df_products.columns else 0
+    return pd.Series(
+        np.select([stock <= 0, stock <= stock_min], labels[:2], default=labels[2]),
+        index=df_products.index
+    )
+
+def create_advanced_stock_chart(df_products, stock_evolution=None):
+    """Crée un graphique avancé de l'état du stock
+    stock_evolution: série journalière d'unités en stock (par défaut calculée depuis les mouvements)
+    """
     
     if df_products.empty:
         st.info("Aucun produit à afficher")
         return
     
-    # Préparer les données
-    df_chart = df_products.copy()
-    df_chart['status'] = df_chart.apply(lambda row: 
-        'Rupture' if row['quantite'] == 0 
-        else 'Stock faible' if row['quantite'] <= row.get('stock_min', 0)
-        else 'Stock OK', axis=1)
-    
-    df_chart['pourcentage_stock'] = df_chart.apply(lambda row:
-        (row['quantite'] / max(row.get('stock_min', 1) * 2, 1)) * 100, axis=1)
+    # Préparer les données (colonnes calculées sur une copie : le DataFrame partagé reste intact)
+    df_chart = df_products.assign(status=stock_status(df_products))
     
     # Créer le graphique
     fig = make_subplots(
@@ -146,28 +150,33 @@ def create_advanced_stock_chart(df_products):
     
     # Graphique en barres - Stock par catégorie
     if 'categorie' in df_chart.columns:
-        cat_stock = df_chart.groupby('categorie')['quantite'].sum().reset_index()
+        cat_stock = df_chart.groupby('categorie')['stock_actuel'].sum().reset_index()
         fig.add_trace(
-            go.Bar(x=cat_stock['categorie'], y=cat_stock['quantite'],
+            go.Bar(x=cat_stock['categorie'], y=cat_stock['stock_actuel'],
                    marker_color='#007bff', name="Stock par catégorie"),
             row=1, col=2
         )
     
-    # Simulation d'évolution du stock (derniers 30 jours)
-    dates = pd.date_range(end=datetime.now(), periods=30, freq='D')
-    stock_evolution = np.random.randint(80, 120, 30)  # Simulation
+    # Évolution réelle du stock (30 derniers jours) reconstruite depuis le journal des mouvements
+    if stock_evolution is None:
+        try:
+            from stock_series import get_total_stock_series
+            stock_evolution = get_total_stock_series(days=30)
+        except Exception as e:
+            st.warning(f"Évolution du stock indisponible: {e}")
+            stock_evolution = pd.Series(dtype='float64')
     
     fig.add_trace(
-        go.Scatter(x=dates, y=stock_evolution, mode='lines+markers',
+        go.Scatter(x=stock_evolution.index, y=stock_evolution.values, mode='lines+markers',
                    line=dict(color='#28a745', width=3),
                    marker=dict(size=6), name="Évolution stock"),
         row=2, col=1
     )
     
     # Top 10 produits par stock
-    top_products = df_chart.nlargest(10, 'quantite')
+    top_products = df_chart.nlargest(10, 'stock_actuel')
     fig.add_trace(
-        go.Bar(x=top_products['quantite'], y=top_products['nom'],
+        go.Bar(x=top_products['stock_actuel'], y=top_products['nom'],
                orientation='h', marker_color='#17a2b8', name="Top produits"),
         row=2, col=2
     )
@@ -190,8 +199,8 @@ def create_financial_overview(df_products, df_movements=None):
         return
     
     # Calculs financiers
-    valeur_stock_achat = (df_products['quantite'] * df_products.get('prix_achat', 0)).sum()
-    valeur_stock_vente = (df_products['quantite'] * df_products.get('prix_vente', 0)).sum()
+    valeur_stock_achat = (df_products['stock_actuel'] * df_products.get('prix_achat', 0)).sum()
+    valeur_stock_vente = (df_products['stock_actuel'] * df_products.get('prix_vente', 0)).sum()
     marge_potentielle = valeur_stock_vente - valeur_stock_achat
     
     # Affichage des métriques financières
@@ -254,8 +263,8 @@ def create_interactive_product_table(df_products):
     with col_filter3:
         search_term = st.text_input("Rechercher un produit", placeholder="Nom du produit...")
     
-    # Appliquer les filtres
-    df_filtered = df_products.copy()
+    # Appliquer les filtres (les masques booléens produisent de nouveaux DataFrames)
+    df_filtered = df_products
     
     if selected_category != 'Toutes' and 'categorie' in df_products.columns:
         df_filtered = df_filtered[df_filtered['categorie'] == selected_category]
@@ -265,28 +274,25 @@ def create_interactive_product_table(df_products):
     
     if stock_filter != 'Tous':
         if stock_filter == 'Rupture de stock':
-            df_filtered = df_filtered[df_filtered['quantite'] == 0]
+            df_filtered = df_filtered[df_filtered['stock_actuel'] == 0]
         elif stock_filter == 'Stock faible':
             df_filtered = df_filtered[
-                (df_filtered['quantite'] > 0) & 
-                (df_filtered['quantite'] <= df_filtered.get('stock_min', 0))
+                (df_filtered['stock_actuel'] > 0) & 
+                (df_filtered['stock_actuel'] <= df_filtered.get('stock_min', 0))
             ]
         elif stock_filter == 'Stock OK':
-            df_filtered = df_filtered[df_filtered['quantite'] > df_filtered.get('stock_min', 0)]
+            df_filtered = df_filtered[df_filtered['stock_actuel'] > df_filtered.get('stock_min', 0)]
     
     # Affichage du tableau avec style
     if not df_filtered.empty:
         st.markdown(f"**{len(df_filtered)} produit(s) trouvé(s)**")
         
         # Ajouter des colonnes de statut visuelles
-        df_display = df_filtered.copy()
-        df_display['Statut'] = df_display.apply(lambda row:
-            '🚨 Rupture' if row['quantite'] == 0
-            else '⚠️ Faible' if row['quantite'] <= row.get('stock_min', 0)
-            else '✅ OK', axis=1)
+        df_display = df_filtered.assign(Statut=stock_status(
+            df_filtered, labels=('🚨 Rupture', '⚠️ Faible', '✅ OK')))
         
         # Réorganiser les colonnes pour l'affichage
-        columns_order = ['nom', 'categorie', 'quantite', 'stock_min', 'Statut']
+        columns_order = ['nom', 'categorie', 'stock_actuel', 'stock_min', 'Statut']
         if 'prix_vente' in df_display.columns:
             columns_order.append('prix_vente')
         
@@ -299,7 +305,7 @@ def create_interactive_product_table(df_products):
             column_config={
                 "nom": st.column_config.TextColumn("Nom du produit", width="medium"),
                 "categorie": st.column_config.TextColumn("Catégorie", width="small"),
-                "quantite": st.column_config.NumberColumn("Stock actuel", width="small"),
+                "stock_actuel": st.column_config.NumberColumn("Stock actuel", width="small"),
                 "stock_min": st.column_config.NumberColumn("Stock min", width="small"),
                 "Statut": st.column_config.TextColumn("Statut", width="small"),
                 "prix_vente": st.column_config.NumberColumn("Prix vente (FCFA)", width="medium")
@@ -317,17 +323,24 @@ def create_movement_timeline(df_movements):
     
     st.markdown("### 📈 Historique des Mouvements")
     
-    # Préparer les données pour la timeline
-    df_timeline = df_movements.copy()
-    df_timeline['date'] = pd.to_datetime(df_timeline['date'])
-    df_timeline = df_timeline.sort_values('date', ascending=False)
+    # Préparer les données pour la timeline (le DataFrame typé de query_stock_movements
+    # est déjà trié par date décroissante : pas de copie ni de conversion)
+    df_timeline = df_movements
+    if not pd.api.types.is_datetime64_any_dtype(df_timeline['date']):
+        df_timeline = df_timeline.assign(date=pd.to_datetime(df_timeline['date'], errors='coerce'))
+        df_timeline = df_timeline.sort_values('date', ascending=False)
     
     # Graphique des mouvements
     fig = go.Figure()
     
-    # Séparer les entrées et sorties
-    entrees = df_timeline[df_timeline['type'] == 'Entrée']
-    sorties = df_timeline[df_timeline['type'] == 'Sortie']
+    # Séparer les entrées et sorties (delta signé si disponible, sinon libellé du type)
+    if 'delta' in df_timeline.columns:
+        entrees = df_timeline[df_timeline['delta'] > 0]
+        sorties = df_timeline[df_timeline['delta'] < 0]
+    else:
+        type_norm = df_timeline['type'].astype(str).str.lower()
+        entrees = df_timeline[type_norm.str.startswith('entr')]
+        sorties = df_timeline[type_norm.str.startswith('sort')]
     
     if not entrees.empty:
         fig.add_trace(go.Scatter(
@@ -365,7 +378,7 @@ def create_movement_timeline(df_movements):
     
     if not recent_movements.empty:
         st.dataframe(
-            recent_movements[['date', 'produit_nom', 'type', 'quantite', 'reference']],
+            recent_movements[[c for c in ['date', 'produit_nom', 'type', 'quantite', 'reference'] if c in recent_movements.columns]],
             use_container_width=True,
             hide_index=True,
             column_config={
@@ -384,43 +397,22 @@ def show_stock_alerts_sidebar():
         st.markdown("### 🚨 Alertes Stock")
         
         try:
-            # Importer la fonction pour récupérer les produits depuis Firebase
-            from firebase_config import get_all_products_from_firebase
-            
-            # Récupérer les vrais produits depuis Firebase
-            products = get_all_products_from_firebase()
-            alerts = []
+            # DataFrame produits partagé (même objet que les onglets stock, lecture seule)
+            from firebase_config import get_products_frame
             
-            if products:
-                for product_id, product in products.items():
-                    stock_actuel = product.get('stock_actuel', 0)
-                    stock_min = product.get('stock_minimum', product.get('stock_min', 0))
-                    nom = product.get('nom', 'Produit sans nom')
-                    
-                    # Vérifier les conditions d'alerte
-                    if stock_actuel == 0:
-                        alerts.append({
-                            "nom": nom,
-                            "stock": stock_actuel,
-                            "min": stock_min,
-                            "type": "rupture"
-                        })
-                    elif stock_actuel <= stock_min and stock_min > 0:
-                        alerts.append({
-                            "nom": nom,
-                            "stock": stock_actuel,
-                            "min": stock_min,
-                            "type": "faible"
-                        })
+            df_products = get_products_frame()
+            ruptures = df_products[df_products['stock_actuel'] == 0]
+            faibles = df_products[(df_products['stock_actuel'] > 0) &
+                                  (df_products['stock_min'] > 0) &
+                                  (df_products['stock_actuel'] <= df_products['stock_min'])]
             
             # Afficher les alertes
-            for alert in alerts:
-                if alert["type"] == "rupture":
-                    st.error(f"🚨 {alert['nom']}: Rupture de stock")
-                else:
-                    st.warning(f"⚠️ {alert['nom']}: Stock faible ({alert['stock']}/{alert['min']})")
+            for nom in ruptures['nom']:
+                st.error(f"🚨 {nom or 'Produit sans nom'}: Rupture de stock")
+            for nom, stock, stock_min in zip(faibles['nom'], faibles['stock_actuel'], faibles['stock_min']):
+                st.warning(f"⚠️ {nom or 'Produit sans nom'}: Stock faible ({stock:g}/{stock_min:g})")
             
-            if not alerts:
+            if ruptures.empty and faibles.empty:
                 st.success("✅ Aucune alerte de stock")
                 
         except Exception as e:
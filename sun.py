@@ -5,16 +5,15 @@ st.set_page_config(
     layout="wide"
 )
 
-import requests
+import contextvars
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.parse import quote
 import pandas as pd
-import io
-from docx import Document
-from docx.shared import Pt
 import math
 import os
+import tempfile
 from firebase_config import (
     login_user, logout_user, is_user_authenticated, is_admin_user,
     save_quote_to_firebase, get_all_quotes, save_equipment_prices, get_equipment_prices,
@@ -27,18 +26,38 @@ from firebase_config import (
     get_all_users_with_roles, clear_users_cache, create_app_user, set_user_role, get_user_role_by_email,
     disable_app_user, delete_app_user, get_password_reset_link, is_admin_role_email,
     # Fonctions de gestion de stock
-    save_product_to_firebase, get_all_products_from_firebase, update_product_in_firebase, delete_product_from_firebase,
+    save_product_to_firebase, get_all_products_from_firebase, get_products_frame, update_product_in_firebase, delete_product_from_firebase,
     save_client_to_firebase, get_all_clients_from_firebase,
     save_invoice_to_firebase, get_all_invoices_from_firebase,
-    save_stock_movement_to_firebase, get_stock_movements_from_firebase,
+    record_stock_movement, query_stock_movements,
     clear_stock_cache, sync_sqlite_to_firebase
 )
 
 # Import des nouveaux modules
 from sync_products import get_stock_for_dimensioning_product, check_stock_availability, update_stock_after_quote
 from invoice_editor import show_invoice_editor
-from stock_ui_improvements import create_modern_metric_card, create_stock_alert_card, create_advanced_stock_chart, create_financial_overview, create_interactive_product_table, show_stock_alerts_sidebar
+from stock_ui_improvements import create_modern_metric_card, create_stock_alert_card, create_advanced_stock_chart, create_financial_overview, create_interactive_product_table, create_movement_timeline, show_stock_alerts_sidebar
 from matar_ai import matar_ai
+from stock_forecast import get_products_to_reorder
+import offline_store
+import bulk_io
+import psh_grid
+import pvgis_store
+import http_client
+import price_extraction
+import price_index
+from quote_renderer import build_quote_model, quote_hash, render_quote, FORMATS as QUOTE_FORMATS
+
+# Mode hors ligne : rejoue en arrière-plan les écritures faites pendant une coupure
+offline_store.start_background_sync()
+# Budget de latence des appels externes (PVGIS, boutique) pour cette exécution de la page
+http_client.start_budget()
+# Connexion à l'assistant IA ouverte dès le démarrage si une clé DeepSeek est configurée
+try:
+    if st.secrets.get("DEEPSEEK_API_KEY"):
+        http_client.warm_up("deepseek")
+except Exception:
+    pass
 
 # Fonction pour synchroniser les données locales vers Firebase
 def sync_local_to_firebase():
@@ -276,6 +295,13 @@ PRIX_EQUIPEMENTS = {
     }
 }
 
+# Indexation quotidienne du catalogue de la boutique en ligne (prix en ligne des devis sans réseau)
+def _catalogue_prix_boutique():
+    """Articles courants (Firebase, sinon prix par défaut) pour le rapprochement en tâche de fond, sans affichage"""
+    return get_equipment_prices() or PRIX_EQUIPEMENTS
+
+price_index.start_background_crawl(_catalogue_prix_boutique)
+
 
 
 # Informations sur les types de batteries
@@ -470,17 +496,14 @@ Réponds de manière claire et pratique en français, avec des conseils adaptés
             "temperature": 0.7
         }
         
-        response = requests.post(
-            "https://api.deepseek.com/v1/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=30
-        )
+        response = http_client.post("deepseek", "v1/chat/completions", headers=headers, json=data)
         
         if response.status_code == 200:
             return response.json()['choices'][0]['message']['content']
         else:
             return f"❌ Erreur API: {response.status_code}"
+    except http_client.ServiceUnavailable:
+        return "⚠️ L'assistant IA est momentanément indisponible, réessayez dans une minute."
     except Exception as e:
         return f"❌ Erreur: {str(e)}"
 
@@ -530,129 +553,121 @@ Réponds de manière claire et pratique en français, avec des conseils adaptés
         }
         if max_tokens:
             data["max_tokens"] = max_tokens
-        resp = requests.post(
-            "https://api.deepseek.com/v1/chat/completions",
-            headers=headers,
-            json=data,
-            stream=True,
-            timeout=60
-        )
-        if resp.status_code != 200:
-            yield f"❌ Erreur API: {resp.status_code}"
-            return
-        chars_out = 0
-        for raw in resp.iter_lines():
-            if not raw:
-                continue
-            try:
-                line = raw.decode("utf-8") if isinstance(raw, (bytes, bytearray)) else str(raw)
-            except Exception:
-                line = str(raw)
-            if line.startswith("data: "):
-                payload = line[6:].strip()
-                if payload == "[DONE]":
-                    break
+        resp = http_client.post("deepseek", "v1/chat/completions", headers=headers, json=data, stream=True)
+        try:
+            if resp.status_code != 200:
+                yield f"❌ Erreur API: {resp.status_code}"
+                return
+            chars_out = 0
+            for raw in resp.iter_lines():
+                if not raw:
+                    continue
                 try:
-                    obj = json.loads(payload)
-                    choice = (obj.get("choices") or [{}])[0]
-                    delta = choice.get("delta", {})
-                    content = delta.get("content") or (choice.get("message", {}) or {}).get("content")
-                    if content:
-                        if concis and (limite_caracteres is not None):
-                            restant = max(0, limite_caracteres - chars_out)
-                            if restant <= 0:
-                                break
-                            morceau = content[:restant]
-                            chars_out += len(morceau)
-                            if morceau:
-                                yield morceau
-                            if chars_out >= (limite_caracteres or 0):
-                                break
-                        else:
-                            yield content
+                    line = raw.decode("utf-8") if isinstance(raw, (bytes, bytearray)) else str(raw)
                 except Exception:
-                    continue
+                    line = str(raw)
+                if line.startswith("data: "):
+                    payload = line[6:].strip()
+                    if payload == "[DONE]":
+                        break
+                    try:
+                        obj = json.loads(payload)
+                        choice = (obj.get("choices") or [{}])[0]
+                        delta = choice.get("delta", {})
+                        content = delta.get("content") or (choice.get("message", {}) or {}).get("content")
+                        if content:
+                            if concis and (limite_caracteres is not None):
+                                restant = max(0, limite_caracteres - chars_out)
+                                if restant <= 0:
+                                    break
+                                morceau = content[:restant]
+                                chars_out += len(morceau)
+                                if morceau:
+                                    yield morceau
+                                if chars_out >= (limite_caracteres or 0):
+                                    break
+                            else:
+                                yield content
+                    except Exception:
+                        continue
+        finally:
+            resp.close()  # rend la connexion au pool partagé
+    except http_client.ServiceUnavailable:
+        yield "⚠️ L'assistant IA est momentanément indisponible, réessayez dans une minute."
+        return
     except Exception as e:
         yield f"❌ Erreur: {str(e)}"
         return
 
 # --- Prix en ligne (energiesolairesenegal.com) ---
+# Les erreurs réseau sont levées (et donc non mises en cache) : un incident passager
+# de la boutique ne fige pas le repli sur les prix locaux pendant une heure.
 @st.cache_data(ttl=3600)
 def _rechercher_url_produit_solairesenegal(nom: str):
-    try:
-        url = f"https://energiesolairesenegal.com/?s={quote(nom)}"
-        r = requests.get(url, timeout=20)
-        html = r.text
-        m = re.search(r'href="(https?://[^"]*solairesenegal\\.com/(?:produit|product)/[^"]+)"', html, re.IGNORECASE)
-        if m:
-            return m.group(1)
-    except Exception:
-        return None
-    return None
+    r = http_client.get("boutique", f"?s={quote(nom)}")
+    return price_extraction.find_product_url(r.text)
 
 
 def _extraire_prix_fcfa(html: str):
-    candidates = re.findall(r'([0-9]{3,9}(?:[\s.,][0-9]{3})*)\s*(?:FCFA|F\s*CFA|CFA)', html, flags=re.IGNORECASE)
-    if not candidates:
-        return None
-    def _to_int(s):
-        digits = re.sub(r'[^0-9]', '', s)
-        try:
-            return int(digits)
-        except Exception:
-            return None
-    vals = [v for v in (_to_int(c) for c in candidates) if v is not None]
-    plausible = [v for v in vals if 1000 <= v <= 20000000]
-    return max(plausible) if plausible else (max(vals) if vals else None)
+    """Prix du produit principal de la page : données structurées d'abord, plein texte en repli."""
+    return price_extraction.extract_price(html)[0]
 
 @st.cache_data(ttl=3600)
+def _prix_page_produit(url_prod: str):
+    r = http_client.get("boutique", url_prod)
+    return _extraire_prix_fcfa(r.text)
+
+
 def obtenir_prix_depuis_site(nom_item: str):
-    url_prod = _rechercher_url_produit_solairesenegal(nom_item)
+    """(prix, url) du produit sur la boutique en ligne ; (None, ...) si indisponible
+    (boutique en panne, disjoncteur ouvert, budget de latence épuisé) : prix locaux en repli."""
+    try:
+        url_prod = _rechercher_url_produit_solairesenegal(nom_item)
+    except Exception:
+        return None, None
     if not url_prod:
         return None, None
     try:
-        r = requests.get(url_prod, timeout=20)
-        prix = _extraire_prix_fcfa(r.text)
-        return prix, url_prod
+        return _prix_page_produit(url_prod), url_prod
     except Exception:
         return None, url_prod
 
-@st.cache_data(ttl=86400)
-def get_pvgis_monthly_psh(lat, lon, optimalangles=True, angle=None, aspect=None, raddatabase="PVGIS-SARAH3"):
+# Requêtes simultanées vers la boutique pour un devis (sessions keep-alive partagées par http_client)
+PRIX_EN_LIGNE_WORKERS = 8
+
+
+def obtenir_prix_depuis_site_multi(noms):
+    """Prix en ligne de plusieurs articles en parallèle : {nom: (prix, url)}.
+    Les noms en double ne sont demandés qu'une fois ; chaque tâche hérite du budget de latence
+    de la page, et les articles non résolus dans le budget restent à (None, None) (prix locaux)."""
+    noms = list(dict.fromkeys(n for n in noms if n))
+    resultats = {nom: (None, None) for nom in noms}
+    if not noms:
+        return resultats
+    pool = ThreadPoolExecutor(max_workers=min(PRIX_EN_LIGNE_WORKERS, len(noms)), thread_name_prefix="prix-en-ligne")
+    try:
+        futures = {pool.submit(contextvars.copy_context().run, obtenir_prix_depuis_site, nom): nom for nom in noms}
+        restant = http_client.remaining_budget()
+        termines, _ = wait(futures, timeout=None if restant is None else max(restant, 0))
+        for future in termines:
+            try:
+                resultats[futures[future]] = future.result()
+            except Exception:
+                pass
+    finally:
+        # Les requêtes encore en cours expirent d'elles-mêmes avec le budget : on ne les attend pas
+        pool.shutdown(wait=False, cancel_futures=True)
+    return resultats
+
+def get_pvgis_monthly_psh(lat, lon, optimalangles=True, angle=None, aspect=None, raddatabase="PVGIS-SARAH3",
+                          refresh=False):
     """Récupère les PSH (E_d kWh/kWp/jour) mensuelles via PVGIS PVcalc.
+    Les réponses sont conservées dans le cache persistant local (pvgis_store) : une position
+    déjà interrogée ne refait pas d'appel réseau ; refresh=True force l'actualisation.
     Retourne un dict: {"psh_by_month": {1: val, ..., 12: val}, "meta": {...}}
     """
-    try:
-        params = {
-            "lat": float(lat),
-            "lon": float(lon),
-            "peakpower": 1,
-            "loss": 14,
-            "outputformat": "json",
-            "raddatabase": raddatabase,
-            "pvtechchoice": "crystSi"
-        }
-        if optimalangles:
-            params["optimalangles"] = 1
-        else:
-            params["optimalangles"] = 0
-            if angle is not None:
-                params["angle"] = float(angle)
-            if aspect is not None:
-                params["aspect"] = float(aspect)
-        resp = requests.get("https://re.jrc.ec.europa.eu/api/PVcalc", params=params, timeout=30)
-        data = resp.json()
-        monthly = data.get("outputs", {}).get("monthly", [])
-        psh_by_month = {int(m.get("month")): float(m.get("E_d")) for m in monthly if m.get("E_d") is not None}
-        meta = {
-            "angle": data.get("inputs", {}).get("angle"),
-            "aspect": data.get("inputs", {}).get("aspect"),
-            "raddatabase": data.get("inputs", {}).get("raddatabase"),
-            "location": data.get("inputs", {}).get("location")
-        }
-        return {"psh_by_month": psh_by_month, "meta": meta}
-    except Exception as e:
-        return {"psh_by_month": {}, "meta": {"error": str(e)}}
+    return pvgis_store.get_monthly_psh(lat, lon, optimalangles=optimalangles, angle=angle, aspect=aspect,
+                                       raddatabase=raddatabase, refresh=refresh)
 
 # Fonction de dimensionnement améliorée
 def calculer_dimensionnement(consommation_journaliere, autonomie_jours=1, voltage=12, type_batterie="AGM", part_nuit=0.5):
@@ -1032,6 +1047,17 @@ def estimer_kwh_depuis_facture(montant_fcfa: float, type_compteur: str = "mensue
 def calculer_devis(equipements, use_online=False, accessoires_rate=0.15, region_selectionnee=None):
     # Obtenir les prix actuels (Firebase ou par défaut)
     prix_equipements = get_current_prices()
+
+    # Prix en ligne des articles du devis : index local de la boutique (sans réseau), puis
+    # recherche directe sur le site, en une seule vague parallèle, des seuls articles non indexés
+    prix_en_ligne = {}
+    if use_online:
+        onduleur_data = equipements["onduleur"]
+        onduleur_nom = onduleur_data[0] if isinstance(onduleur_data, tuple) else onduleur_data
+        noms = [n for n in (equipements["panneau"][0], equipements["batterie"][0], onduleur_nom,
+                            equipements["regulateur"]) if n]
+        prix_en_ligne = {nom: price_index.lookup(nom) for nom in noms}
+        prix_en_ligne.update(obtenir_prix_depuis_site_multi([n for n in noms if not prix_en_ligne[n][0]]))
     
     total = 0
     details = []
@@ -1043,7 +1069,7 @@ def calculer_devis(equipements, use_online=False, accessoires_rate=0.15, region_
         source_prix = "local"
         url_source = None
         if use_online:
-            prix_site, url_site = obtenir_prix_depuis_site(panneau_nom)
+            prix_site, url_site = prix_en_ligne.get(panneau_nom, (None, None))
             if prix_site:
                 prix_unitaire = prix_site
                 source_prix = "site"
@@ -1080,7 +1106,7 @@ def calculer_devis(equipements, use_online=False, accessoires_rate=0.15, region_
         source_prix = "local"
         url_source = None
         if use_online:
-            prix_site, url_site = obtenir_prix_depuis_site(batterie_nom)
+            prix_site, url_site = prix_en_ligne.get(batterie_nom, (None, None))
             if prix_site:
                 prix_unitaire = prix_site
                 source_prix = "site"
@@ -1112,7 +1138,7 @@ def calculer_devis(equipements, use_online=False, accessoires_rate=0.15, region_
             source_prix = "local"
             url_source = None
             if use_online:
-                prix_site, url_site = obtenir_prix_depuis_site(onduleur_nom)
+                prix_site, url_site = prix_en_ligne.get(onduleur_nom, (None, None))
                 if prix_site:
                     prix_unitaire = prix_site
                     source_prix = "site"
@@ -1142,7 +1168,7 @@ def calculer_devis(equipements, use_online=False, accessoires_rate=0.15, region_
         source_prix = "local"
         url_source = None
         if use_online:
-            prix_site, url_site = obtenir_prix_depuis_site(regulateur_nom)
+            prix_site, url_site = prix_en_ligne.get(regulateur_nom, (None, None))
             if prix_site:
                 prix_unitaire = prix_site
                 source_prix = "site"
@@ -1335,6 +1361,36 @@ with st.sidebar:
         if st.button("🚪 Se déconnecter", use_container_width=True):
             logout_user()
             st.rerun()
+        
+        # État de la synchronisation hors ligne
+        etat_sync = offline_store.get_status()
+        if etat_sync['hors_ligne']:
+            st.warning(f"📴 Mode hors ligne — {etat_sync['en_attente']} opération(s) en attente de synchronisation")
+        elif etat_sync['en_attente']:
+            st.info(f"🔄 {etat_sync['en_attente']} opération(s) en cours de synchronisation")
+            if st.button("Synchroniser maintenant", use_container_width=True):
+                pushed, conflicts, errors = offline_store.sync_outbox()
+                st.success(f"✅ {pushed} opération(s) synchronisée(s)")
+                st.rerun()
+        # Services externes court-circuités après des échecs répétés
+        services_coupes = [nom for nom, etat in http_client.get_status().items() if etat != "ferme"]
+        if services_coupes:
+            st.caption(f"⚡ Service(s) externe(s) en repli : {', '.join(services_coupes)}")
+        if is_admin_user() and (etat_sync['conflits'] or etat_sync['erreurs']):
+            with st.expander(f"⚠️ Conflits de synchronisation ({etat_sync['conflits'] + etat_sync['erreurs']})"):
+                for entry in offline_store.get_conflicts():
+                    st.write(f"**{entry['collection']}/{entry['doc_id']}** — {entry['operation']} ({entry['statut']})")
+                    st.caption(entry['erreur'] or '')
+                    st.json(entry['payload'].get('data', entry['payload']))
+                    col_local, col_distant = st.columns(2)
+                    with col_local:
+                        if st.button("Garder local", key=f"outbox_local_{entry['id']}"):
+                            offline_store.resolve_conflict(entry['id'], keep='local')
+                            st.rerun()
+                    with col_distant:
+                        if st.button("Garder distant", key=f"outbox_distant_{entry['id']}"):
+                            offline_store.resolve_conflict(entry['id'], keep='distant')
+                            st.rerun()
 
 # (Supprimé) Mode développement et Debug Info retirés selon demande
 
@@ -1693,6 +1749,8 @@ with tab1:
         else:
             angle = st.slider("Inclinaison (°)", 0, 60, value=20, key="pvgis_angle")
             aspect = st.slider("Azimut (°)", -90, 90, value=0, help="0=Sud, -90=Est, 90=Ouest", key="pvgis_aspect")
+        st.checkbox("Actualiser depuis PVGIS (en ligne)", value=False, key="pvgis_refresh",
+                    help="Par défaut, les PSH sont lues dans la grille hors ligne du Sénégal ; PVGIS n'est interrogé que si coché ou hors grille")
         mode_mois = st.selectbox("Saison / Mois dimensionnant", ["Mois le plus défavorable (PSH min)", "Choisir un mois"], index=0, key="pvgis_month_mode")
         if mode_mois == "Choisir un mois":
             mois_label = ["Janvier","Février","Mars","Avril","Mai","Juin","Juillet","Août","Septembre","Octobre","Novembre","Décembre"]
@@ -1716,7 +1774,15 @@ with tab1:
                 optimal = st.session_state.get("pvgis_optimal", True)
                 angle = st.session_state.get("pvgis_angle", None)
                 aspect = st.session_state.get("pvgis_aspect", None)
-                pvgis = get_pvgis_monthly_psh(lat, lon, optimalangles=optimal, angle=angle, aspect=aspect)
+                # Grille hors ligne d'abord ; PVGIS en actualisation optionnelle ou hors emprise
+                pvgis = None
+                if not st.session_state.get("pvgis_refresh", False):
+                    pvgis = psh_grid.monthly_psh(lat, lon, optimalangles=optimal, angle=angle, aspect=aspect)
+                if pvgis is None:
+                    pvgis = get_pvgis_monthly_psh(lat, lon, optimalangles=optimal, angle=angle, aspect=aspect,
+                                                  refresh=st.session_state.get("pvgis_refresh", False))
+                    if not pvgis.get("psh_by_month"):
+                        pvgis = psh_grid.monthly_psh(lat, lon, optimalangles=optimal, angle=angle, aspect=aspect) or pvgis
                 monthly_psh = pvgis.get("psh_by_month", {})
                 pvgis_mode = st.session_state.get("pvgis_month_mode", "Mois le plus défavorable (PSH min)")
                 if monthly_psh:
@@ -2454,7 +2520,21 @@ with tab1:
                         })
                         st.bar_chart(df_psh.set_index("Mois"))
                     
-                    st.caption("📡 Source: PVGIS (Photovoltaic Geographical Information System) - Commission Européenne")
+                    meta_psh = st.session_state.get("pvgis_meta", {})
+                    if meta_psh.get("source") == "grille":
+                        st.caption("📡 Source: grille hors ligne issue de PVGIS (Photovoltaic Geographical Information System) - Commission Européenne")
+                        # La grille ne contient que des préréglages : afficher l'orientation réellement utilisée
+                        if meta_psh.get("optimalangles"):
+                            st.caption("📐 Orientation de la grille : angle optimal PVGIS")
+                        else:
+                            orientation = f"inclinaison {meta_psh.get('angle')}°, azimut {meta_psh.get('aspect')}°"
+                            if (meta_psh.get("angle"), meta_psh.get("aspect")) != (angle, aspect if aspect is not None else 0):
+                                orientation += f" (préréglage le plus proche de {angle}° / {aspect}°)"
+                            st.caption(f"📐 Orientation de la grille : {orientation}")
+                    else:
+                        st.caption("📡 Source: PVGIS (Photovoltaic Geographical Information System) - Commission Européenne")
+                        if psh_grid.load_grid() is None:
+                            st.caption("ℹ️ Grille hors ligne non installée (data/psh_senegal.npy, python psh_grid.py build) : PSH obtenues en ligne")
         else:
             st.error("❌ Veuillez entrer une consommation supérieure à 0")
 
@@ -2928,389 +3008,101 @@ if tab2 is not None:
             
             st.info("ℹ️ Contenu déplacé dans l’onglet ‘Estimation Financière & Rentabilité’.")
             
-            # Boutons de téléchargement
+            # Téléchargements : modèle de devis unique, documents générés à la demande
             st.markdown("---")
-            col_dl1, col_dl2 = st.columns(2)
             
-            with col_dl1:
-                
-                # Génération du devis texte
-                # Calcul minimal des métriques financières pour l'export (fallback si onglet finance non visité)
+            # Calcul minimal des métriques financières pour l'export (fallback si onglet finance non visité)
+            try:
+                # Fallback avec calcul mensuel par paliers Senelec
+                # Tarifs par palier (défaut si secrets indisponibles)
                 try:
-                    # Fallback avec calcul mensuel par paliers Senelec
-                    # Tarifs par palier (défaut si secrets indisponibles)
-                    try:
-                        t1 = float(st.secrets["formulas"]["facture"]["tarifs"]["tier1_price"])
-                    except Exception:
-                        t1 = 124.17
-                    try:
-                        t2 = float(st.secrets["formulas"]["facture"]["tarifs"]["tier2_price"])
-                    except Exception:
-                        t2 = 136.49
-                    try:
-                        t3 = float(st.secrets["formulas"]["facture"]["tarifs"]["tier3_price"])
-                    except Exception:
-                        t3 = 159.36
-                    # Consommation et production
-                    conso_jour = st.session_state.consommation if 'consommation' in st.session_state else 10.0
-                    kwh_mensuel_total_dev = conso_jour * 30.0
-                    prod_kwh_j_dev = st.session_state.get('production_solaire_kwh_j', 0.0)
-                    kwh_mensuel_solaire_dev = prod_kwh_j_dev * 30.0
-                    kwh_mensuel_apres_dev = max(kwh_mensuel_total_dev - kwh_mensuel_solaire_dev, 0.0)
-                    # Avant
-                    p1_av = min(150.0, kwh_mensuel_total_dev)
-                    p2_av = min(max(kwh_mensuel_total_dev - 150.0, 0.0), 100.0)
-                    p3_av = max(kwh_mensuel_total_dev - 250.0, 0.0)
-                    cout_mensuel_avant_dev = p1_av * t1 + p2_av * t2 + p3_av * t3
-                    # Après
-                    p1_ap = min(150.0, kwh_mensuel_apres_dev)
-                    p2_ap = min(max(kwh_mensuel_apres_dev - 150.0, 0.0), 100.0)
-                    p3_ap = max(kwh_mensuel_apres_dev - 250.0, 0.0)
-                    cout_mensuel_apres_dev = p1_ap * t1 + p2_ap * t2 + p3_ap * t3
-                    economie_mensuelle_dev = max(cout_mensuel_avant_dev - cout_mensuel_apres_dev, 0.0)
-
-                    economie_annuelle = st.session_state.get('economie_annuelle', economie_mensuelle_dev * 12)
-                    economie_10ans = st.session_state.get('economie_10ans', economie_annuelle * 10)
-                    retour_investissement = st.session_state.get('retour_investissement', (devis['total'] / economie_annuelle if economie_annuelle > 0 else float('inf')))
+                    t1 = float(st.secrets["formulas"]["facture"]["tarifs"]["tier1_price"])
                 except Exception:
-                    economie_annuelle = 0
-                    economie_10ans = 0
-                    retour_investissement = float('inf')
-
-                devis_text = f"""
-╔════════════════════════════════════════════════════════════════╗
-║        DEVIS ESTIMATIF - INSTALLATION SOLAIRE SÉNÉGAL         ║
-╚════════════════════════════════════════════════════════════════╝
-
-👤 INFORMATIONS CLIENT
-{'─' * 64}
-Nom du demandeur        : {nom_demandeur if nom_demandeur else "Non renseigné"}
-Région d'installation   : {region_selectionnee}
-
-📊 RÉSUMÉ DU SYSTÈME
-{'─' * 64}
-Consommation totale     : {st.session_state.consommation:.1f} kWh/jour
-Autonomie souhaitée     : {(st.session_state.autonomie_pct if 'autonomie_pct' in st.session_state else 100)} %
-Autonomie estimée       : {(st.session_state.autonomie_reelle_pct if 'autonomie_reelle_pct' in st.session_state else (st.session_state.autonomie_pct if 'autonomie_pct' in st.session_state else 100)):.0f} %
-Couverte estimée        : {(st.session_state.production_solaire_kwh_j if 'production_solaire_kwh_j' in st.session_state else (st.session_state.consommation_couverte if 'consommation_couverte' in st.session_state else st.session_state.consommation)):.1f} kWh/jour
-Puissance installée     : {devis['puissance_totale']:.2f} kWc
-Surface panneaux approx. : {devis['puissance_totale'] * SURFACE_PAR_KWC_M2 * (1 + MARGE_IMPLANTATION_SURFACE_PCT/100.0):.1f} m²
-Type de batterie        : {st.session_state.choix['type_batterie']}
-Voltage système         : {st.session_state.choix['voltage'] if st.session_state.choix['voltage'] == "High Voltage" else f"{st.session_state.choix['voltage']}V"}
-Type onduleur           : {st.session_state.choix['type_onduleur']}
-
-📦 DÉTAILS DES ÉQUIPEMENTS
-{'─' * 64}
-"""
-                for item in devis["details"]:
-                    devis_text += f"""
-{item['item']}
-  Quantité        : {item['quantite']}
-  Prix unitaire   : {item['prix_unitaire']:,} FCFA
-  Sous-total      : {item['sous_total']:,} FCFA
-"""
-                
-                devis_text += f"""
-{'═' * 64}
-💰 TOTAL ESTIMATIF : {devis['total']:,} FCFA
-{'═' * 64}
-
-
-💡 ANALYSE FINANCIÈRE
-{'─' * 64}
-Économie annuelle estimée      : {economie_annuelle:,.0f} FCFA
-Économie sur 10 ans            : {economie_10ans:,.0f} FCFA
-Retour sur investissement      : {retour_investissement:.1f} ans
-
-📝 NOTES IMPORTANTES
-{'─' * 64}
-- Prix indicatifs
-- Installation standard incluse
-- Garantie selon fabricant (panneaux: 25 ans, batteries: variable)
-- Maintenance recommandée tous les 6 mois
-
-{'═' * 64}
-Document généré automatiquement
-Pour plus d'informations : energiesolairesenegal.com
-{'═' * 64}
-"""
-                
-                # Génération du devis Word (.docx) avec tableau professionnel
-                doc = Document()
-                
-                # En-tête avec logo
-                header_paragraph = doc.add_paragraph()
-                header_paragraph.alignment = 1  # Centré
-                
-                # Ajouter le logo s'il existe
+                    t1 = 124.17
                 try:
-                    if os.path.exists("logo-solaire.svg"):
-                        # Convertir SVG en image temporaire pour Word (python-docx ne supporte pas SVG directement)
-                        # Pour l'instant, on ajoute juste le texte avec emoji
-                        run = header_paragraph.add_run("☀️ ENERGIE SOLAIRE SÉNÉGAL\n")
-                        run.font.size = Pt(16)
-                        run.bold = True
-                    else:
-                        run = header_paragraph.add_run("☀️ ENERGIE SOLAIRE SÉNÉGAL\n")
-                        run.font.size = Pt(16)
-                        run.bold = True
-                except:
-                    run = header_paragraph.add_run("☀️ ENERGIE SOLAIRE SÉNÉGAL\n")
-                    run.font.size = Pt(16)
-                    run.bold = True
-                
-                # Titre principal
-                title = doc.add_heading('DEVIS ESTIMATIF - INSTALLATION SOLAIRE SÉNÉGAL', 0)
-                title.alignment = 1  # Centré
-                
-                # Informations client
-                doc.add_heading('👤 INFORMATIONS CLIENT', level=1)
-                client_table = doc.add_table(rows=2, cols=2)
-                client_table.style = 'Table Grid'
-                client_table.cell(0, 0).text = 'Nom du demandeur'
-                client_table.cell(0, 1).text = nom_demandeur if nom_demandeur else "Non renseigné"
-                client_table.cell(1, 0).text = 'Région d\'installation'
-                client_table.cell(1, 1).text = region_selectionnee
-                
-                # Résumé du système
-                doc.add_heading('📊 RÉSUMÉ DU SYSTÈME', level=1)
-                resume_table = doc.add_table(rows=6, cols=2)
-                resume_table.style = 'Table Grid'
-                resume_table.cell(0, 0).text = 'Consommation totale'
-                resume_table.cell(0, 1).text = f"{st.session_state.consommation:.1f} kWh/jour"
-                resume_table.cell(1, 0).text = 'Autonomie souhaitée'
-                resume_table.cell(1, 1).text = f"{(st.session_state.autonomie_pct if 'autonomie_pct' in st.session_state else 100)} %"
-                resume_table.cell(2, 0).text = 'Puissance installée'
-                resume_table.cell(2, 1).text = f"{devis['puissance_totale']:.2f} kWc"
-                resume_table.cell(3, 0).text = 'Type de batterie'
-                resume_table.cell(3, 1).text = st.session_state.choix['type_batterie']
-                resume_table.cell(4, 0).text = 'Voltage système'
-                voltage_display = st.session_state.choix['voltage']
-                resume_table.cell(4, 1).text = voltage_display if voltage_display == "High Voltage" else f"{voltage_display}V"
-                resume_table.cell(5, 0).text = 'Type onduleur'
-                resume_table.cell(5, 1).text = st.session_state.choix['type_onduleur']
-                
-                # Tableau des équipements
-                doc.add_heading('📦 DÉTAILS DES ÉQUIPEMENTS', level=1)
-                equip_table = doc.add_table(rows=len(devis['details']) + 1, cols=4)
-                equip_table.style = 'Table Grid'
-                
-                # En-têtes du tableau
-                hdr_cells = equip_table.rows[0].cells
-                hdr_cells[0].text = 'Équipement'
-                hdr_cells[1].text = 'Quantité'
-                hdr_cells[2].text = 'Prix unitaire (FCFA)'
-                hdr_cells[3].text = 'Sous-total (FCFA)'
-                
-                # Données du tableau
-                for i, item in enumerate(devis['details']):
-                    row_cells = equip_table.rows[i + 1].cells
-                    row_cells[0].text = item['item']
-                    row_cells[1].text = str(item['quantite'])
-                    row_cells[2].text = f"{item['prix_unitaire']:,}"
-                    row_cells[3].text = f"{item['sous_total']:,}"
-                
-                # Total
-                doc.add_heading('💰 TOTAL ESTIMATIF', level=1)
-                total_table = doc.add_table(rows=1, cols=2)
-                total_table.style = 'Table Grid'
-                total_table.cell(0, 0).text = 'TOTAL'
-                total_table.cell(0, 1).text = f"{devis['total']:,} FCFA"
-                
-                # Analyse financière
-                doc.add_heading('💡 ANALYSE FINANCIÈRE', level=1)
-                analyse_table = doc.add_table(rows=3, cols=2)
-                analyse_table.style = 'Table Grid'
-                analyse_table.cell(0, 0).text = 'Économie annuelle estimée'
-                analyse_table.cell(0, 1).text = f"{economie_annuelle:,.0f} FCFA"
-                analyse_table.cell(1, 0).text = 'Économie sur 10 ans'
-                analyse_table.cell(1, 1).text = f"{economie_10ans:,.0f} FCFA"
-                analyse_table.cell(2, 0).text = 'Retour sur investissement'
-                analyse_table.cell(2, 1).text = f"{retour_investissement:.1f} ans"
-                
-                # Notes importantes
-                doc.add_heading('📝 NOTES IMPORTANTES', level=1)
-                notes = [
-                    "• Prix indicatifs",
-                    "• Installation standard incluse",
-                    "• Garantie selon fabricant (panneaux: 25 ans, batteries: variable)",
-                    "• Maintenance recommandée tous les 6 mois"
-                ]
-                for note in notes:
-                    doc.add_paragraph(note)
-                
-                # Informations de contact Energie Solaire Sénégal
-                doc.add_heading('📞 INFORMATIONS DE CONTACT', level=1)
-                contact_table = doc.add_table(rows=5, cols=2)
-                contact_table.style = 'Table Grid'
-                contact_table.cell(0, 0).text = '🏢 Entreprise'
-                contact_table.cell(0, 1).text = 'Energie Solaire Sénégal'
-                contact_table.cell(1, 0).text = '📍 Adresse'
-                contact_table.cell(1, 1).text = 'Castor 221 Dakar, Sénégal (En face du terrain de Football)'
-                contact_table.cell(2, 0).text = '📧 Email'
-                contact_table.cell(2, 1).text = 'energiesolairesenegal@gmail.com'
-                contact_table.cell(3, 0).text = '📞 Téléphones'
-                contact_table.cell(3, 1).text = '+221 77 631 42 25 / +221 78 177 39 26'
-                contact_table.cell(4, 0).text = '🌐 Site web'
-                contact_table.cell(4, 1).text = 'energiesolairesenegal.com'
-                
-                # Pied de page
-                doc.add_paragraph()
-                footer = doc.add_paragraph("Document généré automatiquement")
-                footer.alignment = 1  # Centré
-                footer_info = doc.add_paragraph("Votre partenaire de confiance pour l'énergie solaire au Sénégal")
-                footer_info.alignment = 1  # Centré
-                
-                docx_buffer = io.BytesIO()
-                doc.save(docx_buffer)
-                docx_buffer.seek(0)
-                st.download_button(
-                    "📥 Télécharger le devis (Word .docx)",
-                    docx_buffer.getvalue(),
-                    file_name=f"devis_solaire_{st.session_state.choix['voltage']}V.docx",
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    use_container_width=True
-                )
+                    t2 = float(st.secrets["formulas"]["facture"]["tarifs"]["tier2_price"])
+                except Exception:
+                    t2 = 136.49
+                try:
+                    t3 = float(st.secrets["formulas"]["facture"]["tarifs"]["tier3_price"])
+                except Exception:
+                    t3 = 159.36
+                # Consommation et production
+                conso_jour = st.session_state.consommation if 'consommation' in st.session_state else 10.0
+                kwh_mensuel_total_dev = conso_jour * 30.0
+                prod_kwh_j_dev = st.session_state.get('production_solaire_kwh_j', 0.0)
+                kwh_mensuel_solaire_dev = prod_kwh_j_dev * 30.0
+                kwh_mensuel_apres_dev = max(kwh_mensuel_total_dev - kwh_mensuel_solaire_dev, 0.0)
+                # Avant
+                p1_av = min(150.0, kwh_mensuel_total_dev)
+                p2_av = min(max(kwh_mensuel_total_dev - 150.0, 0.0), 100.0)
+                p3_av = max(kwh_mensuel_total_dev - 250.0, 0.0)
+                cout_mensuel_avant_dev = p1_av * t1 + p2_av * t2 + p3_av * t3
+                # Après
+                p1_ap = min(150.0, kwh_mensuel_apres_dev)
+                p2_ap = min(max(kwh_mensuel_apres_dev - 150.0, 0.0), 100.0)
+                p3_ap = max(kwh_mensuel_apres_dev - 250.0, 0.0)
+                cout_mensuel_apres_dev = p1_ap * t1 + p2_ap * t2 + p3_ap * t3
+                economie_mensuelle_dev = max(cout_mensuel_avant_dev - cout_mensuel_apres_dev, 0.0)
+
+                economie_annuelle = st.session_state.get('economie_annuelle', economie_mensuelle_dev * 12)
+                economie_10ans = st.session_state.get('economie_10ans', economie_annuelle * 10)
+                retour_investissement = st.session_state.get('retour_investissement', (devis['total'] / economie_annuelle if economie_annuelle > 0 else float('inf')))
+            except Exception:
+                economie_annuelle = 0
+                economie_10ans = 0
+                retour_investissement = float('inf')
+
+            autonomie_souhaitee = st.session_state.autonomie_pct if 'autonomie_pct' in st.session_state else 100
+            autonomie_estimee = st.session_state.autonomie_reelle_pct if 'autonomie_reelle_pct' in st.session_state else autonomie_souhaitee
+            couverte_estimee = (st.session_state.production_solaire_kwh_j if 'production_solaire_kwh_j' in st.session_state
+                                else (st.session_state.consommation_couverte if 'consommation_couverte' in st.session_state
+                                      else st.session_state.consommation))
+            modele_devis = build_quote_model(
+                devis, nom_demandeur, region_selectionnee,
+                systeme=[
+                    ("Consommation totale", f"{st.session_state.consommation:.1f} kWh/jour"),
+                    ("Autonomie souhaitée", f"{autonomie_souhaitee} %"),
+                    ("Autonomie estimée", f"{autonomie_estimee:.0f} %"),
+                    ("Couverte estimée", f"{couverte_estimee:.1f} kWh/jour"),
+                    ("Puissance installée", f"{devis['puissance_totale']:.2f} kWc"),
+                    ("Surface panneaux approx.", f"{surface_m2_resume:.1f} m²"),
+                    ("Type de batterie", st.session_state.choix['type_batterie']),
+                    ("Voltage système", voltage_text),
+                    ("Type onduleur", st.session_state.choix['type_onduleur']),
+                ],
+                finances=[
+                    ("Économie annuelle estimée", f"{economie_annuelle:,.0f} FCFA"),
+                    ("Économie sur 10 ans", f"{economie_10ans:,.0f} FCFA"),
+                    ("Retour sur investissement", f"{retour_investissement:.1f} ans"),
+                ],
+            )
+            empreinte_devis = quote_hash(modele_devis)
+            documents_devis = st.session_state.setdefault('documents_devis', {})
             
-            with col_dl2:
-                # Génération Excel (.xlsx) avec mise en forme professionnelle
-                from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
-                from openpyxl.utils.dataframe import dataframe_to_rows
-                from openpyxl import Workbook
-                
-                # Créer un nouveau classeur
-                wb = Workbook()
-                ws = wb.active
-                ws.title = "Devis Solaire"
-                
-                # Styles
-                header_font = Font(bold=True, color="FFFFFF", size=12)
-                header_fill = PatternFill(start_color="4CAF50", end_color="4CAF50", fill_type="solid")
-                title_font = Font(bold=True, size=14, color="2E7D32")
-                border = Border(left=Side(style='thin'), right=Side(style='thin'), 
-                              top=Side(style='thin'), bottom=Side(style='thin'))
-                center_alignment = Alignment(horizontal='center', vertical='center')
-                
-                # En-tête du document
-                ws.merge_cells('A1:E1')
-                ws['A1'] = "DEVIS ESTIMATIF - INSTALLATION SOLAIRE SÉNÉGAL"
-                ws['A1'].font = title_font
-                ws['A1'].alignment = center_alignment
-                
-                # Informations client
-                row = 3
-                ws[f'A{row}'] = "INFORMATIONS CLIENT"
-                ws[f'A{row}'].font = Font(bold=True, size=12)
-                row += 1
-                
-                nom_demandeur = st.session_state.get('nom_demandeur', 'Non renseigné')
-                region_selectionnee = st.session_state.get('region_selectionnee', 'Non spécifiée')
-                
-                ws[f'A{row}'] = f"Nom du demandeur: {nom_demandeur}"
-                row += 1
-                ws[f'A{row}'] = f"Région d'installation: {region_selectionnee}"
-                row += 2
-                
-                # Résumé du système
-                ws[f'A{row}'] = "RÉSUMÉ DU SYSTÈME"
-                ws[f'A{row}'].font = Font(bold=True, size=12)
-                row += 1
-                
-                ws[f'A{row}'] = f"Consommation totale: {st.session_state.consommation:.1f} kWh/jour"
-                row += 1
-                ws[f'A{row}'] = f"Puissance installée: {devis['puissance_totale']:.2f} kWc"
-                row += 1
-                ws[f'A{row}'] = f"Type de batterie: {st.session_state.choix['type_batterie']}"
-                row += 1
-                voltage_display = st.session_state.choix['voltage']
-                voltage_text = voltage_display if voltage_display == "High Voltage" else f"{voltage_display}V"
-                ws[f'A{row}'] = f"Voltage système: {voltage_text}"
-                row += 1
-                ws[f'A{row}'] = f"Type onduleur: {st.session_state.choix['type_onduleur']}"
-                row += 2
-                
-                # Tableau des équipements
-                ws[f'A{row}'] = "DÉTAILS DES ÉQUIPEMENTS"
-                ws[f'A{row}'].font = Font(bold=True, size=12)
-                row += 1
-                
-                # En-têtes du tableau
-                headers = ["Équipement", "Quantité", "Prix unitaire (FCFA)", "Sous-total (FCFA)"]
-                for col, header in enumerate(headers, 1):
-                    cell = ws.cell(row=row, column=col, value=header)
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.border = border
-                    cell.alignment = center_alignment
-                
-                row += 1
-                
-                # Données des équipements
-                for item in devis["details"]:
-                    ws.cell(row=row, column=1, value=item["item"]).border = border
-                    ws.cell(row=row, column=2, value=item["quantite"]).border = border
-                    ws.cell(row=row, column=3, value=f"{item['prix_unitaire']:,}").border = border
-                    ws.cell(row=row, column=4, value=f"{item['sous_total']:,}").border = border
-                    row += 1
-                
-                # Ligne de total
-                ws.cell(row=row, column=1, value="TOTAL").font = Font(bold=True)
-                ws.cell(row=row, column=1).border = border
-                ws.cell(row=row, column=2, value="").border = border
-                ws.cell(row=row, column=3, value="").border = border
-                total_cell = ws.cell(row=row, column=4, value=f"{devis['total']:,}")
-                total_cell.font = Font(bold=True)
-                total_cell.border = border
-                total_cell.fill = PatternFill(start_color="E8F5E8", end_color="E8F5E8", fill_type="solid")
-                
-                # Ajuster la largeur des colonnes
-                ws.column_dimensions['A'].width = 40
-                ws.column_dimensions['B'].width = 12
-                ws.column_dimensions['C'].width = 20
-                ws.column_dimensions['D'].width = 20
-                
-                # Notes importantes
-                row += 3
-                ws[f'A{row}'] = "NOTES IMPORTANTES"
-                ws[f'A{row}'].font = Font(bold=True, size=12)
-                row += 1
-                
-                notes = [
-                    "• Prix indicatifs",
-                    "• Installation standard incluse",
-                    "• Garantie selon fabricant (panneaux: 25 ans, batteries: variable)",
-                    "• Maintenance recommandée tous les 6 mois"
-                ]
-                
-                for note in notes:
-                    ws[f'A{row}'] = note
-                    row += 1
-                
-                # Contact
-                row += 2
-                ws[f'A{row}'] = "CONTACT - ENERGIE SOLAIRE SÉNÉGAL"
-                ws[f'A{row}'].font = Font(bold=True, size=12, color="4CAF50")
-                row += 1
-                ws[f'A{row}'] = "📍 Castor 221 Dakar, Sénégal (En face du terrain de Football)"
-                row += 1
-                ws[f'A{row}'] = "📧 energiesolairesenegal@gmail.com"
-                row += 1
-                ws[f'A{row}'] = "📞 +221 77 631 42 25 / +221 78 177 39 26"
-                row += 1
-                ws[f'A{row}'] = "🌐 energiesolairesenegal.com"
-                
-                # Sauvegarder dans un buffer
-                xlsx_buffer = io.BytesIO()
-                wb.save(xlsx_buffer)
-                xlsx_buffer.seek(0)
-                
-                st.download_button(
-                    "📊 Télécharger (Excel .xlsx)",
-                    xlsx_buffer.getvalue(),
-                    file_name=f"devis_solaire_{st.session_state.choix['voltage']}V.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    use_container_width=True
-                )
+            cols_dl = st.columns(len(QUOTE_FORMATS))
+            for col_dl, (fmt, (libelle, mime, ext)) in zip(cols_dl, QUOTE_FORMATS.items()):
+                with col_dl:
+                    cle_doc = (empreinte_devis, fmt)
+                    if cle_doc in documents_devis:
+                        st.download_button(
+                            libelle,
+                            documents_devis[cle_doc],
+                            file_name=f"devis_solaire_{st.session_state.choix['voltage']}V.{ext}",
+                            mime=mime,
+                            use_container_width=True,
+                            key=f"dl_devis_{fmt}"
+                        )
+                    elif st.button(f"Préparer {ext.upper()}", key=f"prep_devis_{fmt}", use_container_width=True):
+                        with st.spinner("Génération du document..."):
+                            try:
+                                # Un seul document par format est gardé en session (le devis courant)
+                                for cle in [c for c in documents_devis if c[1] == fmt]:
+                                    del documents_devis[cle]
+                                documents_devis[cle_doc] = render_quote(modele_devis, fmt, empreinte_devis)
+                            except Exception as e:
+                                st.error(f"Erreur génération {ext.upper()}: {e}")
+                        st.rerun()
             
             # Partage de devis avec coordonnées (formulaire détaillé)
             st.markdown("---")
@@ -4261,6 +4053,58 @@ if is_user_authenticated() and is_admin_user():
                         else:
                             st.error("❌ Erreur lors du vidage des prix")
             
+            # Prix relevés sur la boutique en ligne : écarts à valider
+            st.markdown("### 🌐 Prix de la boutique en ligne")
+            try:
+                dernier_releve = price_index.last_crawl()
+            except Exception:
+                dernier_releve = None
+            col_crawl, col_crawl_info = st.columns([1, 3])
+            with col_crawl:
+                if st.button("🔄 Indexer la boutique maintenant"):
+                    with st.spinner("Indexation du catalogue de la boutique..."):
+                        try:
+                            nb_produits, nb_associes = price_index.run_crawl(current_prices or PRIX_EQUIPEMENTS)
+                            st.success(f"✅ {nb_produits} produit(s) indexé(s), {nb_associes} associé(s) à un article")
+                        except Exception as e:
+                            st.error(f"❌ Indexation impossible : {e}")
+            with col_crawl_info:
+                st.caption(f"Dernière indexation : {dernier_releve[:16].replace('T', ' ')} (UTC)" if dernier_releve
+                           else "Catalogue de la boutique pas encore indexé.")
+            try:
+                # Nouveau rapprochement uniquement si les articles du catalogue ont changé
+                price_index.rematch(current_prices or PRIX_EQUIPEMENTS)
+                ecarts = price_index.price_changes(current_prices)
+            except Exception as e:
+                ecarts = []
+                st.error(f"Erreur lecture de l'index des prix : {e}")
+            if ecarts:
+                st.dataframe(pd.DataFrame([{
+                    "Catégorie": e["categorie"], "Article": e["article"], "Prix actuel": e["prix_actuel"],
+                    "Prix boutique": e["prix_boutique"], "Écart": e["ecart"], "Produit boutique": e["produit"]
+                } for e in ecarts]), use_container_width=True, hide_index=True)
+                libelles = {f"{e['categorie']} / {e['article']} : {e['prix_actuel']:,} → {e['prix_boutique']:,} FCFA".replace(",", " "): e
+                            for e in ecarts}
+                choix = st.multiselect("Écarts à traiter", list(libelles), default=list(libelles), key="ecarts_boutique")
+                selection = [libelles[c] for c in choix]
+                col_ok, col_non = st.columns(2)
+                with col_ok:
+                    if st.button("✅ Appliquer les prix boutique", disabled=not selection):
+                        if save_equipment_prices(price_index.apply_changes(current_prices, selection)):
+                            price_index.record_decision([e["url"] for e in selection], "approuve")
+                            st.success(f"✅ {len(selection)} prix mis à jour")
+                            clear_prices_cache()
+                            st.cache_data.clear()
+                            st.rerun()
+                        else:
+                            st.error("❌ Erreur lors de la mise à jour des prix")
+                with col_non:
+                    if st.button("🚫 Ignorer ces écarts", disabled=not selection):
+                        price_index.record_decision([e["url"] for e in selection], "rejete")
+                        st.rerun()
+            elif dernier_releve:
+                st.info("Aucun écart entre les prix de la boutique et ceux de l'application.")
+
             # Interface de modification des articles
             st.markdown("### 🔧 Modifier les articles existants")
             
@@ -5955,23 +5799,12 @@ if is_user_authenticated() and is_admin_user():
                 # Affichage des alertes dans la sidebar
                 show_stock_alerts_sidebar()
                 
+                # DataFrame produits partagé (un seul chargement pour toutes les sections)
+                df_products = get_products_frame()
+                
                 # Vue d'ensemble financière moderne
                 try:
-                    products = get_all_products_from_firebase()
-                    if products:
-                        products_list = []
-                        for product_id, product in products.items():
-                            products_list.append({
-                                'id': product_id,
-                                'nom': product.get('nom', ''),
-                                'categorie': product.get('categorie', ''),
-                                'prix_achat': product.get('prix_achat', 0),
-                                'prix_vente': product.get('prix_vente', 0),
-                                'quantite': product.get('stock_actuel', product.get('quantite', 0)),
-                                'stock_min': product.get('stock_minimum', product.get('stock_min', 0)),
-                                'unite': product.get('unite', 'pièce')
-                            })
-                        df_products = pd.DataFrame(products_list)
+                    if not df_products.empty:
                         create_financial_overview(df_products)
                     else:
                         st.info("Aucun produit trouvé pour l'aperçu financier")
@@ -5985,21 +5818,7 @@ if is_user_authenticated() and is_admin_user():
                 
                 # Graphiques avancés de stock
                 try:
-                    products = get_all_products_from_firebase()
-                    if products:
-                        products_list = []
-                        for product_id, product in products.items():
-                            products_list.append({
-                                'id': product_id,
-                                'nom': product.get('nom', ''),
-                                'categorie': product.get('categorie', ''),
-                                'prix_achat': product.get('prix_achat', 0),
-                                'prix_vente': product.get('prix_vente', 0),
-                                'quantite': product.get('stock_actuel', product.get('quantite', 0)),
-                                'stock_min': product.get('stock_minimum', product.get('stock_min', 0)),
-                                'unite': product.get('unite', 'pièce')
-                            })
-                        df_products = pd.DataFrame(products_list)
+                    if not df_products.empty:
                         create_advanced_stock_chart(df_products)
                     else:
                         st.info("Aucun produit trouvé pour les graphiques")
@@ -6010,50 +5829,50 @@ if is_user_authenticated() and is_admin_user():
                 
                 # Alertes stock avec cartes modernes
                 try:
-                    products = get_all_products_from_firebase()
-                    if products:
-                        low_stock_products = []
-                        for product_id, product in products.items():
-                            current_stock = product.get('stock_actuel', 0)
-                            min_stock = product.get('stock_minimum', 0)
-                            if current_stock <= min_stock:
-                                low_stock_products.append({
-                                    'product_name': product.get('nom', ''),
-                                    'current_stock': current_stock,
-                                    'min_stock': min_stock,
-                                    'category': product.get('categorie', ''),
-                                    'urgency': 'critical' if current_stock == 0 else 'warning'
-                                })
+                    if not df_products.empty:
+                        low_stock = df_products[df_products['stock_actuel'] <= df_products['stock_min']]
                         
-                        if low_stock_products:
+                        if not low_stock.empty:
                             st.subheader("⚠️ Alertes Stock Critiques")
-                            for alert in low_stock_products:
-                                create_stock_alert_card(alert)
+                            for nom, stock, stock_min, categorie in zip(low_stock['nom'], low_stock['stock_actuel'],
+                                                                        low_stock['stock_min'], low_stock['categorie']):
+                                create_stock_alert_card(nom, stock, stock_min, categorie)
                         else:
                             st.success("✅ Aucune alerte stock critique")
                     
                 except Exception as e:
                     st.error(f"❌ Erreur lors du chargement des données: {e}")
+                
+                # Réapprovisionnement prévisionnel (demande lissée + délai fournisseur)
+                try:
+                    to_reorder = get_products_to_reorder()
+                    if not to_reorder.empty:
+                        st.subheader("🔮 Réapprovisionnement Prévisionnel")
+                        st.caption("Produits au niveau ou sous leur point de commande calculé depuis l'historique des sorties.")
+                        st.dataframe(
+                            to_reorder[['nom', 'categorie', 'stock_actuel', 'demande_jour', 'jours_couverture',
+                                        'point_commande', 'quantite_suggeree']],
+                            use_container_width=True,
+                            hide_index=True,
+                            column_config={
+                                "nom": st.column_config.TextColumn("Produit"),
+                                "categorie": st.column_config.TextColumn("Catégorie"),
+                                "stock_actuel": st.column_config.NumberColumn("Stock actuel"),
+                                "demande_jour": st.column_config.NumberColumn("Demande / jour", format="%.2f"),
+                                "jours_couverture": st.column_config.NumberColumn("Jours de couverture", format="%.0f"),
+                                "point_commande": st.column_config.NumberColumn("Point de commande"),
+                                "quantite_suggeree": st.column_config.NumberColumn("Qté à commander")
+                            }
+                        )
+                except Exception as e:
+                    st.error(f"Erreur lors du calcul des prévisions: {e}")
             
             # Gestion des Produits
             with stock_tab2:
                 # Utiliser le tableau interactif moderne pour la gestion des produits
                 try:
-                    products = get_all_products_from_firebase()
-                    if products:
-                        products_list = []
-                        for product_id, product in products.items():
-                            products_list.append({
-                                'id': product_id,
-                                'nom': product.get('nom', ''),
-                                'categorie': product.get('categorie', ''),
-                                'prix_achat': product.get('prix_achat', 0),
-                                'prix_vente': product.get('prix_vente', 0),
-                                'quantite': product.get('stock_actuel', product.get('quantite', 0)),
-                                'stock_min': product.get('stock_minimum', product.get('stock_min', 0)),
-                                'unite': product.get('unite', 'pièce')
-                            })
-                        df_products = pd.DataFrame(products_list)
+                    df_products = get_products_frame()
+                    if not df_products.empty:
                         create_interactive_product_table(df_products)
                     else:
                         st.info("Aucun produit trouvé")
@@ -6220,141 +6039,141 @@ if is_user_authenticated() and is_admin_user():
                             else:
                                 st.error("❌ Veuillez remplir tous les champs obligatoires")
                 
-                # Interface d'importation Excel avec mappage de colonnes
-                with st.expander("📊 Importer des Produits depuis Excel", expanded=False):
-                    st.markdown("### 📥 Importation Excel avec Mappage de Colonnes")
+                # Import / export en masse (CSV, XLSX) avec mappage de colonnes
+                with st.expander("📊 Importer / Exporter des Produits, Clients et Mouvements", expanded=False):
+                    st.markdown("### 📥 Importation en masse avec Mappage de Colonnes")
+                    
+                    type_import = st.radio("Données à importer", ["Produits", "Clients", "Mouvements de stock"], horizontal=True, key="bulk_type")
+                    champs_import = {"Produits": bulk_io.PRODUCT_FIELDS, "Clients": bulk_io.CLIENT_FIELDS,
+                                     "Mouvements de stock": bulk_io.MOVEMENT_FIELDS}[type_import]
+                    libelles_champs = {
+                        'nom': "Nom", 'categorie': "Catégorie", 'prix_achat': "Prix d'achat",
+                        'prix_vente': "Prix de vente", 'stock_actuel': "Stock initial", 'stock_min': "Stock minimum",
+                        'unite': "Unité", 'description': "Description (optionnel)", 'telephone': "Téléphone",
+                        'adresse': "Adresse", 'email': "Email", 'produit': "Produit (nom)",
+                        'type': "Type (Entrée / Sortie / Ajustement)", 'quantite': "Quantité",
+                        'motif': "Motif (optionnel)", 'reference': "Référence (optionnel)"
+                    }
                     
                     uploaded_file = st.file_uploader(
-                        "Choisir un fichier Excel (.xlsx, .xls)", 
-                        type=['xlsx', 'xls'],
-                        help="Téléchargez votre fichier Excel contenant la liste des produits"
+                        "Choisir un fichier (.csv, .xlsx, .xls)", 
+                        type=['csv', 'xlsx', 'xls'],
+                        help="Liste de produits ou tarif fournisseur : les fichiers de plusieurs milliers de lignes sont lus par blocs"
                     )
                     
                     if uploaded_file is not None:
                         try:
-                            # Lire le fichier Excel
-                            df_excel = pd.read_excel(uploaded_file)
-                            
-                            st.success(f"✅ Fichier chargé avec succès! {len(df_excel)} lignes trouvées.")
+                            colonnes_fichier = bulk_io.read_header(uploaded_file)
                             
-                            # Aperçu des données
+                            # Aperçu des données (premier bloc seulement)
                             st.markdown("**📋 Aperçu des données:**")
-                            st.dataframe(df_excel.head(), use_container_width=True)
+                            st.dataframe(next(bulk_io.iter_chunks(uploaded_file, chunksize=5), pd.DataFrame()), use_container_width=True)
                             
-                            # Mappage des colonnes
+                            # Mappage des colonnes (pré-sélection si l'en-tête porte le nom du champ)
                             st.markdown("### 🔗 Mappage des Colonnes")
-                            st.info("Associez les colonnes de votre fichier Excel aux champs du système:")
-                            
-                            col1, col2 = st.columns(2)
+                            st.info("Associez les colonnes de votre fichier aux champs du système:")
                             
-                            with col1:
-                                nom_col = st.selectbox("Nom du produit", [""] + list(df_excel.columns), key="nom_mapping")
-                                categorie_col = st.selectbox("Catégorie", [""] + list(df_excel.columns), key="cat_mapping")
-                                prix_achat_col = st.selectbox("Prix d'achat", [""] + list(df_excel.columns), key="achat_mapping")
-                                prix_vente_col = st.selectbox("Prix de vente", [""] + list(df_excel.columns), key="vente_mapping")
+                            mapping = {}
+                            cols_mapping = st.columns(2)
+                            for i, champ in enumerate(champs_import):
+                                options = [""] + colonnes_fichier
+                                defaut = next((j + 1 for j, c in enumerate(colonnes_fichier) if str(c).strip().lower() == champ), 0)
+                                with cols_mapping[i % 2]:
+                                    mapping[champ] = st.selectbox(libelles_champs.get(champ, champ), options, index=defaut,
+                                                                  key=f"bulk_map_{type_import}_{champ}")
                             
-                            with col2:
-                                stock_col = st.selectbox("Stock initial", [""] + list(df_excel.columns), key="stock_mapping")
-                                stock_min_col = st.selectbox("Stock minimum", [""] + list(df_excel.columns), key="min_mapping")
-                                unite_col = st.selectbox("Unité", [""] + list(df_excel.columns), key="unite_mapping")
-                                description_col = st.selectbox("Description (optionnel)", [""] + list(df_excel.columns), key="desc_mapping")
-                            
-                            # Validation et importation
-                            if nom_col:
+                            if all(mapping.get(champ) for champ, (_, obligatoire, _) in champs_import.items() if obligatoire):
                                 st.markdown("### ✅ Validation et Importation")
-                                
-                                # Aperçu du mappage
-                                preview_data = []
-                                for i, row in df_excel.head(3).iterrows():
-                                    preview_data.append({
-                                        'Nom': row[nom_col] if nom_col else '',
-                                        'Catégorie': row[categorie_col] if categorie_col else 'Autres',
-                                        'Prix Achat': row[prix_achat_col] if prix_achat_col else 0,
-                                        'Prix Vente': row[prix_vente_col] if prix_vente_col else 0,
-                                        'Stock': row[stock_col] if stock_col else 0,
-                                        'Stock Min': row[stock_min_col] if stock_min_col else 0,
-                                        'Unité': row[unite_col] if unite_col else 'pièce',
-                                        'Description': row[description_col] if description_col else ''
-                                    })
-                                
-                                st.markdown("**📋 Aperçu du mappage (3 premières lignes):**")
-                                st.dataframe(pd.DataFrame(preview_data), use_container_width=True)
-                                
-                                col1, col2 = st.columns(2)
-                                with col1:
+                                if type_import == "Mouvements de stock":
+                                    st.caption("Chaque ligne est enregistrée dans le journal de stock (stock actuel mis à jour, date = date d'import).")
+                                    autoriser_negatif = st.checkbox("Autoriser un stock négatif", value=False)
+                                else:
                                     update_on_duplicate = st.checkbox("Mettre à jour si doublon (par nom)", value=True)
-                                    if st.button("📥 Importer tous les produits", type="primary"):
-                                        progress_bar = st.progress(0)
-                                        success_count = 0
-                                        error_count = 0
-                                        
-                                        # Charger les produits existants pour détecter les doublons par nom
-                                        existing_by_name = {}
+                                if type_import == "Produits":
+                                    st.caption("Pour un produit existant, le stock n'est pas modifié : utilisez les mouvements de stock.")
+                                
+                                if st.button(f"📥 Importer les {type_import.lower()}", type="primary"):
+                                    progress_bar = st.progress(0.0)
+                                    nb_lignes = max(getattr(uploaded_file, 'size', 0), 1)
+                                    
+                                    def _progression(derniere_ligne):
+                                        # Estimation par position dans le fichier (lecture en flux)
                                         try:
-                                            from firebase_config import get_all_products_from_firebase, update_product_in_firebase
-                                            existing_products = get_all_products_from_firebase()
-                                            if existing_products:
-                                                for pid, pdata in existing_products.items():
-                                                    name_key = str(pdata.get('nom', '')).strip().lower()
-                                                    if name_key:
-                                                        existing_by_name[name_key] = pid
-                                        except Exception as e:
-                                            st.warning(f"Impossible de charger les produits existants pour la mise à jour: {e}")
-                                        
-                                        for i, row in df_excel.iterrows():
-                                            try:
-                                                product_data = {
-                                                    'nom': str(row[nom_col]) if nom_col and pd.notna(row[nom_col]) else f"Produit_{i+1}",
-                                                    'categorie': str(row[categorie_col]) if categorie_col and pd.notna(row[categorie_col]) else 'Autres',
-                                                    'prix_achat': float(row[prix_achat_col]) if prix_achat_col and pd.notna(row[prix_achat_col]) else 0,
-                                                    'prix_vente': float(row[prix_vente_col]) if prix_vente_col and pd.notna(row[prix_vente_col]) else 0,
-                                                    'stock_actuel': int(row[stock_col]) if stock_col and pd.notna(row[stock_col]) else 0,
-                                                    'stock_minimum': int(row[stock_min_col]) if stock_min_col and pd.notna(row[stock_min_col]) else 0,
-                                                    'unite': str(row[unite_col]) if unite_col and pd.notna(row[unite_col]) else 'pièce',
-                                                    'description': str(row[description_col]) if description_col and pd.notna(row[description_col]) else '',
-                                                    'date_creation': pd.Timestamp.now().isoformat(),
-                                                    'source': 'import_excel'
-                                                }
-                                                
-                                                name_key = str(product_data.get('nom', '')).strip().lower()
-                                                
-                                                # Mettre à jour si doublon, sinon créer
-                                                if update_on_duplicate and name_key in existing_by_name:
-                                                    try:
-                                                        if update_product_in_firebase(existing_by_name[name_key], product_data):
-                                                            success_count += 1
-                                                        else:
-                                                            error_count += 1
-                                                    except Exception as e:
-                                                        error_count += 1
-                                                        st.error(f"Erreur mise à jour ligne {i+1}: {e}")
-                                                else:
-                                                    if save_product_to_firebase(product_data):
-                                                        success_count += 1
-                                                    else:
-                                                        error_count += 1
-                                                
-                                            except Exception as e:
-                                                error_count += 1
-                                                st.error(f"Erreur ligne {i+1}: {e}")
-                                            
-                                            progress_bar.progress((i + 1) / len(df_excel))
-                                        
-                                        if success_count > 0:
-                                            st.success(f"✅ {success_count} produits traités avec succès!")
-                                            clear_stock_cache()
-                                            if error_count > 0:
-                                                st.warning(f"⚠️ {error_count} erreurs lors de l'importation")
-                                            st.rerun()
+                                            progress_bar.progress(min(uploaded_file.tell() / nb_lignes, 1.0),
+                                                                  text=f"{derniere_ligne - 1} lignes traitées")
+                                        except Exception:
+                                            pass
+                                    
+                                    try:
+                                        if type_import == "Mouvements de stock":
+                                            nb_importes, rapport = bulk_io.import_movements(uploaded_file, mapping,
+                                                                                            allow_negative=autoriser_negatif,
+                                                                                            progress=_progression)
                                         else:
-                                            st.error("❌ Aucun produit n'a pu être importé")
-                                
-                                with col2:
-                                    if st.button("🔄 Réinitialiser le mappage"):
-                                        st.rerun()
+                                            importer = bulk_io.import_products_firestore if type_import == "Produits" else bulk_io.import_clients_firestore
+                                            nb_importes, rapport = importer(uploaded_file, mapping, update_existing=update_on_duplicate,
+                                                                            progress=_progression)
+                                        progress_bar.progress(1.0)
+                                        st.session_state['bulk_import_result'] = (type_import, nb_importes, rapport)
+                                    except Exception as e:
+                                        st.error(f"❌ Erreur lors de l'importation: {e}")
                             
+                            resultat = st.session_state.get('bulk_import_result')
+                            if resultat:
+                                type_res, nb_importes, rapport = resultat
+                                st.success(f"✅ {nb_importes} {type_res.lower()} importé(s) ou mis à jour")
+                                if not rapport.empty:
+                                    st.warning(f"⚠️ {len(rapport)} ligne(s) rejetée(s) ou ignorée(s)")
+                                    st.dataframe(rapport.head(200), use_container_width=True)
+                                    st.download_button("📄 Télécharger le rapport d'erreurs (CSV)",
+                                                       bulk_io.export_csv([rapport]),
+                                                       file_name="rapport_import.csv", mime="text/csv")
+                        
                         except Exception as e:
                             st.error(f"❌ Erreur lors de la lecture du fichier: {e}")
+                    
+                    # Export
+                    st.markdown("### 📤 Exportation")
+                    col_exp1, col_exp2 = st.columns(2)
+                    with col_exp1:
+                        type_export = st.selectbox("Données à exporter", ["Produits", "Clients", "Mouvements de stock"], key="bulk_export_type")
+                    with col_exp2:
+                        format_export = st.selectbox("Format", ["XLSX", "CSV"], key="bulk_export_format")
+                    if st.button("Préparer l'export", key="bulk_export_go"):
+                        try:
+                            if type_export == "Produits":
+                                frames = [get_products_frame()]
+                            elif type_export == "Clients":
+                                frames = [pd.DataFrame(get_all_clients_from_firebase() or [])]
+                            else:
+                                frames = bulk_io.iter_movement_pages()
+                            nom_fichier = type_export.lower().replace(' ', '_')
+                            # Export écrit page par page dans un fichier temporaire (remplace le précédent)
+                            precedent = st.session_state.pop('bulk_export', None)
+                            if precedent:
+                                try:
+                                    os.remove(precedent[0])
+                                except OSError:
+                                    pass
+                            extension = format_export.lower()
+                            fd, chemin_export = tempfile.mkstemp(prefix="export_", suffix=f".{extension}")
+                            os.close(fd)
+                            if format_export == "XLSX":
+                                bulk_io.export_xlsx(frames, sheet_name=type_export, path=chemin_export)
+                                mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                            else:
+                                bulk_io.export_csv(frames, path=chemin_export)
+                                mime = "text/csv"
+                            st.session_state['bulk_export'] = (chemin_export, f"{nom_fichier}.{extension}", mime)
+                        except Exception as e:
+                            st.error(f"❌ Erreur lors de l'export: {e}")
+                    if st.session_state.get('bulk_export'):
+                        chemin_export, nom_export, mime_export = st.session_state['bulk_export']
+                        try:
+                            with open(chemin_export, "rb") as fichier_export:
+                                st.download_button(f"⬇️ Télécharger {nom_export}", fichier_export, file_name=nom_export, mime=mime_export)
+                        except OSError:
+                            st.session_state.pop('bulk_export', None)
                 
                 # Synchronisation des produits de dimensionnement
                 with st.expander("🔄 Synchroniser les Produits de Dimensionnement", expanded=False):
@@ -6641,22 +6460,37 @@ if is_user_authenticated() and is_admin_user():
             
             # Mouvements de Stock
             with stock_tab5:
-                # Timeline moderne des mouvements
+                # Filtres poussés vers Firestore : une seule requête (mise en cache) alimente
+                # la timeline et l'historique récent
+                df_movements = None
                 try:
-                    movements = get_stock_movements_from_firebase()
-                    if movements:
-                        movements_list = []
-                        for movement_id, movement in movements.items():
-                            movements_list.append({
-                                'id': movement_id,
-                                'produit_nom': movement.get('produit_nom', ''),
-                                'type': movement.get('type', ''),
-                                'quantite': movement.get('quantite', 0),
-                                'date': movement.get('date', ''),
-                                'motif': movement.get('motif', ''),
-                                'stock_apres': movement.get('stock_apres', 0)
-                            })
-                        df_movements = pd.DataFrame(movements_list)
+                    mv_col1, mv_col2, mv_col3 = st.columns(3)
+                    with mv_col1:
+                        mv_period = st.date_input(
+                            "Période",
+                            value=(pd.Timestamp.now().date() - pd.Timedelta(days=90), pd.Timestamp.now().date()),
+                            key="mv_period"
+                        )
+                    with mv_col2:
+                        mv_products = get_all_products_from_firebase() or {}
+                        mv_product_options = {"Tous": None}
+                        mv_product_options.update({p.get('nom', pid): pid for pid, p in mv_products.items()})
+                        mv_product = st.selectbox("Produit", list(mv_product_options.keys()), key="mv_product")
+                    with mv_col3:
+                        mv_type = st.selectbox("Type", ["Tous", "Entrée", "Sortie"], key="mv_type")
+                    
+                    mv_start = mv_end = None
+                    if isinstance(mv_period, (tuple, list)) and len(mv_period) == 2:
+                        mv_start = pd.Timestamp(mv_period[0], tz="UTC").to_pydatetime()
+                        mv_end = (pd.Timestamp(mv_period[1], tz="UTC") + pd.Timedelta(days=1)).to_pydatetime()
+                    
+                    df_movements = query_stock_movements(
+                        start=mv_start,
+                        end=mv_end,
+                        product_id=mv_product_options.get(mv_product),
+                        type_mouvement=None if mv_type == "Tous" else mv_type
+                    )
+                    if not df_movements.empty:
                         create_movement_timeline(df_movements)
                     else:
                         st.info("Aucun mouvement trouvé")
@@ -6672,24 +6506,14 @@ if is_user_authenticated() and is_admin_user():
                     with col1:
                         st.markdown("**Historique Récent**")
                         try:
-                            movements = get_stock_movements_from_firebase()
-                            if movements:
-                                # Afficher les 5 derniers mouvements
-                                movements_list = []
-                                for movement_id, movement in movements.items():
-                                    movements_list.append({
-                                        'Produit': movement.get('produit_nom', ''),
-                                        'Type': movement.get('type', ''),
-                                        'Quantité': movement.get('quantite', 0),
-                                        'Date': movement.get('date', ''),
-                                        'Motif': movement.get('motif', ''),
-                                        'Stock Après': movement.get('stock_apres', 0)
-                                    })
-                                
-                                # Trier par date et prendre les 5 derniers
-                                df_movements = pd.DataFrame(movements_list)
-                                df_movements = df_movements.sort_values('Date', ascending=False).head(5)
-                                st.dataframe(df_movements, use_container_width=True, hide_index=True)
+                            if df_movements is not None and not df_movements.empty:
+                                # Les 5 derniers mouvements (déjà triés par date décroissante)
+                                df_recent = df_movements.head(5)[['produit_nom', 'type', 'quantite', 'date', 'motif', 'stock_apres']]
+                                df_recent = df_recent.rename(columns={
+                                    'produit_nom': 'Produit', 'type': 'Type', 'quantite': 'Quantité',
+                                    'date': 'Date', 'motif': 'Motif', 'stock_apres': 'Stock Après'
+                                })
+                                st.dataframe(df_recent, use_container_width=True, hide_index=True)
                             else:
                                 st.info("Aucun mouvement trouvé")
                         except Exception as e:
@@ -6722,32 +6546,14 @@ if is_user_authenticated() and is_admin_user():
                                             if type_mouvement == "Sortie" and quantite > stock_actuel:
                                                 st.error(f"❌ Stock insuffisant! Stock actuel: {stock_actuel}")
                                             else:
-                                                # Calculer le nouveau stock
-                                                if type_mouvement == "Entrée":
-                                                    nouveau_stock = stock_actuel + quantite
-                                                else:
-                                                    nouveau_stock = stock_actuel - quantite
-                                                
-                                                # Enregistrer le mouvement
-                                                movement_data = {
-                                                    'produit_id': selected_product_id,
-                                                    'produit_nom': product.get('nom', ''),
-                                                    'type': type_mouvement,
-                                                    'quantite': quantite,
-                                                    'stock_avant': stock_actuel,
-                                                    'stock_apres': nouveau_stock,
-                                                    'motif': motif,
-                                                    'date': pd.Timestamp.now().isoformat(),
-                                                    'utilisateur': st.session_state.get('user_email', '')
-                                                }
-                                                
-                                                success_movement = save_stock_movement_to_firebase(movement_data)
-                                                
-                                                # Mettre à jour le stock du produit
-                                                product_update = {**product, 'stock_actuel': nouveau_stock}
-                                                success_product = update_product_in_firebase(selected_product_id, product_update)
+                                                # Mouvement + mise à jour du stock dans une seule transaction (journal)
+                                                movement = record_stock_movement(
+                                                    selected_product_id, type_mouvement, quantite,
+                                                    motif=motif,
+                                                    utilisateur=st.session_state.get('user_email', '')
+                                                )
                                                 
-                                                if success_movement and success_product:
+                                                if movement:
                                                     st.success("✅ Mouvement enregistré avec succès!")
                                                     clear_stock_cache()
                                                     st.rerun()
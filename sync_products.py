@@ -6,7 +6,9 @@ import streamlit as st
 from firebase_config import (
     save_product_to_firebase, 
     get_all_products_from_firebase,
-    update_product_in_firebase
+    update_product_in_firebase,
+    record_stock_movement,
+    clear_stock_cache
 )
 
 def extract_products_from_dimensioning():
@@ -222,26 +224,14 @@ def update_stock_after_quote(products_used):
             if existing_item:
                 prod_id, stock_product = existing_item
                 if isinstance(stock_product, dict) and stock_product.get("stock_actuel", 0) >= quantity_used:
-                    # Décrémenter le stock
-                    new_stock = stock_product.get("stock_actuel", 0) - quantity_used
-                    stock_product["stock_actuel"] = new_stock
-                    
-                    # Mettre à jour dans Firebase
-                    update_product_in_firebase(prod_id, stock_product)
-                    
-                    # Enregistrer le mouvement de stock
-                    from firebase_config import save_stock_movement_to_firebase
-                    movement = {
-                        "produit_id": prod_id,
-                        "produit_nom": product_name,
-                        "type": "sortie",
-                        "quantite": quantity_used,
-                        "motif": "Utilisation dans devis",
-                        "date": st.session_state.get("current_date", ""),
-                        "utilisateur": st.session_state.get("user_email", "système")
-                    }
-                    save_stock_movement_to_firebase(movement)
+                    # Sortie journalisée : mouvement et stock_actuel mis à jour ensemble
+                    record_stock_movement(
+                        prod_id, "Sortie", quantity_used,
+                        motif="Utilisation dans devis",
+                        utilisateur=st.session_state.get("user_email", "système")
+                    )
         
+        clear_stock_cache()
         return True
         
     except Exception as e:
@@ -0,0 +1,22 @@
+"""
+Configuration pytest : modules de l'application importables depuis tests/ et base SQLite temporaire
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sqlite_store  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Base migrée dans un dossier temporaire, utilisée aussi comme base par défaut."""
+    path = str(tmp_path / "energie_solaire.db")
+    monkeypatch.setattr(sqlite_store, "DB_PATH", path)
+    sqlite_store.migrate(path)
+    yield path
+    sqlite_store.close_connection(path)
@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+from bulk_io import CLIENT_FIELDS, MOVEMENT_FIELDS, PRODUCT_FIELDS, validate_chunk
+
+PRODUCT_MAPPING = {'nom': 'Nom', 'prix_vente': 'Prix', 'stock_actuel': 'Stock'}
+
+
+def _chunk(rows, columns, start=2):
+    return pd.DataFrame(rows, columns=columns, index=range(start, start + len(rows)))
+
+
+def test_nombres_separateurs_et_valeurs_par_defaut():
+    chunk = _chunk([["Panneau 375W", "1 250,50", "12"], ["Batterie 100Ah", "", "3,5"]],
+                   ["Nom", "Prix", "Stock"])
+    valid, errors = validate_chunk(chunk, PRODUCT_MAPPING, PRODUCT_FIELDS)
+    assert errors.empty
+    assert valid['prix_vente'].tolist() == [1250.5, 0.0]
+    assert valid['stock_actuel'].tolist() == [12.0, 3.5]
+    assert valid['stock_actuel'].dtype == 'float64'
+    # Champs non associés : valeur par défaut
+    assert valid['categorie'].tolist() == ['Autres', 'Autres']
+    assert valid['unite'].tolist() == ['pièce', 'pièce']
+
+
+def test_lignes_invalides_ecartees_et_signalees():
+    chunk = _chunk([["", "100", "1"], ["Onduleur", "abc", "1"], ["Câble", "50", "-2"], ["Régulateur", "80", "4"]],
+                   ["Nom", "Prix", "Stock"])
+    valid, errors = validate_chunk(chunk, PRODUCT_MAPPING, PRODUCT_FIELDS)
+    assert valid['nom'].tolist() == ["Régulateur"]
+    assert valid.index.tolist() == [5]
+    assert errors[['ligne', 'champ', 'erreur']].values.tolist() == [
+        [2, 'nom', "valeur obligatoire manquante"],
+        [3, 'prix_vente', "nombre invalide"],
+        [4, 'stock_actuel', "valeur négative"],
+    ]
+
+
+def test_email_invalide():
+    chunk = _chunk([["Awa", "awa@example.sn"], ["Moussa", "moussa@"], ["Fatou", ""]], ["Client", "Email"])
+    valid, errors = validate_chunk(chunk, {'nom': 'Client', 'email': 'Email'}, CLIENT_FIELDS)
+    assert valid['nom'].tolist() == ["Awa", "Fatou"]
+    assert valid['email'].tolist() == ["awa@example.sn", ""]
+    assert errors['erreur'].tolist() == ["email invalide"]
+
+
+def test_quantite_relative_accepte_les_negatifs():
+    chunk = _chunk([["Panneau", "Ajustement", "-3"], ["Panneau", "Entrée", "x"]], ["Produit", "Type", "Qte"])
+    valid, errors = validate_chunk(chunk, {'produit': 'Produit', 'type': 'Type', 'quantite': 'Qte'}, MOVEMENT_FIELDS)
+    assert valid['quantite'].tolist() == [-3.0]
+    assert errors['erreur'].tolist() == ["nombre invalide"]
+
+
+def test_colonne_obligatoire_non_associee():
+    chunk = _chunk([["100"]], ["Prix"])
+    with pytest.raises(ValueError, match="nom"):
+        validate_chunk(chunk, {'prix_vente': 'Prix'}, PRODUCT_FIELDS)
@@ -0,0 +1,150 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import http_client
+from http_client import BudgetExceededError, CircuitBreaker, CircuitOpenError
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """/ok -> 200, /erreur -> 503, /lent -> 200 après 1 s."""
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        if self.path == "/lent":
+            time.sleep(1)
+        status = 503 if self.path == "/erreur" else 200
+        body = b"ok" if status == 200 else b"indisponible"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    srv.hits = []
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def clock(server, monkeypatch):
+    """Service « boutique » dirigé vers le serveur local, disjoncteur neuf à horloge contrôlée, sans budget."""
+    clock = _Clock()
+    monkeypatch.setitem(http_client.ENDPOINTS["boutique"], "base_url", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setitem(http_client._breakers, "boutique", CircuitBreaker("boutique", clock=clock))
+    token = http_client._budget.set(None)
+    yield clock
+    http_client._budget.reset(token)
+
+
+def _state():
+    return http_client.get_status()["boutique"]
+
+
+def test_reponses_5xx_comptees_jusqua_ouverture(server, clock):
+    for _ in range(http_client.FAILURE_THRESHOLD - 1):
+        with pytest.raises(requests.HTTPError):
+            http_client.get("boutique", "/erreur")
+        assert _state() == "ferme"
+    with pytest.raises(requests.HTTPError):
+        http_client.get("boutique", "/erreur")
+    assert _state() == "ouvert"
+    # Disjoncteur ouvert : échec immédiat, sans requête
+    with pytest.raises(CircuitOpenError):
+        http_client.get("boutique", "/ok")
+    assert server.hits == ["/erreur"] * http_client.FAILURE_THRESHOLD
+
+
+def test_succes_remet_le_compteur_a_zero(server, clock):
+    for path in ("/erreur", "/erreur", "/ok", "/erreur", "/erreur"):
+        try:
+            http_client.get("boutique", path)
+        except requests.HTTPError:
+            pass
+    assert _state() == "ferme"
+
+
+def _ouvrir(clock):
+    for _ in range(http_client.FAILURE_THRESHOLD):
+        with pytest.raises(requests.HTTPError):
+            http_client.get("boutique", "/erreur")
+    clock.now += http_client.RESET_TIMEOUT
+    assert _state() == "semi-ouvert"
+
+
+def test_semi_ouvert_essai_reussi_referme(server, clock):
+    _ouvrir(clock)
+    assert http_client.get("boutique", "/ok").status_code == 200
+    assert _state() == "ferme"
+
+
+def test_semi_ouvert_essai_echoue_rouvre(server, clock):
+    _ouvrir(clock)
+    with pytest.raises(requests.HTTPError):
+        http_client.get("boutique", "/erreur")
+    assert _state() == "ouvert"
+    with pytest.raises(CircuitOpenError):
+        http_client.get("boutique", "/ok")
+
+
+def test_semi_ouvert_une_seule_requete_dessai():
+    clock = _Clock()
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock.now += 10
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_budget_epuise_sans_appel_ni_echec(server, clock):
+    http_client.start_budget(http_client.MIN_REMAINING / 2)
+    with pytest.raises(BudgetExceededError):
+        http_client.get("boutique", "/ok")
+    assert server.hits == []
+    assert _state() == "ferme"
+
+
+def test_budget_epuise_libere_la_requete_dessai(server, clock):
+    _ouvrir(clock)
+    http_client.start_budget(0)
+    with pytest.raises(BudgetExceededError):
+        http_client.get("boutique", "/ok")
+    http_client._budget.set(None)
+    # L'essai n'a pas été consommé par l'appel non tenté
+    assert http_client.get("boutique", "/ok").status_code == 200
+    assert _state() == "ferme"
+
+
+def test_budget_borne_le_delai_de_lecture(server, clock):
+    http_client.start_budget(http_client.MIN_REMAINING + 0.2)
+    debut = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        http_client.get("boutique", "/lent")
+    assert time.monotonic() - debut < 1
+    # Délai dépassé : échec du service
+    assert http_client._breakers["boutique"]._failures == 1
+    with pytest.raises(BudgetExceededError):
+        http_client.get("boutique", "/ok")
@@ -0,0 +1,35 @@
+import numpy as np
+
+from irradiance_series import HOURS_PER_YEAR, typical_year
+
+
+def _hourly_times(year):
+    days = np.arange(np.datetime64(f"{year}-01-01"), np.datetime64(f"{year + 1}-01-01"))
+    return [f"{str(d).replace('-', '')}:{h:02d}10" for d in days for h in range(24)]
+
+
+def test_moyenne_par_heure_calendaire():
+    times = _hourly_times(2019) + _hourly_times(2020)
+    values = np.concatenate([np.full(8760, 100, dtype=np.float32), np.full(8784, 300, dtype=np.float32)])
+    result = typical_year(times, {"g_poa": values})
+    assert result["g_poa"].shape == (HOURS_PER_YEAR,)
+    assert result["g_poa"].dtype == np.float32
+    np.testing.assert_allclose(result["g_poa"], 200.0)
+
+
+def test_29_fevrier_ignore():
+    times = _hourly_times(2020)
+    values = np.zeros(len(times), dtype=np.float32)
+    feb29 = [i for i, t in enumerate(times) if t.startswith("20200229")]
+    values[feb29] = 1000.0
+    result = typical_year(times, {"g_poa": values})
+    assert np.nanmax(result["g_poa"]) == 0.0
+
+
+def test_heure_ordonnee_et_heures_absentes():
+    times = ["20190101:0010", "20190101:1210", "20201231:2310"]
+    result = typical_year(times, {"t2m": np.array([20.0, 30.0, 25.0], dtype=np.float32)})
+    t2m = result["t2m"]
+    assert t2m[0] == 20.0 and t2m[12] == 30.0 and t2m[HOURS_PER_YEAR - 1] == 25.0
+    assert np.isnan(t2m[1])
+    assert np.count_nonzero(~np.isnan(t2m)) == 3
@@ -0,0 +1,27 @@
+from price_index import MATCH_THRESHOLD, match_score
+
+
+def test_meme_article_avec_bonus_de_categorie():
+    score = match_score("Panneau solaire monocristallin 375 W", "Panneau 375W", "panneaux")
+    assert score == 1.5
+
+
+def test_unites_et_virgule_decimale_normalisees():
+    assert match_score("Batterie Lithium 12,8V 100 Ah", "Batterie lithium 12.8V 100Ah", "batteries") >= MATCH_THRESHOLD
+
+
+def test_calibre_different_rejete():
+    assert match_score("Panneau solaire 450W", "Panneau 375W", "panneaux") == 0.0
+
+
+def test_autre_gamme_rejetee():
+    # Même calibre, mais aucun mot de l'article (Lithium) dans le nom du produit
+    assert match_score("Batterie Plomb 12V 100Ah", "Lithium 12V 100Ah", "batteries") == 0.0
+
+
+def test_autre_categorie_rejetee():
+    assert match_score("Onduleur hybride 3000W 24V", "Panneau 3000W 24V", "panneaux") == 0.0
+
+
+def test_article_sans_caracteristique_chiffree():
+    assert match_score("Câble solaire rouge", "Câble solaire", "autres") == 0.0
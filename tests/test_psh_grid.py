@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+import pytest
+
+import psh_grid
+
+
+@pytest.fixture
+def grid_path(tmp_path):
+    path = str(tmp_path / "psh.npy")
+    grid = np.full((len(psh_grid.presets()), 2, 3, 12), 5.0, dtype=np.float16)
+    grid[0, :, 1, :] = 6.0
+    grid[0, 1, 2, :] = np.nan
+    np.save(path, grid)
+    with open(str(tmp_path / "psh.json"), "w", encoding="utf-8") as f:
+        json.dump({"lat_min": 14.0, "lon_min": -17.0, "step": 0.1}, f)
+    yield path
+    psh_grid.load_grid.cache_clear()
+
+
+def test_interpolation_bilineaire(grid_path):
+    result = psh_grid.monthly_psh(14.05, -16.95, path=grid_path)
+    assert result["psh_by_month"][1] == 5.5
+    assert result["meta"]["optimalangles"]
+
+
+def test_noeud_manquant_renormalise(grid_path):
+    # Nœud (14.1, -16.8) absent : moyenne des voisins (14.0, -16.9) = 6, (14.0, -16.8) = 5, (14.1, -16.9) = 6
+    assert psh_grid.monthly_psh(14.05, -16.85, path=grid_path)["psh_by_month"][6] == pytest.approx(5.667, abs=1e-3)
+
+
+def test_hors_emprise(grid_path):
+    assert psh_grid.monthly_psh(13.0, -16.9, path=grid_path) is None
+
+
+def test_couverture(grid_path, tmp_path):
+    etat = psh_grid.coverage(grid_path)
+    assert etat["noeuds"] == len(psh_grid.presets()) * 6
+    assert etat["manquants"] == 1
+    assert etat["par_preset"][0] == 1 and sum(etat["par_preset"][1:]) == 0
+    assert psh_grid.coverage(str(tmp_path / "absente.npy")) is None
@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+import sqlite_store
+from sqlite_store import MIGRATIONS, get_connection, get_schema_version, migrate, rebuild_reporting, transaction
+
+RESUMES = ("resume_ventes_mois", "resume_ventes_client", "resume_ventes_produit", "resume_mouvements_mois")
+
+
+def _objets(conn, type_):
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type=?", (type_,))}
+
+
+def _resumes(conn):
+    return {t: sorted(conn.execute(f"SELECT * FROM {t}").fetchall()) for t in RESUMES}
+
+
+def test_migrations_appliquees_une_fois(db_path):
+    assert get_schema_version(db_path) == MIGRATIONS[-1][0]
+    versions = [r[0] for r in get_connection(db_path).execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == [v for v, _, _ in MIGRATIONS]
+    sqlite_store._migrated_paths.discard(db_path)
+    assert migrate(db_path) == MIGRATIONS[-1][0]
+    assert get_connection(db_path).execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(MIGRATIONS)
+
+
+def test_schema_cree(db_path):
+    conn = get_connection(db_path)
+    assert {"produits", "clients", "factures", "lignes_facture", "mouvements_stock", "replica_produits",
+            "replica_mouvements", "documents_replica", "outbox", "pvgis_cache", "prix_boutique"} <= _objets(conn, "table")
+    assert {"v_ca_mensuel", "v_top_produits", "v_marge_categorie", "v_rotation_stock"} <= _objets(conn, "view")
+    colonnes = {r[1] for r in conn.execute("PRAGMA table_info(replica_produits)")}
+    assert {"firebase_id", "updated_at", "version", "donnees"} <= colonnes
+
+
+def test_nom_produit_unique_sans_casse(db_path):
+    with transaction(db_path) as conn:
+        conn.execute("INSERT INTO produits (nom) VALUES ('Panneau 375W')")
+    with pytest.raises(sqlite3.IntegrityError):
+        with transaction(db_path) as conn:
+            conn.execute("INSERT INTO produits (nom) VALUES ('panneau 375w')")
+    plan = " ".join(r[3] for r in get_connection(db_path).execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM produits WHERE nom = ? COLLATE NOCASE", ("PANNEAU 375W",)))
+    assert "idx_produits_nom" in plan
+
+
+def test_doublons_de_casse_renommes_par_la_migration(tmp_path):
+    path = str(tmp_path / "ancienne.db")
+    version_nocase = MIGRATIONS[-1][0]
+    conn = get_connection(path)
+    get_schema_version(path)
+    for version, description, apply in MIGRATIONS:
+        if version < version_nocase:
+            with transaction(path) as c:
+                apply(c)
+                c.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)", (version, description))
+    with transaction(path) as c:
+        c.executemany("INSERT INTO produits (nom) VALUES (?)", [("Batterie 100Ah",), ("batterie 100ah",)])
+    try:
+        assert migrate(path) == version_nocase
+        noms = [r[0] for r in conn.execute("SELECT nom FROM produits ORDER BY id")]
+        assert noms == ["Batterie 100Ah", "batterie 100ah (#2)"]
+    finally:
+        sqlite_store.close_connection(path)
+
+
+def test_syntheses_conformes_au_recalcul(db_path):
+    with transaction(db_path) as conn:
+        conn.execute("INSERT INTO produits (nom, categorie, prix_achat) VALUES ('Panneau 375W', 'Panneaux', 60000)")
+        for numero, date, type_, montant in (("F1", "2024-01-10", "Facture", 150000), ("F2", "2024-02-03", "Facture", 75000),
+                                             ("D1", "2024-02-05", "Devis", 90000)):
+            fid = conn.execute("INSERT INTO factures (numero, date, client_nom, montant_total, type) "
+                               "VALUES (?, ?, 'Awa', ?, ?)", (numero, date, montant, type_)).lastrowid
+            conn.execute("INSERT INTO lignes_facture (facture_id, produit_nom, quantite, prix_unitaire, montant) "
+                         "VALUES (?, 'panneau 375w', ?, 75000, ?)", (fid, montant // 75000, montant))
+        conn.execute("INSERT INTO mouvements_stock (date, produit_id, produit_nom, type, quantite) "
+                     "VALUES ('2024-01-02', 1, 'Panneau 375W', 'Entrée', 10)")
+        conn.execute("UPDATE factures SET montant_total = 160000 WHERE numero = 'F1'")
+    conn = get_connection(db_path)
+    incremental = _resumes(conn)
+    assert conn.execute("SELECT chiffre_affaires FROM v_ca_mensuel ORDER BY mois").fetchall() == [(160000,), (75000,)]
+    # Coût figé à la vente, produit rapproché sans distinction de casse
+    assert conn.execute("SELECT cout FROM resume_ventes_produit WHERE mois = '2024-01'").fetchone() == (120000,)
+    assert conn.execute("SELECT categorie FROM v_marge_categorie").fetchall() == [("Panneaux",)]
+    with transaction(db_path) as c:
+        rebuild_reporting(c)
+    # Tables tenues par les déclencheurs identiques au recalcul complet
+    assert _resumes(conn) == incremental
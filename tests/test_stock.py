@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("plotly")
+
+import Stock  # noqa: E402
+from sqlite_store import get_connection, transaction  # noqa: E402
+
+
+@pytest.fixture
+def produits(db_path):
+    with transaction() as conn:
+        conn.executemany("INSERT INTO produits (nom, categorie, prix_achat, prix_vente, stock_actuel, stock_min, unite) "
+                         "VALUES (?, ?, ?, ?, ?, 0, 'pièce')",
+                         [("Panneau 375W", "Panneaux", 60000, 75000, 20), ("Batterie 100Ah", "Batteries", 90000, 120000, 5)])
+    return db_path
+
+
+def _ligne(produit, quantite, prix):
+    return {'produit': produit, 'quantite': quantite, 'prix_unitaire': prix, 'montant': quantite * prix}
+
+
+def _stocks():
+    return dict(get_connection().execute("SELECT nom, stock_actuel FROM produits"))
+
+
+def test_facture_decremente_le_stock_et_journalise(produits):
+    lignes = [_ligne("Panneau 375W", 4, 75000), _ligne("panneau 375w", 2, 75000), _ligne("Batterie 100Ah", 1, 120000)]
+    numero = Stock.creer_facture(1, "Awa", lignes)
+    conn = get_connection()
+    assert numero.startswith("F")
+    assert conn.execute("SELECT montant_total, statut FROM factures WHERE numero=?", (numero,)).fetchone() == (570000, "Payée")
+    # Quantités cumulées par produit, nom rapproché sans distinction de casse
+    assert _stocks() == {"Panneau 375W": 14, "Batterie 100Ah": 4}
+    mouvements = conn.execute("SELECT produit_nom, type, quantite, reference FROM mouvements_stock ORDER BY id").fetchall()
+    assert mouvements == [("Panneau 375W", "Sortie", 4, numero), ("Panneau 375W", "Sortie", 2, numero),
+                          ("Batterie 100Ah", "Sortie", 1, numero)]
+
+
+def test_devis_sans_mouvement_de_stock(produits):
+    numero = Stock.creer_facture(1, "Awa", [_ligne("Panneau 375W", 3, 75000)], type_doc="Devis")
+    assert numero.startswith("D")
+    assert _stocks() == {"Panneau 375W": 20, "Batterie 100Ah": 5}
+    assert get_connection().execute("SELECT COUNT(*) FROM mouvements_stock").fetchone()[0] == 0
+    assert get_connection().execute("SELECT statut FROM factures").fetchone() == ("En attente",)
+
+
+def test_ligne_hors_catalogue(produits):
+    Stock.creer_facture(1, "Awa", [_ligne("Pose et câblage", 1, 50000), _ligne("Batterie 100Ah", 2, 120000)])
+    assert _stocks() == {"Panneau 375W": 20, "Batterie 100Ah": 3}
+    assert get_connection().execute("SELECT COUNT(*) FROM lignes_facture").fetchone()[0] == 2
+    assert get_connection().execute("SELECT COUNT(*) FROM mouvements_stock").fetchone()[0] == 1
+
+
+def test_echec_annule_toute_la_facture(produits):
+    with pytest.raises(KeyError):
+        Stock.creer_facture(1, "Awa", [_ligne("Panneau 375W", 1, 75000), {'produit': "Batterie 100Ah", 'quantite': 1}])
+    assert get_connection().execute("SELECT COUNT(*) FROM factures").fetchone()[0] == 0
+    assert _stocks() == {"Panneau 375W": 20, "Batterie 100Ah": 5}
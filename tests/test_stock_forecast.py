@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("firebase_admin")
+
+from stock_forecast import FORECAST_DEFAUTS, compute_reorder_points  # noqa: E402
+
+PARAMS = dict(FORECAST_DEFAUTS, alpha=1.0, delai_jours=10, delai_ecart_type_jours=0, periode_revue_jours=20)
+
+
+def _demand(columns):
+    index = pd.date_range("2024-01-01", periods=30, freq="D")
+    return pd.DataFrame(columns, index=index, dtype="float64")
+
+
+def test_demande_constante():
+    demand = _demand({"p1": np.full(30, 2.0)})
+    stock = pd.Series({"p1": 15.0})
+    result = compute_reorder_points(demand, stock, PARAMS).loc["p1"]
+    # Sans variabilité : point de commande = demande sur le délai, cible = demande sur délai + revue
+    assert result["demande_jour"] == 2.0
+    assert result["stock_securite"] == 0
+    assert result["point_commande"] == 20
+    assert result["a_commander"]
+    assert result["quantite_suggeree"] == 60 - 15
+    assert result["jours_couverture"] == 7.5
+
+
+def test_stock_suffisant():
+    demand = _demand({"p1": np.full(30, 2.0)})
+    result = compute_reorder_points(demand, pd.Series({"p1": 100.0}), PARAMS).loc["p1"]
+    assert not result["a_commander"]
+    assert result["quantite_suggeree"] == 0
+
+
+def test_variabilite_augmente_le_stock_de_securite():
+    demand = _demand({"regulier": np.full(30, 2.0), "irregulier": np.tile([0.0, 4.0], 15)})
+    stock = pd.Series({"regulier": 0.0, "irregulier": 0.0})
+    result = compute_reorder_points(demand, stock, dict(PARAMS, alpha=0.1))
+    assert result.loc["irregulier", "stock_securite"] > result.loc["regulier", "stock_securite"]
+
+
+def test_produit_sans_demande():
+    demand = _demand({"p1": np.full(30, 1.0)})
+    stock = pd.Series({"p1": 5.0, "p2": 0.0})
+    result = compute_reorder_points(demand, stock, PARAMS).loc["p2"]
+    assert result["demande_jour"] == 0
+    assert not result["a_commander"]
+    assert np.isnan(result["jours_couverture"])